@@ -0,0 +1,371 @@
+import os
+import json
+import bisect
+import sqlite3
+import threading
+
+class ArmazenamentoTarefas:
+    """Interface dos armazenamentos de tarefas usados pelo backend.
+
+    Cada alteração grava apenas a tarefa alterada, nunca o histórico inteiro.
+    As implementações devem ser seguras para uso por várias threads.
+    """
+
+    def carregar(self):
+        """Retorna todas as tarefas salvas, em um dicionário indexado pelo ID."""
+        raise NotImplementedError
+
+    def salvar(self, tarefa):
+        """Insere ou substitui uma tarefa."""
+        raise NotImplementedError
+
+    def remover(self, tarefa_id):
+        """Remove uma tarefa, se existir."""
+        raise NotImplementedError
+
+    def obter(self, tarefa_id):
+        """Retorna a tarefa salva com o ID, ou None."""
+        raise NotImplementedError
+
+    def listar_remessa(self, remessa_id):
+        """Retorna os IDs das tarefas de uma remessa, na ordem de criação."""
+        raise NotImplementedError
+
+    def listar(self, status=None, desde=None, ate=None):
+        """Retorna os IDs das tarefas com o status e a data de criação informados.
+
+        `desde` e `ate` são datas ISO 8601 comparadas com `data_criacao`. O
+        resultado vem ordenado da tarefa mais antiga para a mais recente.
+        """
+        raise NotImplementedError
+
+    def paginar(self, status=None, modelo=None, desde=None, ate=None, antes_de=None, limite=50):
+        """Retorna até `limite` IDs de tarefas filtradas, da mais recente para a mais antiga.
+
+        `antes_de` é o par (data_criacao, id) da última tarefa da página
+        anterior; só tarefas anteriores a ele são retornadas.
+        """
+        raise NotImplementedError
+
+    def versoes(self, ids):
+        """Retorna {id: (versao, atualizado_em)} das tarefas informadas que existem.
+
+        Lê só esses dois campos, para validar caches sem carregar as tarefas.
+        Tarefas nunca atualizadas trazem a data de criação em `atualizado_em`.
+        """
+        raise NotImplementedError
+
+    def compactar(self):
+        """Reorganiza o armazenamento para liberar espaço. Opcional."""
+
+    def fechar(self):
+        """Libera os recursos do armazenamento."""
+
+class ArmazenamentoSQLite(ArmazenamentoTarefas):
+    """Armazena as tarefas em um banco SQLite, uma linha por tarefa.
+
+    Cada gravação é uma transação própria, então uma queda no meio de uma
+    atualização nunca deixa o banco corrompido. O status e a data de criação
+    ficam em colunas indexadas para consultas sem varrer todas as tarefas.
+    Vários processos podem usar o mesmo banco: uma gravação espera até
+    `espera` segundos pela de outro processo.
+    """
+
+    def __init__(self, caminho, espera=30):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, timeout=espera, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS tarefas ("
+            "id TEXT PRIMARY KEY, status TEXT, data_criacao TEXT, modelo TEXT, dados TEXT NOT NULL)"
+        )
+        # Bancos criados antes da coluna modelo
+        colunas = [linha[1] for linha in self._conexao.execute("PRAGMA table_info(tarefas)")]
+        if "modelo" not in colunas:
+            self._conexao.execute("ALTER TABLE tarefas ADD COLUMN modelo TEXT")
+            self._conexao.execute("UPDATE tarefas SET modelo = json_extract(dados, '$.modelo')")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_status ON tarefas (status, data_criacao)")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_modelo ON tarefas (modelo, data_criacao)")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_data ON tarefas (data_criacao)")
+        self._conexao.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tarefas_remessa ON tarefas (json_extract(dados, '$.remessa_id'), data_criacao)"
+        )
+
+    def carregar(self):
+        with self._lock:
+            linhas = self._conexao.execute("SELECT id, dados FROM tarefas ORDER BY data_criacao").fetchall()
+        return {tarefa_id: json.loads(dados) for tarefa_id, dados in linhas}
+
+    def salvar(self, tarefa):
+        dados = json.dumps(tarefa, ensure_ascii=False)
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO tarefas (id, status, data_criacao, modelo, dados) VALUES (?, ?, ?, ?, ?)",
+                (tarefa["id"], tarefa.get("status"), tarefa.get("data_criacao"), tarefa.get("modelo"), dados)
+            )
+
+    def remover(self, tarefa_id):
+        with self._lock:
+            self._conexao.execute("DELETE FROM tarefas WHERE id = ?", (tarefa_id,))
+
+    def obter(self, tarefa_id):
+        with self._lock:
+            linha = self._conexao.execute("SELECT dados FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()
+        return json.loads(linha[0]) if linha is not None else None
+
+    def listar_remessa(self, remessa_id):
+        with self._lock:
+            return [linha[0] for linha in self._conexao.execute(
+                "SELECT id FROM tarefas WHERE json_extract(dados, '$.remessa_id') = ? ORDER BY data_criacao",
+                (remessa_id,)
+            )]
+
+    def versoes(self, ids):
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT id, json_extract(dados, '$.versao'), coalesce(json_extract(dados, '$.atualizado_em'), data_criacao) "
+                f"FROM tarefas WHERE id IN ({', '.join('?' * len(ids))})",
+                ids
+            ).fetchall()
+        return {tarefa_id: (versao or 0, atualizado_em) for tarefa_id, versao, atualizado_em in linhas}
+
+    def listar(self, status=None, desde=None, ate=None):
+        condicoes = []
+        parametros = []
+        if status is not None:
+            condicoes.append("status = ?")
+            parametros.append(status)
+        if desde is not None:
+            condicoes.append("data_criacao >= ?")
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append("data_criacao <= ?")
+            parametros.append(ate)
+        consulta = "SELECT id FROM tarefas"
+        if condicoes:
+            consulta += " WHERE " + " AND ".join(condicoes)
+        consulta += " ORDER BY data_criacao"
+        with self._lock:
+            return [linha[0] for linha in self._conexao.execute(consulta, parametros)]
+
+    def paginar(self, status=None, modelo=None, desde=None, ate=None, antes_de=None, limite=50):
+        condicoes = []
+        parametros = []
+        for coluna, valor in (("status", status), ("modelo", modelo)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        if desde is not None:
+            condicoes.append("data_criacao >= ?")
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append("data_criacao <= ?")
+            parametros.append(ate)
+        if antes_de is not None:
+            condicoes.append("(data_criacao, id) < (?, ?)")
+            parametros.extend(antes_de)
+        consulta = "SELECT id FROM tarefas"
+        if condicoes:
+            consulta += " WHERE " + " AND ".join(condicoes)
+        consulta += " ORDER BY data_criacao DESC, id DESC LIMIT ?"
+        parametros.append(limite)
+        with self._lock:
+            return [linha[0] for linha in self._conexao.execute(consulta, parametros)]
+
+    def compactar(self):
+        with self._lock:
+            self._conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conexao.execute("VACUUM")
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+class ArmazenamentoJournal(ArmazenamentoTarefas):
+    """Armazena as tarefas em um journal JSON Lines só de acréscimo.
+
+    Cada gravação acrescenta uma linha com a tarefa completa; ao carregar, a
+    última linha de cada ID prevalece. Uma linha incompleta, deixada por uma
+    queda no meio da escrita, é ignorada. Quando o journal passa a ter muito
+    mais linhas do que tarefas, ele é reescrito com uma linha por tarefa em um
+    arquivo temporário que substitui o original atomicamente. O journal fica
+    na memória de um único processo e não pode ser compartilhado.
+    """
+
+    def __init__(self, caminho, fator_compactacao=4, minimo_compactacao=1000):
+        self.caminho = caminho
+        self.fator_compactacao = fator_compactacao
+        self.minimo_compactacao = minimo_compactacao
+        self._lock = threading.Lock()
+        self._tarefas = {}
+        # Índices em memória: status -> IDs, modelo -> IDs, remessa -> IDs, e (data_criacao, id) ordenados
+        self._por_status = {}
+        self._por_modelo = {}
+        self._por_remessa = {}
+        self._por_data = []
+        self._linhas = 0
+        self._ler_journal()
+        self._arquivo = open(caminho, 'a', encoding='utf-8')
+
+    def _ler_journal(self):
+        if not os.path.exists(self.caminho):
+            return
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue
+                self._linhas += 1
+                if registro.get("removida"):
+                    self._desindexar(registro["id"])
+                else:
+                    self._indexar(registro["tarefa"])
+
+    # Campos da tarefa com índice em memória: campo -> atributo com valor -> IDs
+    _CAMPOS_INDEXADOS = (("status", "_por_status"), ("modelo", "_por_modelo"), ("remessa_id", "_por_remessa"))
+
+    def _indexar(self, tarefa):
+        tarefa_id = tarefa["id"]
+        anterior = self._tarefas.get(tarefa_id)
+        self._tarefas[tarefa_id] = tarefa
+        for campo, atributo in self._CAMPOS_INDEXADOS:
+            indice = getattr(self, atributo)
+            if anterior is not None:
+                if anterior.get(campo) == tarefa.get(campo):
+                    continue
+                indice.get(anterior.get(campo), set()).discard(tarefa_id)
+            indice.setdefault(tarefa.get(campo), set()).add(tarefa_id)
+        # A lista ordenada só muda para tarefas novas ou com outra data de criação;
+        # as regravações de progresso e de status não pagam o custo O(N) dela
+        data = tarefa.get("data_criacao") or ""
+        if anterior is None:
+            bisect.insort(self._por_data, (data, tarefa_id))
+        elif (anterior.get("data_criacao") or "") != data:
+            self._remover_por_data(anterior, tarefa_id)
+            bisect.insort(self._por_data, (data, tarefa_id))
+
+    def _desindexar(self, tarefa_id):
+        anterior = self._tarefas.pop(tarefa_id, None)
+        if anterior is None:
+            return
+        for campo, atributo in self._CAMPOS_INDEXADOS:
+            getattr(self, atributo).get(anterior.get(campo), set()).discard(tarefa_id)
+        self._remover_por_data(anterior, tarefa_id)
+
+    def _remover_por_data(self, tarefa, tarefa_id):
+        chave = (tarefa.get("data_criacao") or "", tarefa_id)
+        indice = bisect.bisect_left(self._por_data, chave)
+        if indice < len(self._por_data) and self._por_data[indice] == chave:
+            del self._por_data[indice]
+
+    def _acrescentar(self, registro):
+        self._arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._arquivo.flush()
+        self._linhas += 1
+        if self._linhas > max(self.minimo_compactacao, self.fator_compactacao * len(self._tarefas)):
+            self._compactar()
+
+    def carregar(self):
+        with self._lock:
+            return {tarefa_id: dict(tarefa) for tarefa_id, tarefa in self._tarefas.items()}
+
+    def salvar(self, tarefa):
+        with self._lock:
+            self._indexar(dict(tarefa))
+            self._acrescentar({"id": tarefa["id"], "tarefa": tarefa})
+
+    def remover(self, tarefa_id):
+        with self._lock:
+            if tarefa_id in self._tarefas:
+                self._desindexar(tarefa_id)
+                self._acrescentar({"id": tarefa_id, "removida": True})
+
+    def obter(self, tarefa_id):
+        with self._lock:
+            tarefa = self._tarefas.get(tarefa_id)
+            return dict(tarefa) if tarefa is not None else None
+
+    def listar_remessa(self, remessa_id):
+        with self._lock:
+            ids = self._por_remessa.get(remessa_id, set())
+            return sorted(ids, key=lambda tarefa_id: (self._tarefas[tarefa_id].get("data_criacao") or "", tarefa_id))
+
+    def versoes(self, ids):
+        with self._lock:
+            return {
+                tarefa_id: (tarefa.get("versao", 0), tarefa.get("atualizado_em") or tarefa.get("data_criacao"))
+                for tarefa_id, tarefa in ((tarefa_id, self._tarefas.get(tarefa_id)) for tarefa_id in ids)
+                if tarefa is not None
+            }
+
+    def listar(self, status=None, desde=None, ate=None):
+        with self._lock:
+            inicio = bisect.bisect_left(self._por_data, (desde,)) if desde is not None else 0
+            fim = bisect.bisect_right(self._por_data, (ate, "\uffff")) if ate is not None else len(self._por_data)
+            candidatos = self._por_data[inicio:fim]
+            if status is None:
+                return [tarefa_id for _, tarefa_id in candidatos]
+            ids_status = self._por_status.get(status, set())
+            return [tarefa_id for _, tarefa_id in candidatos if tarefa_id in ids_status]
+
+    def paginar(self, status=None, modelo=None, desde=None, ate=None, antes_de=None, limite=50):
+        with self._lock:
+            inicio = bisect.bisect_left(self._por_data, (desde,)) if desde is not None else 0
+            fim = bisect.bisect_right(self._por_data, (ate, "\uffff")) if ate is not None else len(self._por_data)
+            if antes_de is not None:
+                fim = min(fim, bisect.bisect_left(self._por_data, tuple(antes_de)))
+            filtros = [
+                indice.get(valor, set())
+                for indice, valor in ((self._por_status, status), (self._por_modelo, modelo))
+                if valor is not None
+            ]
+            ids = []
+            for posicao in range(fim - 1, inicio - 1, -1):
+                tarefa_id = self._por_data[posicao][1]
+                if all(tarefa_id in filtro for filtro in filtros):
+                    ids.append(tarefa_id)
+                    if len(ids) >= limite:
+                        break
+            return ids
+
+    def compactar(self):
+        with self._lock:
+            self._compactar()
+
+    def _compactar(self):
+        temporario = self.caminho + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            for _, tarefa_id in self._por_data:
+                f.write(json.dumps({"id": tarefa_id, "tarefa": self._tarefas[tarefa_id]}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._arquivo.close()
+        os.replace(temporario, self.caminho)
+        self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+        self._linhas = len(self._tarefas)
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+def criar_armazenamento(tipo, diretorio):
+    """Cria o armazenamento de tarefas do tipo informado ('sqlite' ou 'journal')."""
+    if tipo == "sqlite":
+        return ArmazenamentoSQLite(os.path.join(diretorio, 'tarefas.db'))
+    if tipo == "journal":
+        return ArmazenamentoJournal(os.path.join(diretorio, 'tarefas.jsonl'))
+    raise ValueError(f"Tipo de armazenamento desconhecido: {tipo}")
+
+def importar_json(armazenamento, caminho):
+    """Importa as tarefas do antigo tarefas.json para um armazenamento vazio."""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        tarefas = json.load(f)
+    for tarefa in tarefas.values():
+        armazenamento.salvar(tarefa)
+    return len(tarefas)
@@ -0,0 +1,299 @@
+import os
+import time
+import threading
+import subprocess
+import numpy as np
+
+# Taxa de amostragem do áudio decodificado, a mesma do Whisper
+TAXA_AMOSTRAGEM = 16000
+
+# Amostras lidas do ffmpeg de cada vez (10 s de áudio)
+AMOSTRAS_POR_BLOCO = 10 * TAXA_AMOSTRAGEM
+
+def blocos_pcm(origem, taxa=TAXA_AMOSTRAGEM):
+    """Decodifica um arquivo de mídia com o ffmpeg e gera blocos de PCM s16le mono.
+
+    Usa a mesma conversão do whisper.load_audio, mas lida do pipe aos poucos,
+    sem juntar o áudio inteiro na memória.
+    """
+    comando = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", origem,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(taxa), "-"
+    ]
+    with subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as processo:
+        while True:
+            bloco = processo.stdout.read(AMOSTRAS_POR_BLOCO * 2)
+            if not bloco:
+                break
+            yield bloco
+        erro = processo.stderr.read().decode(errors='replace').strip()
+        if processo.wait() != 0:
+            raise RuntimeError(f"Não foi possível decodificar o áudio: {erro}")
+
+class AudioPCM:
+    """Áudio de 16 kHz mono em um arquivo PCM s16le, lido por mapeamento em memória.
+
+    Enquanto o ffmpeg decodifica, o arquivo cresce e `ler` espera as amostras
+    que ainda não chegaram. Só os trechos lidos são convertidos para float32
+    na memória do processo. Quem abre o áudio deve chamar `fechar` (ou usá-lo
+    em um `with`) ao terminar; um AudioPCM entregue a várias tarefas só fecha
+    o arquivo quando a última o fecha.
+    """
+
+    def __init__(self, caminho, amostras=0, concluido=False):
+        self.caminho = caminho
+        self.em_cache = concluido
+        # Segundos gastos pelo ffmpeg (0 quando o áudio veio do cache)
+        self.tempo_decodificacao = 0.0
+        self._amostras = amostras
+        self._concluido = concluido
+        self._erro = None
+        self._condicao = threading.Condition()
+        # Tarefas que usam este áudio e ainda não o fecharam
+        self._usuarios = 1
+        # Mantido aberto para que o áudio continue legível se o arquivo for
+        # renomeado ao fim da decodificação ou descartado do cache
+        self._arquivo = open(caminho, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def _reter(self):
+        """Registra mais uma tarefa usando o áudio e retorna o próprio AudioPCM.
+
+        Se todas as anteriores já o fecharam durante a decodificação, o arquivo é reaberto.
+        """
+        with self._condicao:
+            if self._usuarios == 0:
+                self._arquivo = open(self.caminho, 'rb')
+            self._usuarios += 1
+        return self
+
+    def fechar(self):
+        """Libera o áudio para quem o abriu; o arquivo é fechado quando ninguém mais o usa."""
+        with self._condicao:
+            self._usuarios -= 1
+            if self._usuarios > 0:
+                return
+        self._arquivo.close()
+
+    def _avancar(self, amostras):
+        with self._condicao:
+            self._amostras = amostras
+            self._condicao.notify_all()
+
+    def _concluir(self, tempo_decodificacao):
+        with self._condicao:
+            self.tempo_decodificacao = tempo_decodificacao
+            self._concluido = True
+            self._condicao.notify_all()
+
+    def _falhar(self, erro):
+        with self._condicao:
+            self._erro = erro
+            self._condicao.notify_all()
+
+    def total(self):
+        """Total de amostras do áudio, ou None enquanto a decodificação não termina."""
+        with self._condicao:
+            return self._amostras if self._concluido else None
+
+    def aguardar(self, amostras=None):
+        """Espera até haver `amostras` decodificadas (ou o áudio inteiro, com None) e retorna quantas há.
+
+        Retorna menos que `amostras` se o áudio terminar antes. Levanta
+        RuntimeError se a decodificação falhar.
+        """
+        with self._condicao:
+            while self._erro is None and not self._concluido and (amostras is None or self._amostras < amostras):
+                self._condicao.wait()
+            if self._erro is not None:
+                raise RuntimeError(str(self._erro))
+            return self._amostras
+
+    def ler(self, inicio=0, fim=None):
+        """Retorna as amostras de `inicio` a `fim` em float32, esperando que sejam decodificadas."""
+        disponiveis = self.aguardar(fim)
+        fim = disponiveis if fim is None else min(fim, disponiveis)
+        if fim <= inicio:
+            return np.zeros(0, dtype=np.float32)
+        mapa = np.memmap(self._arquivo, dtype=np.int16, mode='r', offset=inicio * 2, shape=(fim - inicio,))
+        audio = mapa.astype(np.float32)
+        del mapa
+        audio /= 32768.0
+        return audio
+
+class AudioMemoria:
+    """Áudio já decodificado em um array, com a mesma interface de leitura do AudioPCM."""
+
+    def __init__(self, audio):
+        self.audio = audio
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def fechar(self):
+        pass
+
+    def total(self):
+        return len(self.audio)
+
+    def aguardar(self, amostras=None):
+        return len(self.audio)
+
+    def ler(self, inicio=0, fim=None):
+        return self.audio[inicio:fim]
+
+class CacheAudioPCM:
+    """Cache do áudio decodificado, endereçado pelo hash do arquivo enviado.
+
+    Cada áudio fica em `<hash>.pcm` (s16le, 16 kHz, mono), gravado durante a
+    decodificação em um `.parcial` e renomeado no fim. Uma nova transcrição do
+    mesmo arquivo, com outro modelo, idioma ou tarefa, lê o PCM sem passar pelo
+    ffmpeg; pedidos do mesmo hash durante a decodificação recebem o mesmo
+    AudioPCM. A data de modificação marca o último acesso e guia o descarte LRU
+    quando o total passa de `limite_bytes`. Com `limite_bytes` igual a zero,
+    o PCM é gravado no diretório da tarefa e não é guardado.
+    """
+
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        # hash -> [tamanho, último acesso]
+        self._entradas = {}
+        # hash -> AudioPCM ainda em decodificação
+        self._decodificando = {}
+        self.contadores = {"acertos": 0, "faltas": 0, "descartes": 0}
+        if self.limite_bytes > 0:
+            os.makedirs(diretorio, exist_ok=True)
+            self._indexar()
+
+    def _indexar(self):
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if nome.endswith('.parcial'):
+                # Decodificação interrompida por uma queda
+                os.remove(caminho)
+            elif nome.endswith('.pcm'):
+                info = os.stat(caminho)
+                self._entradas[nome[:-len('.pcm')]] = [info.st_size, info.st_mtime]
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.pcm")
+
+    def abrir(self, chave, origem, diretorio_temporario):
+        """Retorna o AudioPCM do arquivo `origem`, do cache ou em decodificação em segundo plano.
+
+        Sem `chave` ou com o cache desativado, o PCM é gravado em
+        `diretorio_temporario` e apagado com ele. Quem chama deve fechar o AudioPCM.
+        """
+        if chave is None or self.limite_bytes <= 0:
+            return self._decodificar(None, origem, os.path.join(diretorio_temporario, "audio.pcm"))
+
+        with self._lock:
+            audio = self._decodificando.get(chave)
+            if audio is not None:
+                self.contadores["acertos"] += 1
+                return audio._reter()
+            if chave in self._entradas or os.path.exists(self._caminho(chave)):
+                try:
+                    os.utime(self._caminho(chave))
+                    info = os.stat(self._caminho(chave))
+                    audio = AudioPCM(self._caminho(chave), info.st_size // 2, concluido=True)
+                except OSError as e:
+                    print(f"Erro ao ler o cache de áudio {chave}: {str(e)}")
+                    self._entradas.pop(chave, None)
+                else:
+                    self._entradas[chave] = [info.st_size, info.st_mtime]
+                    self.contadores["acertos"] += 1
+                    return audio
+            self.contadores["faltas"] += 1
+            audio = self._decodificar(chave, origem, f"{self._caminho(chave)}.{threading.get_ident()}.parcial")
+            self._decodificando[chave] = audio
+            return audio
+
+    def _decodificar(self, chave, origem, destino):
+        """Cria o arquivo de destino e inicia a decodificação em uma thread. Retorna o AudioPCM."""
+        open(destino, 'wb').close()
+        audio = AudioPCM(destino)
+        threading.Thread(
+            target=self._gravar, args=(chave, origem, audio), name="decodificacao-audio", daemon=True
+        ).start()
+        return audio
+
+    def _gravar(self, chave, origem, audio):
+        inicio = time.time()
+        try:
+            gravados = 0
+            with open(audio.caminho, 'r+b') as f:
+                for bloco in blocos_pcm(origem):
+                    f.write(bloco)
+                    f.flush()
+                    gravados += len(bloco)
+                    audio._avancar(gravados // 2)
+        except Exception as e:
+            print(f"Erro ao decodificar {origem}: {str(e)}")
+            audio._falhar(e)
+            try:
+                os.remove(audio.caminho)
+            except OSError:
+                pass
+        else:
+            guardado = False
+            if chave is not None:
+                try:
+                    # Sob a condição do áudio, para que _reter não reabra o caminho antigo
+                    with audio._condicao:
+                        os.replace(audio.caminho, self._caminho(chave))
+                        audio.caminho = self._caminho(chave)
+                    guardado = True
+                except OSError as e:
+                    # No Windows, um arquivo aberto não pode ser renomeado: o áudio
+                    # continua legível, mas não fica no cache
+                    print(f"Não foi possível guardar o áudio {chave} no cache: {str(e)}")
+            audio._concluir(time.time() - inicio)
+            if guardado:
+                with self._lock:
+                    self._entradas[chave] = [os.path.getsize(audio.caminho), os.path.getmtime(audio.caminho)]
+                    self._descartar_excesso()
+        finally:
+            if chave is not None:
+                with self._lock:
+                    self._decodificando.pop(chave, None)
+
+    def _descartar_excesso(self):
+        total = sum(tamanho for tamanho, _ in self._entradas.values())
+        if total <= self.limite_bytes:
+            return
+        for chave, (tamanho, _) in sorted(self._entradas.items(), key=lambda item: item[1][1]):
+            try:
+                os.remove(self._caminho(chave))
+            except OSError as e:
+                print(f"Erro ao remover o áudio {chave} do cache: {str(e)}")
+            del self._entradas[chave]
+            self.contadores["descartes"] += 1
+            total -= tamanho
+            if total <= self.limite_bytes:
+                break
+
+    def estado(self):
+        """Retorna o tamanho do cache e os contadores de acertos, faltas e descartes."""
+        with self._lock:
+            consultas = self.contadores["acertos"] + self.contadores["faltas"]
+            tamanho = sum(tamanho for tamanho, _ in self._entradas.values())
+            return {
+                "entradas": len(self._entradas),
+                "decodificando": len(self._decodificando),
+                "tamanho_bytes": tamanho,
+                "tamanho_mb": round(tamanho / (1024 * 1024), 2),
+                "limite_mb": round(self.limite_bytes / (1024 * 1024), 2),
+                "taxa_acertos": self.contadores["acertos"] / consultas if consultas else None,
+                **self.contadores
+            }
@@ -1,290 +1,2901 @@
 import os
+import io
 import time
+import shutil
+import subprocess
 import tempfile
 import whisper
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
+from flask import Request
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
+from armazenamento import criar_armazenamento, importar_json
+from cache_transcricoes import CacheTranscricoes
+from audio_pcm import CacheAudioPCM, AudioPCM, AudioMemoria
+from formatos import FORMATOS, ResultadosTarefas, codificacao_arquivo, abrir_resultado
+from metricas import RegistroMetricas
+from checkpoints import CheckpointsTranscricao
+from progresso_whisper import ObservadorTranscricao, observar_transcricao, PROGRESSO_WHISPER
+from inferencia import ServidorInferencia, ClienteInferencia, InferenciaIndisponivel, endereco_padrao, chave_compartilhada
+import pesos
+import voz
 import torch
+import numpy as np
 import uuid
+import hashlib
+import hmac
 import threading
 import queue
-from datetime import datetime
+import copy
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+import base64
+import unicodedata
+from urllib.parse import quote
 import json
-
-# Função para escrever arquivos SRT
-def write_srt(segments, file):
-    """Escreve os segmentos no formato SRT."""
-    for i, segment in enumerate(segments, start=1):
-        # Converte os tempos de início e fim para o formato SRT (HH:MM:SS,mmm)
-        start_time = format_timestamp(segment["start"])
-        end_time = format_timestamp(segment["end"])
-        
-        # Escreve o número do segmento
-        print(f"{i}", file=file)
-        
-        # Escreve o intervalo de tempo
-        print(f"{start_time} --> {end_time}", file=file)
-        
-        # Escreve o texto
-        print(f"{segment['text'].strip()}\n", file=file)
-
-def format_timestamp(seconds):
-    """Formata um tempo em segundos para o formato SRT (HH:MM:SS,mmm)."""
-    hours = int(seconds / 3600)
-    minutes = int((seconds % 3600) / 60)
-    seconds = seconds % 60
-    milliseconds = int((seconds - int(seconds)) * 1000)
-    
-    return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
-
-# Função para escrever arquivos VTT
-def write_vtt(segments, file):
-    """Escreve os segmentos no formato VTT."""
-    print("WEBVTT\n", file=file)
-    
-    for segment in segments:
-        # Converte os tempos de início e fim para o formato VTT (HH:MM:SS.mmm)
-        start_time = format_timestamp_vtt(segment["start"])
-        end_time = format_timestamp_vtt(segment["end"])
-        
-        # Escreve o intervalo de tempo
-        print(f"{start_time} --> {end_time}", file=file)
-        
-        # Escreve o texto
-        print(f"{segment['text'].strip()}\n", file=file)
-
-def format_timestamp_vtt(seconds):
-    """Formata um tempo em segundos para o formato VTT (HH:MM:SS.mmm)."""
-    hours = int(seconds / 3600)
-    minutes = int((seconds % 3600) / 60)
-    seconds = seconds % 60
-    milliseconds = int((seconds - int(seconds)) * 1000)
-    
-    return f"{hours:02d}:{minutes:02d}:{int(seconds):02d}.{milliseconds:03d}"
+import zipfile
+import tarfile
 
 app = Flask(__name__)
 CORS(app)  # Habilita CORS para todas as rotas
 
-# Caminho para o arquivo de armazenamento de tarefas
-TAREFAS_ARQUIVO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tarefas.json')
+# Diretório do backend
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Diretório onde ficam o armazenamento de tarefas, os resultados e o cache
+DADOS_DIR = os.environ.get('WHISPER_DADOS_DIR', BASE_DIR)
+os.makedirs(DADOS_DIR, exist_ok=True)
+
+# Áudios enviados, mantidos até a tarefa ser concluída para sobreviver a um
+# reinício e permitir o /reenviar sem novo upload
+UPLOADS_DIR = os.path.join(DADOS_DIR, 'uploads')
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+# Papel deste processo: 'completo' (API e inferência no mesmo processo), 'api'
+# (só as rotas HTTP, que podem rodar em vários processos de um servidor WSGI) ou
+# 'inferencia' (só a fila e os workers, sem HTTP). Os papéis 'api' e 'inferencia'
+# se comunicam por WHISPER_INFERENCIA_ENDERECO e compartilham as tarefas pelo SQLite
+PAPEL = os.environ.get('WHISPER_PAPEL', 'completo')
+if PAPEL not in ("completo", "api", "inferencia"):
+    raise ValueError(f"Papel desconhecido em WHISPER_PAPEL: {PAPEL}")
+INFERENCIA_ENDERECO = os.environ.get('WHISPER_INFERENCIA_ENDERECO') or endereco_padrao(DADOS_DIR)
+
+# Arquivo de tarefas das versões anteriores, importado na primeira execução
+TAREFAS_ARQUIVO = os.path.join(DADOS_DIR, 'tarefas.json')
+
+# Armazenamento das tarefas: 'sqlite' (tarefas.db) ou 'journal' (tarefas.jsonl)
+ARMAZENAMENTO_TIPO = os.environ.get('WHISPER_ARMAZENAMENTO', 'sqlite')
+if PAPEL != "completo" and ARMAZENAMENTO_TIPO != "sqlite":
+    raise ValueError("Os papéis 'api' e 'inferencia' precisam do armazenamento sqlite, compartilhado entre processos")
+
+# Limite do cache de transcrições, em MB (0 desativa o cache)
+CACHE_TRANSCRICOES_MB = int(os.environ.get('WHISPER_CACHE_MB', '1024'))
+
+# Limite do cache do áudio decodificado (PCM de 16 kHz), em MB (0 desativa): o
+# /reenviar e novas transcrições do mesmo arquivo com outro modelo, idioma ou
+# tarefa leem o PCM guardado em vez de decodificar o áudio de novo
+CACHE_PCM_MB = int(os.environ.get('WHISPER_CACHE_PCM_MB', '4096'))
+
+# Quantidade de arquivos de saída (txt, srt, vtt, json) gerados sob demanda que
+# ficam guardados em resultados/ para os próximos downloads
+RENDERIZADOS_MAXIMO = int(os.environ.get('WHISPER_RENDERIZADOS_MAXIMO', '256'))
+
+# Compressão dos arquivos de saída gerados em resultados/: 'nenhuma', 'gzip' ou
+# 'zstd' (precisa do pacote zstandard). Clientes que aceitam a codificação os
+# recebem como estão; os demais recebem o conteúdo descompactado
+RESULTADOS_COMPRESSAO = os.environ.get('WHISPER_RESULTADOS_COMPRESSAO', 'nenhuma')
+
+# Limpeza periódica, a cada WHISPER_LIMPEZA_INTERVALO segundos (0 desativa): as
+# tarefas finalizadas há mais de WHISPER_RETENCAO_DIAS dias são apagadas com o
+# resultado e o áudio guardado; se resultados/ passar de WHISPER_RESULTADOS_MAXIMO_MB
+# ou houver mais de WHISPER_TAREFAS_MAXIMO tarefas, as finalizadas mais antigas
+# são apagadas primeiro (0 desativa cada limite)
+LIMPEZA_INTERVALO = float(os.environ.get('WHISPER_LIMPEZA_INTERVALO', '3600'))
+RETENCAO_DIAS = float(os.environ.get('WHISPER_RETENCAO_DIAS', '30'))
+RESULTADOS_MAXIMO_MB = int(os.environ.get('WHISPER_RESULTADOS_MAXIMO_MB', '0'))
+TAREFAS_MAXIMO = int(os.environ.get('WHISPER_TAREFAS_MAXIMO', '0'))
+
+# Transcrição de áudios longos: áudios com pelo menos WHISPER_LONGO_MIN_SEGUNDOS
+# (0 desativa) são divididos em trechos de cerca de WHISPER_TRECHO_SEGUNDOS,
+# cortados em pausas e transcritos em paralelo pelos workers livres
+LONGO_MIN_SEGUNDOS = float(os.environ.get('WHISPER_LONGO_MIN_SEGUNDOS', '600'))
+TRECHO_SEGUNDOS = float(os.environ.get('WHISPER_TRECHO_SEGUNDOS', '300'))
+SOBREPOSICAO_SEGUNDOS = float(os.environ.get('WHISPER_SOBREPOSICAO_SEGUNDOS', '2'))
+
+# Decodificação em lote: tarefas curtas (até 30 s) com o mesmo modelo, tarefa e
+# idioma que chegam à fila em até WHISPER_LOTE_ESPERA_MS são decodificadas juntas,
+# em lotes de até WHISPER_LOTE_MAXIMO áudios (1 desativa)
+LOTE_MAXIMO = max(1, int(os.environ.get('WHISPER_LOTE_MAXIMO', '8')))
+LOTE_ESPERA_SEGUNDOS = float(os.environ.get('WHISPER_LOTE_ESPERA_MS', '50')) / 1000
+
+# Tamanho dos blocos usados para gravar os uploads
+TAMANHO_BLOCO_UPLOAD = 1024 * 1024
+
+# Máximo de arquivos em uma remessa (envio de vários arquivos ou de um pacote zip/tar)
+REMESSA_MAXIMO_ARQUIVOS = int(os.environ.get('WHISPER_REMESSA_MAXIMO_ARQUIVOS', '1000'))
+
+# Máximo, em MB, da soma dos arquivos extraídos dos pacotes de uma remessa (0
+# desativa o limite). Protege o disco de pacotes que se expandem muito além do
+# tamanho enviado
+REMESSA_MAXIMO_MB = int(os.environ.get('WHISPER_REMESSA_MAXIMO_MB', '8192'))
+
+# Extensões dos pacotes aceitos em /remessas, extraídos arquivo a arquivo
+EXTENSOES_PACOTE = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Tamanho máximo de uma requisição de upload, em MB (0 desativa o limite)
+UPLOAD_MAXIMO_MB = int(os.environ.get('WHISPER_UPLOAD_MAXIMO_MB', '2048'))
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAXIMO_MB * 1024 * 1024 if UPLOAD_MAXIMO_MB > 0 else None
+
+# Com um proxy como o nginx na frente, os downloads podem ser entregues por ele (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.environ.get('WHISPER_X_SENDFILE', '0') == '1'
+
+def _ler_limites_modelo(valor):
+    """Converte uma string no formato 'large=1,medium=2' em um dicionário de limites."""
+    limites = {}
+    for item in valor.split(','):
+        if '=' not in item:
+            continue
+        nome, limite = item.split('=', 1)
+        limites[nome.strip()] = int(limite)
+    return limites
+
+# Escalonamento da fila: cada tarefa é pontuada pelo tempo de processamento
+# esperado, somado ao das tarefas do mesmo cliente na frente dela. A pontuação
+# cai WHISPER_FILA_ENVELHECIMENTO segundos por segundo de espera e
+# WHISPER_PRIORIDADE_SEGUNDOS por nível de prioridade; a menor sai primeiro
+FILA_ENVELHECIMENTO = float(os.environ.get('WHISPER_FILA_ENVELHECIMENTO', '1.0'))
+PRIORIDADE_SEGUNDOS = float(os.environ.get('WHISPER_PRIORIDADE_SEGUNDOS', '60'))
+
+# Duração assumida para áudios que o ffprobe não conseguiu medir
+DURACAO_PADRAO_SEGUNDOS = 300
+
+# Pesos convertidos por `download_models.py --converter`, carregados com mmap
+# quando existem (senão o modelo vem do .pt original em ~/.cache/whisper)
+PESOS_DIR = os.environ.get('WHISPER_PESOS_DIR', pesos.DIRETORIO_PADRAO)
+
+# Modelos carregados em segundo plano ao iniciar, separados por vírgula. Cada
+# item é 'modelo' (em todos os dispositivos do pool) ou 'modelo@dispositivo'
+PRECARREGAR = [item.strip() for item in os.environ.get('WHISPER_PRECARREGAR', '').split(',') if item.strip()]
+
+# Quantização int8 dos modelos executados na CPU: 'int8' ou 'nenhuma'. É o padrão
+# do servidor; cada envio pode escolher com o campo `quantizacao`
+QUANTIZACAO_CPU = os.environ.get('WHISPER_QUANTIZACAO_CPU', 'nenhuma')
+QUANTIZACOES = ("nenhuma", "int8")
+
+# Cascata: um modelo pequeno detecta o idioma e faz um rascunho; só os segmentos
+# com confiança baixa (avg_logprob abaixo de WHISPER_CASCATA_LOGPROB ou texto
+# repetitivo) são decodificados de novo com o modelo pedido na tarefa
+CASCATA_MODELO = os.environ.get('WHISPER_CASCATA_MODELO', 'tiny')
+CASCATA_LOGPROB_MINIMO = float(os.environ.get('WHISPER_CASCATA_LOGPROB', '-0.6'))
+
+# Perfis de decodificação, escolhidos em cada envio (parâmetro `perfil`): busca
+# em feixe, candidatos amostrados, fallback de temperatura e limiares para
+# repetir uma janela. 'equilibrado' é o comportamento padrão do transcribe do Whisper
+PERFIS_DECODIFICACAO = {
+    "rapido": {
+        "beam_size": None,
+        "best_of": None,
+        "temperature": (0.0,),
+        "condition_on_previous_text": False,
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6
+    },
+    "equilibrado": {
+        "beam_size": None,
+        "best_of": 5,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "condition_on_previous_text": True,
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6
+    },
+    "preciso": {
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "condition_on_previous_text": True,
+        "compression_ratio_threshold": 2.2,
+        "logprob_threshold": -0.8,
+        "no_speech_threshold": 0.6
+    }
+}
+# Do mais rápido para o mais preciso, para o rebaixamento pela política de carga
+ORDEM_PERFIS = ("rapido", "equilibrado", "preciso")
+PERFIL_PADRAO = os.environ.get('WHISPER_PERFIL', 'equilibrado')
+if PERFIL_PADRAO not in PERFIS_DECODIFICACAO:
+    raise ValueError(f"Perfil desconhecido em WHISPER_PERFIL: {PERFIL_PADRAO}")
+
+# Política de carga: quando a tarefa mais antiga da fila espera mais que
+# WHISPER_SLO_ESPERA_SEGUNDOS, as tarefas passam a sair com um perfil mais rápido
+# e, se não bastar, com um modelo menor. 0 desativa
+SLO_ESPERA_SEGUNDOS = float(os.environ.get('WHISPER_SLO_ESPERA_SEGUNDOS', '0'))
+POLITICA_INTERVALO_SEGUNDOS = float(os.environ.get('WHISPER_POLITICA_INTERVALO_SEGUNDOS', '30'))
+
+# Modelo usado no lugar de cada um no nível mais alto da política de carga
+MODELOS_MENORES = {
+    "large-v3": "medium", "large-v2": "medium", "large-v1": "medium", "large": "medium",
+    "turbo": "small", "medium": "small", "small": "base", "base": "tiny",
+    "medium.en": "small.en", "small.en": "base.en", "base.en": "tiny.en"
+}
+
+# Detecção de voz antes da transcrição: só as regiões com fala são decodificadas.
+# WHISPER_VAD é o padrão das tarefas (o envio pode escolher com o parâmetro `vad`);
+# pausas menores que WHISPER_VAD_SILENCIO_SEGUNDOS não são puladas
+VAD_PADRAO = os.environ.get('WHISPER_VAD', '0') == '1'
+VAD_SILENCIO_SEGUNDOS = float(os.environ.get('WHISPER_VAD_SILENCIO_SEGUNDOS', '1.0'))
+
+# Threads de cada worker de CPU nas operações do PyTorch. Sem a variável, os
+# núcleos são divididos entre os workers de CPU para que não disputem os mesmos
+THREADS_POR_WORKER = int(os.environ.get('WHISPER_THREADS_POR_WORKER', '0'))
+
+# Configuração do pool de workers
+# Número de workers que processam tarefas na CPU (as GPUs têm sempre um worker cada).
+# Com 0, as tarefas de CPU ficam para os nós remotos (veja WHISPER_NOS_CHAVE)
+NUM_WORKERS_CPU = max(0, int(os.environ.get('WHISPER_WORKERS_CPU', '2')))
+
+# Nós remotos (worker_remoto.py) que arrendam tarefas da fila por HTTP. Sem a
+# chave, as rotas /nos ficam desativadas. Um arrendamento não renovado em
+# WHISPER_ARRENDAMENTO_SEGUNDOS volta para a fila e pode ir para outro nó
+NOS_CHAVE = os.environ.get('WHISPER_NOS_CHAVE', '')
+ARRENDAMENTO_SEGUNDOS = float(os.environ.get('WHISPER_ARRENDAMENTO_SEGUNDOS', '60'))
+
+# Máximo de tarefas simultâneas por modelo, somando todos os dispositivos.
+# Modelos sem entrada aqui não têm limite além do tamanho do pool.
+LIMITES_MODELO = {"medium": 2, "large": 1, "large-v3": 1}
+LIMITES_MODELO.update(_ler_limites_modelo(os.environ.get('WHISPER_LIMITES_MODELO', '')))
+
+# Orçamento de memória para modelos, em MB. Sem a variável de ambiente, usa metade
+# da RAM na CPU e 80% da memória de cada GPU (o restante fica para as ativações).
+MEMORIA_CPU_MB = os.environ.get('WHISPER_MEMORIA_CPU_MB')
+MEMORIA_GPU_MB = os.environ.get('WHISPER_MEMORIA_GPU_MB')
+
+# Tamanho aproximado dos pesos em fp32, em MB. Serve para abrir espaço antes de
+# carregar um modelo; depois do carregamento vale o tamanho medido.
+TAMANHO_ESTIMADO_MODELOS_MB = {
+    "tiny": 160,
+    "base": 300,
+    "small": 980,
+    "medium": 3080,
+    "large": 6200,
+    "turbo": 3240,
+}
+
+def orcamento_memoria_mb(dispositivo):
+    """Retorna o orçamento de memória para modelos no dispositivo, em MB."""
+    if dispositivo.startswith("cuda"):
+        if MEMORIA_GPU_MB:
+            return int(MEMORIA_GPU_MB)
+        total = torch.cuda.get_device_properties(torch.device(dispositivo)).total_memory
+        return int(total * 0.8 / (1024 * 1024))
+
+    if MEMORIA_CPU_MB:
+        return int(MEMORIA_CPU_MB)
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        return int(total * 0.5 / (1024 * 1024))
+    except (AttributeError, ValueError, OSError):
+        # os.sysconf não existe no Windows
+        return 8192
+
+def tamanho_estimado_mb(nome_modelo):
+    """Estima o tamanho de um modelo ainda não carregado, em MB."""
+    nome_modelo, _, quantizacao = nome_modelo.partition('+')
+    base = nome_modelo.split('.')[0]
+    if base.startswith("large"):
+        base = "turbo" if base.endswith("turbo") else "large"
+    tamanho = TAMANHO_ESTIMADO_MODELOS_MB.get(base, TAMANHO_ESTIMADO_MODELOS_MB["large"])
+    # Em int8 as camadas lineares ocupam um quarto do espaço; o embedding de
+    # tokens continua em float32 e pesa mais nos modelos pequenos
+    return tamanho // 2 if quantizacao == "int8" else tamanho
+
+class GerenciadorModelos:
+    """Cache de modelos Whisper com orçamento de memória por dispositivo e descarte LRU.
+
+    Cada (modelo, dispositivo) é carregado do disco uma única vez, mesmo quando
+    vários workers o pedem ao mesmo tempo: os demais esperam o carregamento em
+    andamento. Cada worker recebe uma instância exclusiva, porque o decodificador
+    do Whisper instala hooks de cache KV no próprio módulo, mas as instâncias de
+    um mesmo modelo compartilham os tensores de pesos e não ocupam memória extra.
+
+    Quando um novo modelo não cabe no orçamento do dispositivo, os modelos ociosos
+    usados há mais tempo são descartados. Se todos estiverem em uso, o pedido
+    espera algum ser liberado. Carregamentos e descartes ficam registrados em
+    `eventos` para ajudar a dimensionar o orçamento.
+    """
+
+    def __init__(self, carregar_pesos, orcamento_mb, max_eventos=200):
+        self._carregar_pesos = carregar_pesos
+        self._orcamento_mb = orcamento_mb
+        self._condicao = threading.Condition()
+        # (nome, dispositivo) -> entrada, da usada há mais tempo para a mais recente
+        self._entradas = OrderedDict()
+        # (nome, dispositivo) -> bytes estimados dos carregamentos em andamento
+        self._carregando = {}
+        self.eventos = deque(maxlen=max_eventos)
+        self.contadores = {"acertos": 0, "carregamentos": 0, "descartes": 0}
+
+    def obter(self, nome_modelo, dispositivo):
+        """Reserva uma instância do modelo no dispositivo, carregando-o se necessário."""
+        chave = (nome_modelo, dispositivo)
+        with self._condicao:
+            while True:
+                entrada = self._entradas.get(chave)
+                if entrada is not None:
+                    self._entradas.move_to_end(chave)
+                    entrada["em_uso"] += 1
+                    self.contadores["acertos"] += 1
+                    if entrada["livres"]:
+                        return entrada["livres"].pop()
+                    base = entrada["base"]
+                    break
+
+                # Outro worker já está carregando este modelo: espera por ele
+                if chave in self._carregando:
+                    self._condicao.wait()
+                    continue
+
+                necessario = tamanho_estimado_mb(nome_modelo) * 1024 * 1024
+                if not self._abrir_espaco(dispositivo, necessario):
+                    self._condicao.wait()
+                    continue
+
+                self._carregando[chave] = necessario
+                base = None
+                break
+
+        if base is not None:
+            return self._nova_instancia(base)
+
+        inicio_carregamento = time.time()
+        try:
+            modelo = self._carregar_pesos(nome_modelo, dispositivo)
+        except Exception:
+            with self._condicao:
+                del self._carregando[chave]
+                self._condicao.notify_all()
+            raise
+        tempo_carregamento = time.time() - inicio_carregamento
+
+        tamanho = pesos.tamanho_bytes(modelo)
+        with self._condicao:
+            del self._carregando[chave]
+            self._entradas[chave] = {"base": modelo, "livres": [], "em_uso": 1, "bytes": tamanho}
+            self.contadores["carregamentos"] += 1
+            self._registrar_evento("carregamento", chave, tamanho, tempo_carregamento)
+            self._condicao.notify_all()
+        return modelo
+
+    def liberar(self, nome_modelo, dispositivo, instancia):
+        """Devolve uma instância reservada com obter."""
+        with self._condicao:
+            entrada = self._entradas[(nome_modelo, dispositivo)]
+            entrada["em_uso"] -= 1
+            entrada["livres"].append(instancia)
+            self._condicao.notify_all()
+
+    def estado(self):
+        """Retorna os modelos residentes, o uso de memória por dispositivo e os eventos recentes."""
+        with self._condicao:
+            modelos = []
+            dispositivos = {}
+            for (nome, dispositivo), entrada in self._entradas.items():
+                modelos.append({
+                    "modelo": nome,
+                    "dispositivo": dispositivo,
+                    "memoria_mb": round(entrada["bytes"] / (1024 * 1024), 1),
+                    "em_uso": entrada["em_uso"],
+                    "instancias": entrada["em_uso"] + len(entrada["livres"])
+                })
+                dispositivos.setdefault(dispositivo, 0)
+                dispositivos[dispositivo] += entrada["bytes"]
+            return {
+                "modelos": modelos,
+                "dispositivos": {
+                    dispositivo: {
+                        "usado_mb": round(usado / (1024 * 1024), 1),
+                        "orcamento_mb": self._orcamento_mb(dispositivo)
+                    }
+                    for dispositivo, usado in dispositivos.items()
+                },
+                "contadores": dict(self.contadores),
+                "eventos": list(self.eventos)
+            }
+
+    def _abrir_espaco(self, dispositivo, necessario):
+        """Descarta modelos ociosos até caber `necessario` bytes. Chamado com o lock."""
+        orcamento = self._orcamento_mb(dispositivo) * 1024 * 1024
+        usado = sum(e["bytes"] for (_, d), e in self._entradas.items() if d == dispositivo)
+        usado += sum(b for (_, d), b in self._carregando.items() if d == dispositivo)
+        if usado + necessario <= orcamento:
+            return True
+
+        for chave, entrada in list(self._entradas.items()):
+            if chave[1] != dispositivo or entrada["em_uso"]:
+                continue
+            self._descartar(chave)
+            usado -= entrada["bytes"]
+            if usado + necessario <= orcamento:
+                return True
+
+        # Um modelo maior que o orçamento ainda pode ser carregado sozinho
+        if usado == 0:
+            print(f"AVISO: modelo de {necessario / (1024 * 1024):.0f} MB excede o orçamento de {dispositivo}")
+            return True
+        return False
+
+    def _descartar(self, chave):
+        entrada = self._entradas.pop(chave)
+        self.contadores["descartes"] += 1
+        self._registrar_evento("descarte", chave, entrada["bytes"], None)
+        print(f"Modelo {chave[0]} descartado de {chave[1]} ({entrada['bytes'] / (1024 * 1024):.0f} MB)")
+        del entrada
+        if chave[1].startswith("cuda"):
+            torch.cuda.empty_cache()
+
+    def _registrar_evento(self, tipo, chave, tamanho, duracao):
+        self.eventos.append({
+            "tipo": tipo,
+            "modelo": chave[0],
+            "dispositivo": chave[1],
+            "memoria_mb": round(tamanho / (1024 * 1024), 1),
+            "duracao": duracao,
+            "data": datetime.now().isoformat()
+        })
+
+    @staticmethod
+    def _nova_instancia(modulo):
+        """Cria uma cópia rasa de `modulo`, sem hooks, que compartilha os tensores dele."""
+        # O whisper.decoding liga o cache KV com install_kv_cache_hooks, que registra
+        # forward hooks nas projeções key/value do próprio módulo do decodificador
+        # e guarda nelas os tensores da decodificação em curso. Dois workers com o
+        # mesmo módulo misturariam os caches um do outro; por isso cada worker tem
+        # a sua cópia, com dicionários de hooks próprios e os mesmos tensores.
+        instancia = copy.copy(modulo)
+        instancia._parameters = dict(modulo._parameters)
+        instancia._buffers = dict(modulo._buffers)
+        # Todo dicionário de hooks do Module (forward, backward, state_dict...) é
+        # zerado, inclusive os que versões futuras do torch venham a criar
+        for atributo, valor in vars(modulo).items():
+            if atributo.startswith("_") and "hooks" in atributo and isinstance(valor, dict):
+                setattr(instancia, atributo, OrderedDict())
+        instancia._modules = {
+            nome: GerenciadorModelos._nova_instancia(submodulo) if submodulo is not None else None
+            for nome, submodulo in modulo._modules.items()
+        }
+        return instancia
+
+def cabe_em_lote(tarefa):
+    """Indica se o ffprobe mediu o áudio da tarefa com até 30 s; sem a medida, a tarefa não entra em lotes."""
+    duracao = tarefa.get("duracao_estimada")
+    return duracao is not None and duracao <= whisper.audio.CHUNK_LENGTH
+
+class FilaTarefas:
+    """Fila de tarefas compartilhada pelo pool de workers.
+
+    Cada worker pede a próxima tarefa do seu tipo de dispositivo (cpu ou cuda)
+    cujo modelo ainda não atingiu o limite de execuções simultâneas. As tarefas
+    que não podem ser executadas agora continuam na fila, sem bloquear as demais.
+
+    Entre as tarefas que podem ser executadas, sai a de menor pontuação: o
+    custo estimado (`estimar_custo`, em segundos) somado ao das tarefas do
+    mesmo cliente que estão na frente dela, menos `envelhecimento` por segundo
+    de espera e `peso_prioridade` por nível de prioridade. Assim um áudio curto
+    não espera um áudio longo enviado antes, um cliente com muitas tarefas não
+    monopoliza os workers e nenhuma tarefa espera indefinidamente.
+
+    Como a pontuação de todas as tarefas cai no mesmo ritmo com a espera, a
+    ordem fica guardada e só muda quando uma tarefa entra ou sai da fila (o
+    custo acumulado do cliente muda) ou quando os fatores de tempo real mudam
+    (`reordenar`); consultar a fila não reordena nada.
+
+    Trechos de áudios longos (itens com a chave "trecho") saem antes de todas
+    as tarefas e não contam no limite do modelo, pois fazem parte de uma tarefa
+    que já está em execução. O mesmo vale para as tarefas retiradas junto com
+    outra para a decodificação em lote (marcadas com "em_lote").
+
+    Nós remotos retiram tarefas com `arrendar`, sem bloquear os workers locais.
+    """
+
+    def __init__(self, limites_modelo, estimar_custo, envelhecimento=1.0, peso_prioridade=60.0):
+        self._condicao = threading.Condition()
+        # Entradas [pontuação, sequência, tarefa, custo, chave no cliente, deslocamento],
+        # da próxima tarefa para a última
+        self._ordem = []
+        # Cliente -> entradas das suas tarefas, para acumular o custo das que estão na frente
+        self._clientes = {}
+        self._sequencia = 0
+        self._em_execucao = {}
+        self._limites = limites_modelo
+        self._estimar_custo = estimar_custo
+        self._envelhecimento = envelhecimento
+        self._peso_prioridade = peso_prioridade
+
+    def _pode_executar(self, tarefa, tipo_dispositivo):
+        if tarefa is None:
+            return True
+        if tarefa["dispositivo"] != tipo_dispositivo:
+            return False
+        if "trecho" in tarefa:
+            return True
+        limite = self._limites.get(tarefa["modelo"])
+        return limite is None or self._em_execucao.get(tarefa["modelo"], 0) < limite
+
+    def _entrada(self, tarefa, frente=False):
+        self._sequencia += 1
+        sequencia = -self._sequencia if frente else self._sequencia
+        if tarefa is None:
+            return [float('inf'), sequencia, None, 0.0, 0.0, 0.0]
+        if "trecho" in tarefa:
+            return [float('-inf'), sequencia, tarefa, 0.0, 0.0, 0.0]
+        custo = self._estimar_custo(tarefa)
+        deslocamento = self._envelhecimento * tarefa.get("enfileirado_em", time.time()) - self._peso_prioridade * tarefa.get("prioridade", 0)
+        return [custo + deslocamento, sequencia, tarefa, custo, custo + deslocamento, deslocamento]
+
+    def _acumular(self, cliente):
+        """Recalcula as pontuações de um cliente: as tarefas mais baratas passam na frente e acumulam o custo."""
+        entradas = self._clientes.get(cliente)
+        if not entradas:
+            self._clientes.pop(cliente, None)
+            return
+        entradas.sort(key=lambda entrada: (entrada[4], entrada[1]))
+        acumulado = 0.0
+        for entrada in entradas:
+            acumulado += entrada[3]
+            entrada[0] = acumulado + entrada[5]
+
+    def _ordenar(self):
+        # A lista já está quase ordenada; o timsort só reposiciona as entradas que mudaram
+        self._ordem.sort(key=lambda entrada: (entrada[0], entrada[1]))
+
+    def _inserir(self, tarefa, frente=False):
+        entrada = self._entrada(tarefa, frente)
+        if tarefa is not None and "trecho" not in tarefa:
+            self._clientes.setdefault(tarefa.get("cliente"), []).append(entrada)
+            self._acumular(tarefa.get("cliente"))
+        self._ordem.append(entrada)
+        self._ordenar()
+
+    def _retirar(self, entrada):
+        """Tira uma entrada da fila e retorna a tarefa."""
+        for posicao, atual in enumerate(self._ordem):
+            if atual is entrada:
+                del self._ordem[posicao]
+                break
+        tarefa = entrada[2]
+        if tarefa is not None and "trecho" not in tarefa:
+            cliente = tarefa.get("cliente")
+            self._clientes[cliente] = [atual for atual in self._clientes[cliente] if atual is not entrada]
+            self._acumular(cliente)
+            self._ordenar()
+        return tarefa
+
+    def reordenar(self):
+        """Estima de novo o custo de todas as tarefas, depois de uma mudança nos fatores de tempo real."""
+        with self._condicao:
+            for entrada in self._ordem:
+                tarefa = entrada[2]
+                if tarefa is not None and "trecho" not in tarefa:
+                    entrada[3] = self._estimar_custo(tarefa)
+                    entrada[4] = entrada[3] + entrada[5]
+            for cliente in list(self._clientes):
+                self._acumular(cliente)
+            self._ordenar()
+
+    def put(self, tarefa):
+        with self._condicao:
+            self._inserir(tarefa, frente=tarefa is not None and "trecho" in tarefa)
+            self._condicao.notify_all()
+
+    def get(self, tipo_dispositivo):
+        """Bloqueia até haver uma tarefa que este worker possa executar e retorna a de menor pontuação."""
+        with self._condicao:
+            while True:
+                entrada = next((entrada for entrada in self._ordem if self._pode_executar(entrada[2], tipo_dispositivo)), None)
+                if entrada is not None:
+                    tarefa = self._retirar(entrada)
+                    if tarefa is not None and "trecho" not in tarefa:
+                        self._em_execucao[tarefa["modelo"]] = self._em_execucao.get(tarefa["modelo"], 0) + 1
+                    return tarefa
+                self._condicao.wait()
+
+    def previsao(self, tarefa_id, workers_por_tipo):
+        """Retorna a posição de uma tarefa na fila do seu tipo de dispositivo e a espera estimada em segundos.
+
+        A espera é o custo estimado das tarefas na frente dela dividido pelo
+        número de workers do tipo de dispositivo; o tempo restante das tarefas
+        já em execução não entra na conta. Retorna None se a tarefa não está na fila.
+        """
+        with self._condicao:
+            alvo = next((tarefa for _, _, tarefa, *_ in self._ordem
+                         if tarefa is not None and "trecho" not in tarefa and tarefa["id"] == tarefa_id), None)
+            if alvo is None:
+                return None
+            posicao = 1
+            custo_a_frente = 0.0
+            for _, _, tarefa, custo, *_ in self._ordem:
+                if tarefa is alvo:
+                    break
+                if tarefa is not None and tarefa["dispositivo"] == alvo["dispositivo"]:
+                    custo_a_frente += custo
+                    if "trecho" not in tarefa:
+                        posicao += 1
+        return posicao, custo_a_frente / max(1, workers_por_tipo.get(alvo["dispositivo"], 1))
+
+    @staticmethod
+    def _mesmo_lote(tarefa, referencia):
+        return (
+            tarefa is not None
+            and "trecho" not in tarefa
+            and cabe_em_lote(tarefa)
+            and all(tarefa[campo] == referencia[campo] for campo in ("modelo", "tarefa", "idioma", "dispositivo"))
+            and tarefa.get("perfil") == referencia.get("perfil")
+            and tarefa.get("quantizacao") == referencia.get("quantizacao")
+            and not tarefa.get("cascata")
+        )
+
+    def obter_compativeis(self, referencia, maximo, espera, ajustar=None):
+        """Retira da fila até `maximo` tarefas que podem ser decodificadas em lote com a referência.
+
+        Espera até `espera` segundos por novas tarefas enquanto o lote não está
+        completo. As tarefas retiradas são marcadas com "em_lote" e executam na
+        vaga da referência, sem contar no limite do modelo. Se a referência foi
+        ajustada pela política de carga, `ajustar` aplica o mesmo ajuste às
+        candidatas antes da comparação.
+        """
+        lote = []
+        prazo = time.time() + espera
+        with self._condicao:
+            while len(lote) < maximo:
+                for entrada in list(self._ordem):
+                    tarefa = entrada[2]
+                    if self._mesmo_lote(ajustar(tarefa) if ajustar and tarefa is not None else tarefa, referencia):
+                        self._retirar(entrada)
+                        tarefa["em_lote"] = True
+                        lote.append(tarefa)
+                        if len(lote) >= maximo:
+                            break
+                restante = prazo - time.time()
+                if len(lote) >= maximo or restante <= 0:
+                    break
+                self._condicao.wait(restante)
+        return lote
+
+    def arrendar(self, tipo_dispositivo, afinidade, espera=0, janela_afinidade=8):
+        """Retira uma tarefa para um nó remoto, ou retorna None se nenhuma aparecer em `espera` segundos.
+
+        Entre as `janela_afinidade` próximas tarefas do tipo de dispositivo do
+        nó, sai a primeira para a qual `afinidade(tarefa)` é verdadeira (o
+        modelo já está carregado no nó) ou, se nenhuma, a próxima da fila.
+        Trechos de áudios longos e tarefas em cascata ficam para os workers
+        locais, e as tarefas arrendadas não contam no limite do modelo.
+        """
+        prazo = time.time() + espera
+        with self._condicao:
+            while True:
+                candidatas = [
+                    entrada for entrada in self._ordem
+                    if entrada[2] is not None
+                    and "trecho" not in entrada[2]
+                    and not entrada[2].get("cascata")
+                    and entrada[2]["dispositivo"] == tipo_dispositivo
+                ][:janela_afinidade]
+                if candidatas:
+                    escolhida = next((entrada for entrada in candidatas if afinidade(entrada[2])), candidatas[0])
+                    return self._retirar(escolhida)
+                restante = prazo - time.time()
+                if restante <= 0:
+                    return None
+                self._condicao.wait(restante)
+
+    def devolver(self, tarefa):
+        """Devolve ao início da fila uma tarefa retirada para um lote mas que não cabe nele."""
+        with self._condicao:
+            tarefa.pop("em_lote", None)
+            self._inserir(tarefa, frente=True)
+            self._condicao.notify_all()
+
+    def task_done(self, tarefa):
+        with self._condicao:
+            if "trecho" not in tarefa and not tarefa.get("em_lote"):
+                self._em_execucao[tarefa["modelo"]] -= 1
+            self._condicao.notify_all()
+
+    def espera_maxima(self):
+        """Segundos de espera da tarefa mais antiga da fila, sem os trechos de áudios longos (0 se vazia)."""
+        with self._condicao:
+            agora = time.time()
+            return max((agora - tarefa.get("enfileirado_em", agora) for _, _, tarefa, *_ in self._ordem
+                        if tarefa is not None and "trecho" not in tarefa), default=0.0)
+
+    def qsize(self):
+        with self._condicao:
+            return len(self._ordem)
+
+    def profundidade(self):
+        """Conta as tarefas esperando na fila por modelo, sem os trechos de áudios longos."""
+        with self._condicao:
+            contagem = {}
+            for _, _, tarefa, *_ in self._ordem:
+                if tarefa is not None and "trecho" not in tarefa:
+                    contagem[tarefa["modelo"]] = contagem.get(tarefa["modelo"], 0) + 1
+            return contagem
 
-# Dicionário para armazenar os modelos carregados
-modelos_carregados = {}
+# Fila de tarefas (o custo é estimado com os fatores de tempo real medidos, definidos mais abaixo)
+tarefas_fila = FilaTarefas(
+    LIMITES_MODELO,
+    lambda tarefa: estimar_custo(tarefa),
+    envelhecimento=FILA_ENVELHECIMENTO,
+    peso_prioridade=PRIORIDADE_SEGUNDOS
+)
 
-# Fila de tarefas
-tarefas_fila = queue.Queue()
+class PoliticaCarga:
+    """Rebaixa o perfil e o modelo das tarefas enquanto a fila está atrasada.
+
+    Quando a tarefa mais antiga da fila espera mais que `slo` segundos, o nível
+    sobe: no nível 1 as tarefas saem com o perfil de decodificação um passo
+    mais rápido e no nível 2 também com um modelo menor. Quando a espera cai
+    abaixo da metade do SLO, o nível desce. O nível muda no máximo uma vez a
+    cada `intervalo` segundos, para dar tempo de a fila reagir.
+    """
+
+    NIVEL_MAXIMO = 2
+
+    def __init__(self, slo, medir_espera, intervalo=30):
+        self.slo = slo
+        self.medir_espera = medir_espera
+        self.intervalo = intervalo
+        self.nivel = 0
+        self._mudou_em = 0.0
+        self._lock = threading.Lock()
+
+    def avaliar(self):
+        """Atualiza o nível pela espera atual da fila e o retorna."""
+        if self.slo <= 0:
+            return 0
+        with self._lock:
+            agora = time.time()
+            if agora - self._mudou_em >= self.intervalo:
+                espera = self.medir_espera()
+                novo = self.nivel
+                if espera > self.slo and self.nivel < self.NIVEL_MAXIMO:
+                    novo = self.nivel + 1
+                elif espera < self.slo / 2 and self.nivel > 0:
+                    novo = self.nivel - 1
+                if novo != self.nivel:
+                    print(f"Política de carga: nível {self.nivel} -> {novo} (espera de {espera:.0f} s, SLO de {self.slo:.0f} s)")
+                    self.nivel = novo
+                    self._mudou_em = agora
+            return self.nivel
+
+# Rebaixamento das tarefas quando a fila passa do SLO de espera
+politica_carga = PoliticaCarga(SLO_ESPERA_SEGUNDOS, tarefas_fila.espera_maxima, POLITICA_INTERVALO_SEGUNDOS)
+
+class CoordenadorNos:
+    """Arrendamentos de tarefas a nós remotos e os nós vistos recentemente.
+
+    Um arrendamento guarda o item da fila entregue a um nó e vence se o nó não
+    o renovar dentro de `duracao` segundos. Cada nó informa, ao pedir tarefas e
+    ao renovar, o tipo de dispositivo e os modelos que tem carregados.
+    """
+
+    def __init__(self, duracao, inatividade=300):
+        self.duracao = duracao
+        self.inatividade = inatividade
+        self._lock = threading.Lock()
+        self._arrendamentos = {}
+        self._nos = {}
+
+    def _registrar_no(self, no, dispositivo=None, modelos=None):
+        registro = self._nos.setdefault(no, {"dispositivo": dispositivo, "modelos": [], "arrendamentos": 0})
+        if dispositivo is not None:
+            registro["dispositivo"] = dispositivo
+        if modelos is not None:
+            registro["modelos"] = list(modelos)
+        registro["visto_em"] = time.time()
+
+    def registrar(self, no, dispositivo, modelos, item):
+        """Registra a entrega de um item a um nó e retorna o ID do arrendamento."""
+        arrendamento_id = str(uuid.uuid4())
+        with self._lock:
+            self._registrar_no(no, dispositivo, modelos)
+            self._nos[no]["arrendamentos"] += 1
+            self._arrendamentos[arrendamento_id] = {
+                "item": item,
+                "no": no,
+                "inicio": time.time(),
+                "expira_em": time.time() + self.duracao
+            }
+        return arrendamento_id
+
+    def visto(self, no, dispositivo, modelos):
+        with self._lock:
+            self._registrar_no(no, dispositivo, modelos)
+
+    def item(self, arrendamento_id, no):
+        """Retorna o item de um arrendamento vigente do nó, ou None."""
+        with self._lock:
+            arrendamento = self._arrendamentos.get(arrendamento_id)
+            return arrendamento["item"] if arrendamento is not None and arrendamento["no"] == no else None
+
+    def renovar(self, arrendamento_id, no, modelos=None):
+        """Estende o prazo de um arrendamento vigente. Retorna o item, ou None se ele foi perdido."""
+        with self._lock:
+            arrendamento = self._arrendamentos.get(arrendamento_id)
+            if arrendamento is None or arrendamento["no"] != no:
+                return None
+            arrendamento["expira_em"] = time.time() + self.duracao
+            self._registrar_no(no, modelos=modelos)
+            return arrendamento["item"]
+
+    def encerrar(self, arrendamento_id, no):
+        """Encerra um arrendamento vigente e retorna o item, ou None se ele foi perdido."""
+        with self._lock:
+            arrendamento = self._arrendamentos.get(arrendamento_id)
+            if arrendamento is None or arrendamento["no"] != no:
+                return None
+            del self._arrendamentos[arrendamento_id]
+            self._nos[no]["arrendamentos"] -= 1
+            return arrendamento["item"]
+
+    def vencidos(self):
+        """Retira os arrendamentos vencidos e retorna (ID, item, nó) de cada um."""
+        agora = time.time()
+        with self._lock:
+            vencidos = [(arrendamento_id, arrendamento["item"], arrendamento["no"])
+                        for arrendamento_id, arrendamento in self._arrendamentos.items()
+                        if arrendamento["expira_em"] < agora]
+            for arrendamento_id, _, no in vencidos:
+                del self._arrendamentos[arrendamento_id]
+                self._nos[no]["arrendamentos"] -= 1
+        return vencidos
+
+    def dispositivos_ativos(self):
+        """Tipo de dispositivo de cada nó visto nos últimos `inatividade` segundos."""
+        limite = time.time() - self.inatividade
+        with self._lock:
+            return [registro["dispositivo"] for registro in self._nos.values()
+                    if registro["visto_em"] >= limite and registro["dispositivo"]]
+
+    def estado(self):
+        agora = time.time()
+        with self._lock:
+            return {
+                "arrendamento_segundos": self.duracao,
+                "nos": [
+                    {
+                        "no": no,
+                        "dispositivo": registro["dispositivo"],
+                        "modelos": registro["modelos"],
+                        "arrendamentos": registro["arrendamentos"],
+                        "visto_ha_segundos": round(agora - registro["visto_em"], 1)
+                    }
+                    for no, registro in sorted(self._nos.items())
+                    if agora - registro["visto_em"] < self.inatividade or registro["arrendamentos"]
+                ],
+                "arrendamentos": [
+                    {
+                        "arrendamento": arrendamento_id,
+                        "tarefa_id": arrendamento["item"]["id"],
+                        "no": arrendamento["no"],
+                        "decorrido_segundos": round(agora - arrendamento["inicio"], 1),
+                        "expira_em_segundos": round(arrendamento["expira_em"] - agora, 1)
+                    }
+                    for arrendamento_id, arrendamento in self._arrendamentos.items()
+                ]
+            }
+
+# Tarefas entregues aos nós remotos
+coordenador_nos = CoordenadorNos(ARRENDAMENTO_SEGUNDOS)
 
 # Dicionário para armazenar o status das tarefas
 tarefas_status = {}
 
-# Função para carregar tarefas do arquivo
-def carregar_tarefas():
-    global tarefas_status
-    try:
-        if os.path.exists(TAREFAS_ARQUIVO):
-            with open(TAREFAS_ARQUIVO, 'r', encoding='utf-8') as f:
-                tarefas_status = json.load(f)
-                print(f"Carregadas {len(tarefas_status)} tarefas do arquivo.")
+# Remessas (envios de vários arquivos de uma vez): ID da remessa -> IDs das tarefas, na ordem de envio
+remessas = {}
+
+# Protege tarefas_status, que é lido pelas rotas e alterado por vários workers
+tarefas_lock = threading.RLock()
+
+# Notificada a cada alteração de tarefa, para as consultas de status com espera
+tarefas_alteradas = threading.Condition(tarefas_lock)
+
+# Status em que a tarefa não muda mais
+STATUS_FINAIS = ("concluido", "erro")
+
+class CanalEventos:
+    """Distribui os eventos das tarefas para os clientes conectados em /eventos.
+
+    Cada cliente recebe uma fila própria. Os segmentos já transcritos de uma
+    tarefa em andamento ficam guardados para quem se conectar depois.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = {}
+        self._segmentos = {}
+
+    def assinar(self, tarefa_id):
+        """Registra um cliente e retorna a fila de eventos e os segmentos já publicados."""
+        fila = queue.Queue()
+        with self._lock:
+            self._assinantes.setdefault(tarefa_id, set()).add(fila)
+            return fila, list(self._segmentos.get(tarefa_id, []))
+
+    def cancelar(self, tarefa_id, fila):
+        with self._lock:
+            assinantes = self._assinantes.get(tarefa_id)
+            if assinantes is not None:
+                assinantes.discard(fila)
+                if not assinantes:
+                    del self._assinantes[tarefa_id]
+
+    def segmentos(self, tarefa_id, desde=0):
+        """Retorna os segmentos já publicados de uma tarefa em andamento, a partir do índice `desde`."""
+        with self._lock:
+            return list(self._segmentos.get(tarefa_id, [])[desde:])
+
+    def publicar(self, tarefa_id, tipo, dados):
+        with self._lock:
+            if tipo == "segmento":
+                self._segmentos.setdefault(tarefa_id, []).append(dados)
+            elif tipo == "status" and dados["status"] in STATUS_FINAIS:
+                self._segmentos.pop(tarefa_id, None)
+            for fila in self._assinantes.get(tarefa_id, ()):
+                fila.put((tipo, dados))
+
+# Eventos das tarefas, consumidos pelo endpoint /eventos
+canal_eventos = CanalEventos()
+
+# Armazenamento persistente das tarefas
+armazenamento_tarefas = criar_armazenamento(ARMAZENAMENTO_TIPO, DADOS_DIR)
+
+# Função para carregar tarefas do armazenamento
+def carregar_tarefas():
+    global tarefas_status
+    try:
+        tarefas_status = armazenamento_tarefas.carregar()
+        if not tarefas_status and os.path.exists(TAREFAS_ARQUIVO):
+            total = importar_json(armazenamento_tarefas, TAREFAS_ARQUIVO)
+            print(f"Importadas {total} tarefas de {TAREFAS_ARQUIVO}.")
+            tarefas_status = armazenamento_tarefas.carregar()
+        print(f"Carregadas {len(tarefas_status)} tarefas do armazenamento ({ARMAZENAMENTO_TIPO}).")
+    except Exception as e:
+        print(f"Erro ao carregar tarefas: {str(e)}")
+        tarefas_status = {}
+    for tarefa_id, tarefa in sorted(tarefas_status.items(), key=lambda item: item[1].get("data_criacao") or ""):
+        if tarefa.get("remessa_id"):
+            remessas.setdefault(tarefa["remessa_id"], []).append(tarefa_id)
+
+# Versão do conjunto de tarefas, incrementada a cada gravação, e o momento da
+# última alteração: usados como ETag e Last-Modified da listagem de tarefas.
+# O contador recomeça do zero a cada inicialização, por isso a ETag leva
+# também um identificador do processo, para não repetir a de antes do reinício
+versao_tarefas = 0
+id_inicializacao = uuid.uuid4().hex[:12]
+tarefas_alteradas_em = time.time()
+
+# Função para salvar uma tarefa no armazenamento
+def salvar_tarefa(tarefa):
+    global versao_tarefas, tarefas_alteradas_em
+    try:
+        with tarefas_lock:
+            armazenamento_tarefas.salvar(tarefa)
+            versao_tarefas += 1
+            tarefas_alteradas_em = time.time()
+    except Exception as e:
+        print(f"Erro ao salvar tarefa {tarefa['id']}: {str(e)}")
+
+def atualizar_tarefa(tarefa_id, **campos):
+    """Atualiza campos de uma tarefa e salva o status, de forma segura entre threads.
+
+    No papel 'api' as tarefas não ficam na memória: a tarefa é lida do armazenamento.
+    """
+    with tarefas_lock:
+        tarefa = tarefas_status[tarefa_id] if PAPEL != "api" else armazenamento_tarefas.obter(tarefa_id)
+        if tarefa is None:
+            raise KeyError(tarefa_id)
+        tarefa.update(campos)
+        tarefa["versao"] = tarefa.get("versao", 0) + 1
+        tarefa["atualizado_em"] = datetime.now().isoformat()
+        salvar_tarefa(tarefa)
+        canal_eventos.publicar(tarefa_id, "status", dict(tarefa))
+        tarefas_alteradas.notify_all()
+
+def publicar_segmentos(tarefa_id, segmentos):
+    """Envia segmentos recém-transcritos aos clientes que acompanham a tarefa.
+
+    Nas tarefas com VAD, os tempos são convertidos do áudio só com a fala para o original.
+    """
+    mapa_fala = mapas_fala.get(tarefa_id)
+    if mapa_fala is not None:
+        segmentos = voz.remapear_segmentos(segmentos, mapa_fala)
+    for segmento in segmentos:
+        canal_eventos.publicar(tarefa_id, "segmento", {
+            "start": segmento["start"],
+            "end": segmento["end"],
+            "text": segmento["text"]
+        })
+
+def ler_tarefas(ids):
+    """Retorna cópias das tarefas com os IDs informados que ainda existem, na mesma ordem."""
+    if PAPEL == "api":
+        return list(filter(None, (armazenamento_tarefas.obter(tarefa_id) for tarefa_id in ids)))
+    with tarefas_lock:
+        return [dict(tarefas_status[tarefa_id]) for tarefa_id in ids if tarefa_id in tarefas_status]
+
+def copiar_tarefa(tarefa_id):
+    """Retorna uma cópia da tarefa, ou None se ela não existir."""
+    if PAPEL == "api":
+        return armazenamento_tarefas.obter(tarefa_id)
+    with tarefas_lock:
+        tarefa = tarefas_status.get(tarefa_id)
+        return dict(tarefa) if tarefa is not None else None
+
+# Carrega as tarefas ao iniciar; no papel 'api' elas são lidas do armazenamento a cada consulta
+if PAPEL != "api":
+    carregar_tarefas()
+
+def modelo_execucao(tarefa, nome_modelo=None):
+    """Nome do modelo no cache de modelos: o modelo da tarefa (ou `nome_modelo`), com '+int8' se quantizado."""
+    nome_modelo = nome_modelo or tarefa["modelo"]
+    if tarefa.get("quantizacao") == "int8":
+        return f"{nome_modelo}+int8"
+    return nome_modelo
+
+def chave_desempenho(tarefa):
+    """Chave do fator de tempo real e das métricas: o modelo executado, o perfil (se não for
+    o 'equilibrado') e o rascunho da cascata."""
+    chave = modelo_execucao(tarefa)
+    if tarefa.get("perfil", "equilibrado") != "equilibrado":
+        chave += f":{tarefa['perfil']}"
+    if tarefa.get("cascata"):
+        chave += f"/{tarefa['cascata']}"
+    return chave
+
+def _carregar_pesos(nome_modelo, dispositivo):
+    """Carrega um modelo Whisper do disco para o dispositivo.
+
+    Nomes terminados em '+int8' carregam o modelo em float32 e o quantizam.
+    """
+    print(f"Carregando modelo {nome_modelo} em {dispositivo}...")
+    nome_base, _, quantizacao = nome_modelo.partition('+')
+    # Atualiza o status de todas as tarefas que estão esperando por este modelo
+    with tarefas_lock:
+        for tarefa_id in armazenamento_tarefas.listar(status="processando"):
+            if tarefas_status[tarefa_id]["modelo"] == nome_base:
+                atualizar_tarefa(tarefa_id, status="carregando_modelo")
+                print(f"Atualizando status da tarefa {tarefa_id} para 'carregando_modelo'")
+
+    # Carrega o modelo
+    inicio_carregamento = time.time()
+    modelo = pesos.carregar_convertido(nome_base, dispositivo, PESOS_DIR)
+    if modelo is None:
+        modelo = whisper.load_model(nome_base, device=dispositivo)
+    if quantizacao == "int8":
+        modelo = pesos.quantizar_int8(modelo)
+    tempo_carregamento = time.time() - inicio_carregamento
+    metrica_carregamento.observar(tempo_carregamento, modelo=nome_modelo, dispositivo=dispositivo)
+
+    print(f"Modelo {nome_modelo} carregado em {dispositivo} em {tempo_carregamento:.2f} segundos")
+
+    # Atualiza novamente o status das tarefas
+    with tarefas_lock:
+        for tarefa_id in armazenamento_tarefas.listar(status="carregando_modelo"):
+            if tarefas_status[tarefa_id]["modelo"] == nome_base:
+                atualizar_tarefa(tarefa_id, status="processando")
+                print(f"Atualizando status da tarefa {tarefa_id} para 'processando'")
+
+    return modelo
+
+# Modelos carregados, com orçamento de memória e descarte LRU
+modelos_carregados = GerenciadorModelos(_carregar_pesos, orcamento_memoria_mb)
+
+def carregar_modelo(nome_modelo, dispositivo="cpu"):
+    """Obtém uma instância do modelo Whisper no dispositivo, carregando-a se necessário.
+
+    A instância fica reservada para quem a pediu até ser devolvida com liberar_modelo.
+    """
+    return modelos_carregados.obter(nome_modelo, dispositivo)
+
+def liberar_modelo(nome_modelo, dispositivo, modelo):
+    """Devolve uma instância obtida com carregar_modelo para reutilização."""
+    modelos_carregados.liberar(nome_modelo, dispositivo, modelo)
+
+def dispositivos_workers():
+    """Lista os dispositivos do pool: NUM_WORKERS_CPU slots de CPU e um slot por GPU."""
+    dispositivos = ["cpu"] * NUM_WORKERS_CPU
+    if torch.cuda.is_available():
+        dispositivos += [f"cuda:{indice}" for indice in range(torch.cuda.device_count())]
+    return dispositivos
+
+def threads_por_worker():
+    """Threads de cada worker de CPU: WHISPER_THREADS_POR_WORKER ou os núcleos divididos entre os workers."""
+    if THREADS_POR_WORKER > 0:
+        return THREADS_POR_WORKER
+    return max(1, (os.cpu_count() or 1) // max(1, NUM_WORKERS_CPU))
+
+def workers_por_tipo():
+    """Conta os workers do pool e os nós remotos ativos por tipo de dispositivo (cpu, cuda)."""
+    contagem = {}
+    for dispositivo in dispositivos_workers() + coordenador_nos.dispositivos_ativos():
+        tipo = dispositivo.split(':')[0]
+        contagem[tipo] = contagem.get(tipo, 0) + 1
+    return contagem
+
+# Cache de transcrições, endereçado pelo hash do áudio e pelos parâmetros
+cache_transcricoes = CacheTranscricoes(os.path.join(DADOS_DIR, 'cache_transcricoes'), CACHE_TRANSCRICOES_MB * 1024 * 1024)
+
+# Cache do áudio decodificado, endereçado pelo hash do arquivo enviado
+cache_pcm = CacheAudioPCM(os.path.join(DADOS_DIR, 'cache_pcm'), CACHE_PCM_MB * 1024 * 1024)
+
+def estado_caches():
+    """Estado do cache de transcrições, com o do cache de áudio decodificado em `pcm`."""
+    return dict(cache_transcricoes.estado(), pcm=cache_pcm.estado())
+
+# Métricas expostas em /metrics no formato do Prometheus
+metricas = RegistroMetricas()
+
+# Estado de cada worker do pool: nome da thread -> ocupado
+estado_workers = {}
+
+metrica_tarefas = metricas.contador(
+    "whisper_tarefas_finalizadas_total",
+    "Tarefas finalizadas, por resultado (concluido, cache ou erro).",
+    ("resultado",)
+)
+metrica_espera_fila = metricas.histograma(
+    "whisper_espera_fila_segundos",
+    "Tempo entre o envio da tarefa e o início do processamento.",
+    ("modelo",)
+)
+metrica_carregamento = metricas.histograma(
+    "whisper_carregamento_modelo_segundos",
+    "Tempo para carregar os pesos de um modelo do disco para o dispositivo.",
+    ("modelo", "dispositivo")
+)
+metrica_transcricao = metricas.histograma(
+    "whisper_transcricao_segundos",
+    "Tempo de inferência de cada tarefa.",
+    ("modelo", "dispositivo")
+)
+metrica_audio = metricas.contador(
+    "whisper_audio_transcrito_segundos_total",
+    "Segundos de áudio transcritos.",
+    ("modelo", "dispositivo")
+)
+metrica_inferencia = metricas.contador(
+    "whisper_inferencia_segundos_total",
+    "Segundos gastos em inferência; a razão com whisper_audio_transcrito_segundos_total dá o fator de tempo real.",
+    ("modelo", "dispositivo")
+)
+metrica_arrendamentos = metricas.contador(
+    "whisper_arrendamentos_total",
+    "Tarefas arrendadas a nós remotos e como terminaram (arrendado, concluido, erro ou vencido).",
+    ("evento",)
+)
+metrica_tarefas_removidas = metricas.contador(
+    "whisper_tarefas_removidas_total",
+    "Tarefas finalizadas apagadas pela limpeza, por motivo (vencida, excesso ou sem_resultado).",
+    ("motivo",)
+)
+metricas.coletor(
+    "whisper_fila_tarefas",
+    "Tarefas esperando na fila, por modelo.",
+    "gauge",
+    lambda: [({"modelo": modelo}, quantidade) for modelo, quantidade in tarefas_fila.profundidade().items()]
+)
+metricas.coletor(
+    "whisper_politica_carga_nivel",
+    "Nível da política de carga: 0 normal, 1 perfil rebaixado, 2 perfil e modelo rebaixados.",
+    "gauge",
+    lambda: [({}, politica_carga.nivel)]
+)
+metricas.coletor(
+    "whisper_audio_segundos_por_segundo",
+    "Média móvel de segundos de áudio transcritos por segundo de processamento.",
+    "gauge",
+    lambda: [
+        ({"modelo": chave.split('@')[0], "dispositivo": chave.split('@')[1]}, 1 / fator)
+        for chave, fator in dict(fatores_tempo_real).items() if fator > 0
+    ]
+)
+metricas.coletor(
+    "whisper_modelo_memoria_bytes",
+    "Memória estimada de cada modelo carregado.",
+    "gauge",
+    lambda: [
+        ({"modelo": m["modelo"], "dispositivo": m["dispositivo"]}, m["memoria_mb"] * 1024 * 1024)
+        for m in modelos_carregados.estado()["modelos"]
+    ]
+)
+metricas.coletor(
+    "whisper_modelo_instancias",
+    "Instâncias de cada modelo carregado, em uso ou livres.",
+    "gauge",
+    lambda: [
+        ({"modelo": m["modelo"], "dispositivo": m["dispositivo"], "estado": estado}, quantidade)
+        for m in modelos_carregados.estado()["modelos"]
+        for estado, quantidade in (("em_uso", m["em_uso"]), ("livre", m["instancias"] - m["em_uso"]))
+    ]
+)
+metricas.coletor(
+    "whisper_modelos_orcamento_bytes",
+    "Orçamento de memória para modelos em cada dispositivo em uso.",
+    "gauge",
+    lambda: [
+        ({"dispositivo": dispositivo}, uso["orcamento_mb"] * 1024 * 1024)
+        for dispositivo, uso in modelos_carregados.estado()["dispositivos"].items()
+    ]
+)
+metricas.coletor(
+    "whisper_modelos_eventos_total",
+    "Pedidos de modelo atendidos com uma instância em memória, carregamentos e descartes.",
+    "counter",
+    lambda: [({"evento": evento}, valor) for evento, valor in modelos_carregados.estado()["contadores"].items()]
+)
+metricas.coletor(
+    "whisper_worker_ocupado",
+    "1 se o worker está processando uma tarefa, 0 se está ocioso.",
+    "gauge",
+    lambda: [
+        ({"worker": nome, "dispositivo": nome.split('#')[0]}, int(ocupado))
+        for nome, ocupado in sorted(estado_workers.items())
+    ]
+)
+metricas.coletor(
+    "whisper_cache_transcricoes_total",
+    "Consultas ao cache de transcrições (acertos e faltas) e entradas descartadas.",
+    "counter",
+    lambda: [({"evento": evento}, valor) for evento, valor in dict(cache_transcricoes.contadores).items()]
+)
+metricas.coletor(
+    "whisper_cache_transcricoes_bytes",
+    "Tamanho do cache de transcrições em disco.",
+    "gauge",
+    lambda: [({}, cache_transcricoes.estado()["tamanho_bytes"])]
+)
+metricas.coletor(
+    "whisper_cache_pcm_total",
+    "Pedidos ao cache de áudio decodificado (acertos e faltas) e entradas descartadas.",
+    "counter",
+    lambda: [({"evento": evento}, valor) for evento, valor in dict(cache_pcm.contadores).items()]
+)
+metricas.coletor(
+    "whisper_cache_pcm_bytes",
+    "Tamanho do cache de áudio decodificado em disco.",
+    "gauge",
+    lambda: [({}, cache_pcm.estado()["tamanho_bytes"])]
+)
+
+class UploadAudio(io.FileIO):
+    """Arquivo enviado, gravado direto no diretório da tarefa (em uploads/) enquanto o multipart é lido.
+
+    O SHA-256 é calculado durante a gravação, sem reler o arquivo. Uploads que
+    nenhuma rota adotou (com `receber_upload`) são apagados ao fim da requisição.
+    """
+
+    def __init__(self, nome_arquivo):
+        self.temp_dir = tempfile.mkdtemp(dir=UPLOADS_DIR)
+        self.caminho = os.path.join(self.temp_dir, secure_filename(nome_arquivo or '') or 'audio')
+        super().__init__(self.caminho, 'w+')
+        self.hash_audio = hashlib.sha256()
+        self.adotado = False
+
+    def write(self, dados):
+        escritos = super().write(dados)
+        self.hash_audio.update(memoryview(dados)[:escritos])
+        return escritos
+
+class RequisicaoWhisper(Request):
+    """Requisição que grava os arquivos enviados como `UploadAudio`, sem cópia intermediária."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Agrupa as escritas do parser em blocos de tamanho fixo
+        arquivo = io.BufferedRandom(UploadAudio(filename), TAMANHO_BLOCO_UPLOAD)
+        if not hasattr(self, 'uploads'):
+            self.uploads = []
+        self.uploads.append(arquivo)
+        return arquivo
+
+app.request_class = RequisicaoWhisper
+
+@app.teardown_request
+def descartar_uploads(erro=None):
+    """Fecha os uploads da requisição e apaga os que não viraram tarefa (parâmetros inválidos, erros)."""
+    for arquivo in getattr(request, 'uploads', []):
+        arquivo.close()
+        if not arquivo.raw.adotado:
+            shutil.rmtree(arquivo.raw.temp_dir, ignore_errors=True)
+
+@app.errorhandler(413)
+def upload_grande_demais(erro):
+    return jsonify({"erro": f"Arquivo maior que o limite de {UPLOAD_MAXIMO_MB} MB"}), 413
+
+def receber_upload(arquivo):
+    """Assume um arquivo enviado para uma tarefa. Retorna o caminho, o diretório temporário e o hash."""
+    arquivo.stream.close()
+    upload = arquivo.stream.raw
+    upload.adotado = True
+    return upload.caminho, upload.temp_dir, upload.hash_audio.hexdigest()
+
+def parametros_transcricao(tarefa):
+    """Parâmetros da tarefa que mudam o resultado do Whisper."""
+    parametros = [
+        modelo_execucao(tarefa),
+        tarefa["idioma"],
+        "translate" if tarefa["tarefa"] == "traducao" else "transcribe"
+    ]
+    if tarefa.get("cascata"):
+        parametros.append(f"cascata={tarefa['cascata']}:{CASCATA_LOGPROB_MINIMO}")
+    if tarefa.get("vad"):
+        parametros.append(f"vad={VAD_SILENCIO_SEGUNDOS}")
+    if tarefa.get("perfil", "equilibrado") != "equilibrado":
+        parametros.append(f"perfil={tarefa['perfil']}")
+    return parametros
+
+def chave_transcricao(tarefa):
+    """Monta a chave do cache: hash do áudio e parâmetros que mudam o resultado do Whisper."""
+    if not tarefa.get("hash_audio"):
+        return None
+    return hashlib.sha256("|".join([tarefa["hash_audio"]] + parametros_transcricao(tarefa)).encode('utf-8')).hexdigest()
+
+def chave_checkpoint(tarefa):
+    """Chave gravada nos checkpoints: o modelo e as opções com que a transcrição está sendo feita.
+
+    Depois de uma queda, a tarefa pode voltar com outro modelo ou perfil (a
+    política de carga decide de novo); os segmentos salvos só são retomados
+    se a chave for a mesma.
+    """
+    return "|".join(parametros_transcricao(tarefa))
+
+def calcular_progresso(segundos_decodificados, duracao):
+    """Converte o áudio já decodificado em progresso: a transcrição vai de 10% a 95%."""
+    if duracao <= 0:
+        return 10
+    return 10 + int(85 * min(1.0, segundos_decodificados / duracao))
+
+def resumir_janelas(tempos):
+    """Resume os tempos de decodificação das janelas de 30 s de uma tarefa."""
+    if not tempos:
+        return None
+    ordenados = sorted(tempos)
+    return {
+        "quantidade": len(ordenados),
+        "media": round(sum(ordenados) / len(ordenados), 3),
+        "p95": round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 3),
+        "maximo": round(ordenados[-1], 3)
+    }
+
+# Média móvel do fator de tempo real (segundos de processamento por segundo de
+# áudio) por modelo e tipo de dispositivo, para estimar a duração de tarefas
+fatores_tempo_real = {}
+fatores_lock = threading.Lock()
+
+def registrar_fator_tempo_real(modelo, tipo_dispositivo, fator):
+    chave = f"{modelo}@{tipo_dispositivo}"
+    with fatores_lock:
+        anterior = fatores_tempo_real.get(chave)
+        fatores_tempo_real[chave] = fator if anterior is None else 0.8 * anterior + 0.2 * fator
+    # O custo estimado das tarefas na fila mudou
+    tarefas_fila.reordenar()
+
+def estimar_custo(tarefa):
+    """Estima os segundos de processamento de uma tarefa pela duração do áudio e pelo fator de tempo real do modelo."""
+    duracao = tarefa.get("duracao_estimada") or DURACAO_PADRAO_SEGUNDOS
+    with fatores_lock:
+        fator = fatores_tempo_real.get(f"{chave_desempenho(tarefa)}@{tarefa['dispositivo']}")
+    return duracao * (fator if fator is not None else 1.0)
+
+def medir_duracao(caminho):
+    """Mede a duração de um arquivo de mídia com o ffprobe, sem decodificá-lo. Retorna None se não conseguir."""
+    try:
+        saida = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", caminho],
+            capture_output=True, text=True, timeout=30, check=True
+        ).stdout.strip()
+        return float(saida)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        print(f"Não foi possível medir a duração de {caminho}: {str(e)}")
+        return None
+
+def encontrar_cortes(fonte, duracao_trecho, janela_busca=20.0):
+    """Escolhe pontos de corte a cada `duracao_trecho` segundos, no ponto mais silencioso.
+
+    O corte é procurado até `janela_busca` segundos antes ou depois do ponto ideal,
+    usando a energia RMS em quadros de 100 ms. `fonte` é um AudioPCM (ou
+    AudioMemoria); cada corte é gerado assim que o áudio até o fim da sua
+    janela de busca foi decodificado. Gera os cortes em amostras, incluindo o
+    início e o fim do áudio.
+    """
+    quadro = whisper.audio.SAMPLE_RATE // 10
+    passo = int(duracao_trecho * 10)
+    busca = int(janela_busca * 10)
+    energia = np.zeros(0, dtype=np.float32)
+    cortes = [0]
+    yield 0
+    alvo = passo
+    while True:
+        # A suavização de 500 ms olha 2 quadros depois do fim da busca
+        disponiveis = fonte.aguardar((alvo + busca + 2) * quadro)
+        n_quadros = disponiveis // quadro
+        if n_quadros > len(energia):
+            novos = fonte.ler(len(energia) * quadro, n_quadros * quadro).reshape(-1, quadro)
+            energia = np.concatenate((energia, np.sqrt(np.mean(novos ** 2, axis=1))))
+        if fonte.total() is not None and alvo + busca >= n_quadros:
+            break
+        # Suaviza em 500 ms para preferir pausas a um único quadro baixo
+        suavizada = np.convolve(energia, np.ones(5) / 5, mode='same')
+        inicio = max(cortes[-1] // quadro + 1, alvo - busca)
+        melhor = inicio + int(np.argmin(suavizada[inicio:alvo + busca]))
+        cortes.append(melhor * quadro)
+        yield melhor * quadro
+        alvo = melhor + passo
+    yield fonte.total()
+
+class TranscricaoLonga:
+    """Transcrição de um áudio longo dividido em trechos processados em paralelo.
+
+    O worker dono da tarefa e os workers livres que recebem os itens de trecho
+    da fila reservam trechos até não sobrar nenhum. Os cortes chegam com
+    `acrescentar_corte` enquanto o áudio é decodificado, e cada trecho pode
+    ser reservado assim que o corte do seu fim é conhecido. Cada trecho é
+    estendido por `sobreposicao` segundos de cada lado para dar contexto ao
+    modelo nas bordas; na junção, cada segmento pertence ao trecho em que
+    começa, o que descarta os segmentos repetidos nas sobreposições.
+    """
+
+    def __init__(self, tarefa_id, fonte, opcoes, sobreposicao, concluidos=None, duracao_estimada=None):
+        self.tarefa_id = tarefa_id
+        self.fonte = fonte
+        self.opcoes = opcoes
+        self.cortes = [0]
+        self.sobreposicao = int(sobreposicao * whisper.audio.SAMPLE_RATE)
+        self.duracao_estimada = duracao_estimada
+        # Quantidade de trechos, conhecida quando o último corte chega
+        self.total = None
+        self._lock = threading.Condition()
+        # Trechos transcritos antes de uma queda, lidos dos checkpoints
+        self._salvos = concluidos or {}
+        self._pendentes = []
+        self._segmentos = []
+        self._decodificados = []
+        self.observadores = []
+        self._concluidos = 0
+        self._erro = None
+        self._fim = threading.Event()
+
+    def acrescentar_corte(self, corte):
+        """Acrescenta o fim do próximo trecho. Retorna True se o trecho ainda precisa ser transcrito."""
+        with self._lock:
+            indice = len(self.cortes) - 1
+            self.cortes.append(corte)
+            salvo = self._salvos.get(indice)
+            self._segmentos.append(salvo)
+            self._decodificados.append(0.0)
+            if salvo is not None:
+                self._concluidos += 1
+                return False
+            self._pendentes.append(indice)
+            self._lock.notify_all()
+            return True
+
+    def finalizar_cortes(self, erro=None):
+        """Indica que não há mais cortes; com `erro`, os trechos não reservados são abandonados."""
+        with self._lock:
+            if erro is not None:
+                if self._erro is None:
+                    self._erro = erro
+                self._concluidos += len(self._pendentes)
+                self._pendentes.clear()
+            self.total = len(self.cortes) - 1
+            if self._concluidos == self.total:
+                self._fim.set()
+            self._lock.notify_all()
+
+    def tem_pendentes(self):
+        with self._lock:
+            return bool(self._pendentes)
+
+    def pendentes(self):
+        """Quantidade de trechos ainda não reservados."""
+        with self._lock:
+            return len(self._pendentes)
+
+    def reservar(self, esperar=False):
+        """Reserva o próximo trecho ainda não transcrito, ou retorna None.
+
+        Com `esperar`, espera o próximo corte enquanto o áudio é decodificado.
+        """
+        with self._lock:
+            while esperar and not self._pendentes and self.total is None:
+                self._lock.wait()
+            return self._pendentes.pop(0) if self._pendentes else None
+
+    def transcrever_trecho(self, indice, modelo_whisper):
+        """Transcreve um trecho e guarda seus segmentos com os tempos do áudio inteiro."""
+        taxa = whisper.audio.SAMPLE_RATE
+        with self._lock:
+            corte_inicio, corte_fim = self.cortes[indice], self.cortes[indice + 1]
+        inicio = max(0, corte_inicio - self.sobreposicao)
+        fim = corte_fim + self.sobreposicao
+        deslocamento = inicio / taxa
+        limite_inicio = corte_inicio / taxa
+        limite_fim = corte_fim / taxa
+
+        observador = ObservadorTranscricao(lambda segundos, _: self._avancar(indice, segundos))
+        with self._lock:
+            self.observadores.append(observador)
+
+        segmentos = None
+        erro = None
+        try:
+            audio = self.fonte.ler(inicio, fim)
+            fim = inicio + len(audio)
+            with observar_transcricao(observador):
+                resultado = modelo_whisper.transcribe(audio, **self.opcoes)
+            segmentos = []
+            for segmento in resultado["segments"]:
+                segmento = dict(segmento, start=segmento["start"] + deslocamento, end=segmento["end"] + deslocamento)
+                if limite_inicio <= segmento["start"] < limite_fim:
+                    segmentos.append(segmento)
+            checkpoints_transcricao.salvar_trecho(self.tarefa_id, indice, segmentos)
+        except Exception as e:
+            erro = e
+
+        with self._lock:
+            self._segmentos[indice] = segmentos
+            self._concluidos += 1
+            if erro is not None and self._erro is None:
+                self._erro = erro
+            if self._concluidos == self.total:
+                self._fim.set()
+
+        if segmentos:
+            publicar_segmentos(self.tarefa_id, segmentos)
+        print(f"Tarefa {self.tarefa_id}: trecho {indice + 1}/{self.total or '?'} transcrito")
+        self._avancar(indice, (fim - inicio) / taxa)
+
+    def _avancar(self, indice, segundos):
+        """Atualiza o progresso da tarefa com o áudio decodificado em todos os trechos."""
+        with self._lock:
+            self._decodificados[indice] = segundos
+            decodificados = sum(self._decodificados)
+            trechos = len(self.cortes) - 1
+        # Enquanto o áudio é decodificado, a duração é a medida pelo ffprobe
+        amostras = self.fonte.total()
+        if amostras is None:
+            amostras = max(self.cortes[-1], int((self.duracao_estimada or 0) * whisper.audio.SAMPLE_RATE))
+        # Os trechos somam mais que o áudio por causa das sobreposições
+        total = (amostras + 2 * self.sobreposicao * max(0, trechos - 1)) / whisper.audio.SAMPLE_RATE
+        duracao = amostras / whisper.audio.SAMPLE_RATE
+        atualizar_tarefa(
+            self.tarefa_id,
+            progresso=calcular_progresso(decodificados, total),
+            segundos_decodificados=round(min(decodificados / total, 1.0) * duracao, 1) if total > 0 else 0.0
+        )
+
+    def juntar(self):
+        """Espera todos os trechos e monta um resultado no formato do transcribe do Whisper."""
+        self._fim.wait()
+        if self._erro is not None:
+            raise self._erro
+
+        segmentos = []
+        for segmentos_trecho in self._segmentos:
+            for segmento in segmentos_trecho:
+                segmentos.append(dict(segmento, id=len(segmentos)))
+        return {
+            "text": "".join(segmento["text"] for segmento in segmentos),
+            "segments": segmentos,
+            "language": self.opcoes.get("language")
+        }
+
+def transcrever_longo(tarefa, audio, modelo_whisper, opcoes):
+    """Transcreve um áudio longo em trechos, com a ajuda dos workers livres do mesmo tipo de dispositivo.
+
+    `audio` é o áudio decodificado ou um AudioPCM ainda em decodificação: os
+    cortes são escolhidos em uma thread à medida que o áudio chega, e cada
+    trecho é oferecido aos workers assim que fica pronto. Os cortes, o idioma
+    e cada trecho concluído ficam nos checkpoints da tarefa; depois de uma
+    queda, só os trechos que faltam são transcritos.
+    """
+    fonte = audio if isinstance(audio, AudioPCM) else AudioMemoria(audio)
+    chave = chave_checkpoint(tarefa)
+    plano = checkpoints_transcricao.plano(tarefa["id"], chave)
+    if plano is not None:
+        cortes = plano["cortes"]
+        opcoes = dict(opcoes, language=plano["idioma"])
+        concluidos = checkpoints_transcricao.trechos(tarefa["id"])
+    else:
+        # Trechos sem plano são de uma execução que caiu antes de terminar os cortes
+        checkpoints_transcricao.remover(tarefa["id"])
+        # Detecta o idioma uma única vez, pelos primeiros 30 s, para que todos os trechos usem o mesmo
+        if "language" not in opcoes:
+            opcoes = dict(opcoes, language=detectar_idioma(modelo_whisper, fonte.ler(0, whisper.audio.N_SAMPLES)))
+            print(f"Idioma detectado: {opcoes['language']}")
+        cortes = encontrar_cortes(fonte, TRECHO_SEGUNDOS)
+        concluidos = {}
+
+    transcricao = TranscricaoLonga(
+        tarefa["id"], fonte, opcoes, SOBREPOSICAO_SEGUNDOS, concluidos, tarefa.get("duracao_estimada")
+    )
+
+    def planejar():
+        lista = []
+        pendentes = 0
+        try:
+            for corte in cortes:
+                lista.append(corte)
+                if len(lista) == 1 or not transcricao.acrescentar_corte(corte):
+                    continue
+                # O primeiro trecho pendente fica com o worker dono da tarefa; os
+                # demais são oferecidos aos workers livres
+                pendentes += 1
+                if pendentes > 1:
+                    tarefas_fila.put({
+                        "id": tarefa["id"],
+                        "modelo": tarefa["modelo"],
+                        "quantizacao": tarefa.get("quantizacao"),
+                        "dispositivo": tarefa["dispositivo"],
+                        "trecho": transcricao
+                    })
+            if plano is None:
+                checkpoints_transcricao.salvar_plano(tarefa["id"], chave, {"cortes": lista, "idioma": opcoes["language"]})
+        except Exception as e:
+            transcricao.finalizar_cortes(e)
+            return
+        transcricao.finalizar_cortes()
+        print(f"Tarefa {tarefa['id']}: áudio dividido em {transcricao.total} trechos, {len(concluidos)} já transcritos")
+
+    threading.Thread(target=planejar, name=f"cortes-{tarefa['id']}", daemon=True).start()
+
+    # O worker dono da tarefa também transcreve trechos até não sobrar nenhum
+    indice = transcricao.reservar(esperar=True)
+    while indice is not None:
+        transcricao.transcrever_trecho(indice, modelo_whisper)
+        indice = transcricao.reservar(esperar=True)
+
+    return transcricao.juntar(), transcricao.observadores
+
+def processar_trecho(item, dispositivo):
+    """Ajuda a transcrever um áudio longo de outra tarefa com um modelo deste worker."""
+    transcricao = item["trecho"]
+    if not transcricao.tem_pendentes():
+        return
+
+    modelo_nome = modelo_execucao(item)
+    modelo_whisper = carregar_modelo(modelo_nome, dispositivo)
+    try:
+        indice = transcricao.reservar()
+        while indice is not None:
+            transcricao.transcrever_trecho(indice, modelo_whisper)
+            indice = transcricao.reservar()
+    finally:
+        liberar_modelo(modelo_nome, dispositivo, modelo_whisper)
+
+def segmentos_de_tokens(resultado, tokenizer, duracao):
+    """Converte os tokens de uma janela decodificada em segmentos no formato do transcribe.
+
+    Os tokens de tempo aparecem em pares (<|início|> texto <|fim|>); um texto
+    sem o token de fim, no final da janela, vai do último tempo até o fim do áudio.
+    """
+    inicio_tempo = tokenizer.timestamp_begin
+    segmentos = []
+    tokens_texto = []
+    inicio = None
+
+    def fechar(fim):
+        segmentos.append({
+            "id": len(segmentos),
+            "seek": 0,
+            "start": round(inicio or 0.0, 2),
+            "end": round(min(fim, duracao), 2),
+            "text": tokenizer.decode(tokens_texto),
+            "tokens": list(tokens_texto),
+            "temperature": resultado.temperature,
+            "avg_logprob": resultado.avg_logprob,
+            "compression_ratio": resultado.compression_ratio,
+            "no_speech_prob": resultado.no_speech_prob
+        })
+
+    for token in resultado.tokens:
+        if token < inicio_tempo:
+            tokens_texto.append(token)
+            continue
+        tempo = (token - inicio_tempo) * 0.02
+        if inicio is not None and tokens_texto:
+            fechar(tempo)
+            tokens_texto = []
+        inicio = tempo
+    if tokens_texto:
+        fechar(duracao)
+    return segmentos
+
+def transcrever_lote(modelo_whisper, audios, opcoes):
+    """Decodifica vários áudios curtos (até 30 s) em uma única passada do codificador e do decodificador.
+
+    Retorna um resultado por áudio, no formato do transcribe. Quando o resultado
+    de um áudio com temperatura 0 não passa nos limiares do perfil (taxa de
+    compressão e log-probabilidade média) e o perfil tem temperaturas de
+    fallback, a posição fica com None para que a tarefa seja refeita pelo
+    transcribe, com o fallback de temperatura. Sem fallback, o transcribe
+    chegaria ao mesmo resultado, que é aceito.
+    """
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), modelo_whisper.dims.n_mels)
+        for audio in audios
+    ]).to(modelo_whisper.device)
+    opcoes_decodificacao = whisper.DecodingOptions(
+        task=opcoes["task"],
+        language=opcoes.get("language"),
+        fp16=opcoes["fp16"],
+        temperature=0.0,
+        beam_size=opcoes.get("beam_size")
+    )
+    decodificados = whisper.decode(modelo_whisper, mels, opcoes_decodificacao)
+    tokenizer = whisper.tokenizer.get_tokenizer(
+        modelo_whisper.is_multilingual,
+        num_languages=modelo_whisper.num_languages,
+        task=opcoes["task"]
+    )
+
+    temperaturas = opcoes.get("temperature", 0.0)
+    com_fallback = isinstance(temperaturas, (list, tuple)) and len(temperaturas) > 1
+
+    resultados = []
+    for audio, decodificado in zip(audios, decodificados):
+        if decodificado.no_speech_prob > opcoes["no_speech_threshold"] and decodificado.avg_logprob < opcoes["logprob_threshold"]:
+            # Silêncio: o transcribe descartaria a janela
+            segmentos = []
+        elif com_fallback and (decodificado.compression_ratio > opcoes["compression_ratio_threshold"] or decodificado.avg_logprob < opcoes["logprob_threshold"]):
+            resultados.append(None)
+            continue
+        else:
+            segmentos = segmentos_de_tokens(decodificado, tokenizer, len(audio) / whisper.audio.SAMPLE_RATE)
+        resultados.append({
+            "text": "".join(segmento["text"] for segmento in segmentos),
+            "segments": segmentos,
+            "language": decodificado.language
+        })
+    return resultados
+
+def opcoes_transcricao(tarefa, dispositivo):
+    """Monta as opções do Whisper para uma tarefa: tarefa, fp16, idioma e as do perfil de decodificação."""
+    opcoes = {
+        "task": "translate" if tarefa["tarefa"] == "traducao" else "transcribe",
+        "fp16": dispositivo.startswith("cuda"),
+        **PERFIS_DECODIFICACAO[tarefa.get("perfil") or "equilibrado"]
+    }
+
+    # Adiciona o idioma se não for auto
+    if tarefa["idioma"] != 'auto':
+        opcoes["language"] = tarefa["idioma"]
+    return opcoes
+
+def abrir_audio(tarefa):
+    """Retorna o AudioPCM da tarefa: o PCM guardado para o mesmo upload ou uma decodificação em andamento."""
+    fonte = cache_pcm.abrir(tarefa.get("hash_audio"), tarefa["arquivo_temp"], tarefa["temp_dir"])
+    if fonte.em_cache:
+        print(f"Áudio da tarefa {tarefa['id']} encontrado no cache de PCM")
+    return fonte
+
+def decodificar_audio(tarefa, etapas, fonte=None):
+    """Decodifica o áudio da tarefa (16 kHz, mono) e registra a duração e o tempo gasto."""
+    if fonte is None:
+        with abrir_audio(tarefa) as fonte:
+            return decodificar_audio(tarefa, etapas, fonte)
+    inicio_etapa = time.time()
+    audio = fonte.ler()
+    duracao = len(audio) / whisper.audio.SAMPLE_RATE
+    etapas["decodificacao_audio"] = round(time.time() - inicio_etapa, 3)
+    atualizar_tarefa(tarefa["id"], duracao_audio=round(duracao, 2))
+    return audio
+
+def transcricao_progressiva(tarefa):
+    """Indica se a tarefa começa a ser transcrita antes de o áudio terminar de ser decodificado.
+
+    Vale para os áudios que o ffprobe mediu com pelo menos WHISPER_LONGO_MIN_SEGUNDOS,
+    transcritos em trechos; o VAD e a cascata precisam do áudio inteiro.
+    """
+    return (
+        LONGO_MIN_SEGUNDOS > 0
+        and (tarefa.get("duracao_estimada") or 0) >= LONGO_MIN_SEGUNDOS
+        and not tarefa.get("vad")
+        and not tarefa.get("cascata")
+    )
+
+# Mapa de tempos das tarefas com VAD em transcrição, para publicar os segmentos com os tempos originais
+mapas_fala = {}
+
+def detectar_fala(tarefa, audio, etapas):
+    """Aplica o VAD às tarefas que o pediram.
+
+    Retorna o áudio só com as regiões de fala e o mapa para levar os tempos de
+    volta ao áudio original, ou o próprio áudio e None se a tarefa não usa VAD.
+    """
+    if not tarefa.get("vad"):
+        return audio, None
+    inicio_etapa = time.time()
+    audio_fala, mapa = voz.recortar_fala(audio, voz.regioes_fala(audio, VAD_SILENCIO_SEGUNDOS))
+    etapas["vad"] = round(time.time() - inicio_etapa, 3)
+    duracao_fala = len(audio_fala) / whisper.audio.SAMPLE_RATE
+    atualizar_tarefa(tarefa["id"], duracao_fala=round(duracao_fala, 2))
+    print(f"Tarefa {tarefa['id']}: {duracao_fala:.0f} de {len(audio) / whisper.audio.SAMPLE_RATE:.0f} segundos com fala")
+    return audio_fala, mapa
+
+def resultado_sem_fala(tarefa):
+    """Resultado de um áudio em que o VAD não encontrou fala, sem passar pelo modelo."""
+    return {"text": "", "segments": [], "language": tarefa["idioma"] if tarefa["idioma"] != 'auto' else None}
+
+def transcrever_tarefa(tarefa, dispositivo, etapas, audio=None):
+    """Transcreve o áudio de uma tarefa no dispositivo. Retorna o resultado e o tempo gasto.
+
+    Os tempos de cada etapa (decodificação do áudio, VAD, carregamento do
+    modelo, mel, janelas de 30 s e transcrição) são registrados em `etapas`. O
+    áudio já decodificado, ou o AudioPCM já aberto, pode ser passado em `audio`;
+    um AudioPCM recebido continua aberto, e quem o passou deve fechá-lo. Com o
+    VAD, só a fala é transcrita, e os tempos dos segmentos voltam ao áudio
+    original no fim.
+    """
+    if audio is None:
+        with abrir_audio(tarefa) as fonte:
+            return transcrever_tarefa(tarefa, dispositivo, etapas, fonte)
+    if isinstance(audio, AudioPCM):
+        fonte = audio
+        if transcricao_progressiva(tarefa):
+            # Os trechos são transcritos à medida que o ffmpeg decodifica o áudio
+            resultado = transcrever_audio(tarefa, fonte, dispositivo, etapas)
+            etapas["decodificacao_audio"] = round(fonte.tempo_decodificacao, 3)
+            atualizar_tarefa(tarefa["id"], duracao_audio=round(fonte.total() / whisper.audio.SAMPLE_RATE, 2))
+            return resultado
+        audio = decodificar_audio(tarefa, etapas, fonte)
+    audio, mapa_fala = detectar_fala(tarefa, audio, etapas)
+    if mapa_fala is None:
+        return transcrever_audio(tarefa, audio, dispositivo, etapas)
+    if len(audio) == 0:
+        return resultado_sem_fala(tarefa), 0.0
+
+    mapas_fala[tarefa["id"]] = mapa_fala
+    try:
+        resultado, tempo_transcricao = transcrever_audio(tarefa, audio, dispositivo, etapas)
+    finally:
+        mapas_fala.pop(tarefa["id"], None)
+    return voz.remapear_resultado(resultado, mapa_fala), tempo_transcricao
+
+def transcrever_audio(tarefa, audio, dispositivo, etapas):
+    """Transcreve o áudio (ou só a fala dele), direto ou em trechos, ou pela cascata.
+
+    `audio` é o áudio decodificado ou, na transcrição progressiva, o AudioPCM
+    ainda em decodificação, do qual os trechos são lidos quando ficam prontos.
+    """
+    tarefa_id = tarefa["id"]
+    modelo_nome = modelo_execucao(tarefa)
+
+    # A duração decide entre transcrição direta ou em trechos
+    progressiva = isinstance(audio, AudioPCM)
+    duracao = tarefa["duracao_estimada"] if progressiva else len(audio) / whisper.audio.SAMPLE_RATE
+
+    if tarefa.get("cascata"):
+        return transcrever_cascata(tarefa, audio, dispositivo, etapas)
+
+    # Carrega o modelo no dispositivo deste worker
+    print(f"Worker {dispositivo}: carregando modelo {modelo_nome}...")
+    inicio_etapa = time.time()
+    modelo_whisper = carregar_modelo(modelo_nome, dispositivo)
+    etapas["carregamento_modelo"] = round(time.time() - inicio_etapa, 3)
+    try:
+        opcoes = opcoes_transcricao(tarefa, dispositivo)
+
+        print(f"Iniciando transcrição de {duracao:.0f} segundos de áudio com opções: {opcoes}")
+
+        # Atualiza o status
+        atualizar_tarefa(tarefa_id, status="transcrevendo", progresso=calcular_progresso(0, duracao))
+
+        # Realiza a transcrição
+        tempo_inicio_transcricao = time.time()
+        if progressiva or (LONGO_MIN_SEGUNDOS > 0 and duracao >= LONGO_MIN_SEGUNDOS):
+            resultado, observadores = transcrever_longo(tarefa, audio, modelo_whisper, opcoes)
+        else:
+            # Retoma depois da última janela salva antes de uma queda, com o texto anterior como contexto
+            chave = chave_checkpoint(tarefa)
+            retomada, segmentos_salvos = checkpoints_transcricao.janelas(tarefa_id, chave) if PROGRESSO_WHISPER else (0.0, [])
+            opcoes_execucao = dict(opcoes)
+            if retomada > 0:
+                print(f"Tarefa {tarefa_id}: retomando a transcrição em {retomada:.1f} segundos")
+                opcoes_execucao["clip_timestamps"] = [retomada]
+                contexto = "".join(segmento["text"] for segmento in segmentos_salvos[-3:]).strip()
+                if contexto:
+                    opcoes_execucao["initial_prompt"] = contexto
+
+            def ao_avancar(segundos_decodificados, segmentos_novos):
+                segundos_decodificados += retomada
+                checkpoints_transcricao.acrescentar_janela(tarefa_id, chave, segundos_decodificados, segmentos_novos)
+                publicar_segmentos(tarefa_id, segmentos_novos)
+                decorrido = time.time() - tempo_inicio_transcricao
+                restante = decorrido / (segundos_decodificados - retomada) * (duracao - segundos_decodificados) if segundos_decodificados > retomada else None
+                atualizar_tarefa(
+                    tarefa_id,
+                    progresso=calcular_progresso(segundos_decodificados, duracao),
+                    segundos_decodificados=round(min(segundos_decodificados, duracao), 1),
+                    tempo_restante_estimado=round(restante, 1) if restante is not None else None
+                )
+
+            with observar_transcricao(ObservadorTranscricao(ao_avancar)) as observador:
+                resultado = modelo_whisper.transcribe(audio, **opcoes_execucao)
+            observadores = [observador]
+            if segmentos_salvos:
+                segmentos = [dict(segmento, id=indice) for indice, segmento in enumerate(segmentos_salvos + resultado["segments"])]
+                resultado = {
+                    "text": "".join(segmento["text"] for segmento in segmentos),
+                    "segments": segmentos,
+                    "language": resultado["language"]
+                }
+        tempo_transcricao = time.time() - tempo_inicio_transcricao
+        print(f"Transcrição concluída em {tempo_transcricao:.2f} segundos")
+    finally:
+        # Devolve o modelo ao pool assim que a inferência termina
+        liberar_modelo(modelo_nome, dispositivo, modelo_whisper)
+
+    etapas["mel"] = round(sum(o.tempo_mel for o in observadores), 3)
+    etapas["janelas"] = resumir_janelas([t for o in observadores for t in o.tempos_janelas])
+    etapas["transcricao"] = round(tempo_transcricao, 3)
+    return resultado, tempo_transcricao
+
+def segmento_incerto(segmento):
+    """Indica se um segmento do rascunho da cascata deve ser decodificado de novo.
+
+    Segue os critérios do próprio Whisper: silêncio provável (no_speech_prob
+    alto com avg_logprob baixo) é mantido; confiança média abaixo de
+    CASCATA_LOGPROB_MINIMO ou texto repetitivo (compression_ratio acima de 2,4)
+    é refeito.
+    """
+    if segmento["no_speech_prob"] > 0.6 and segmento["avg_logprob"] < -1.0:
+        return False
+    return segmento["avg_logprob"] < CASCATA_LOGPROB_MINIMO or segmento["compression_ratio"] > 2.4
+
+def agrupar_incertos(segmentos):
+    """Agrupa segmentos incertos consecutivos. Retorna listas de índices."""
+    grupos = []
+    for indice, segmento in enumerate(segmentos):
+        if not segmento_incerto(segmento):
+            continue
+        if grupos and grupos[-1][-1] == indice - 1:
+            grupos[-1].append(indice)
+        else:
+            grupos.append([indice])
+    return grupos
+
+def detectar_idioma(modelo_whisper, audio):
+    """Detecta o idioma pelos primeiros 30 s do áudio."""
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), modelo_whisper.dims.n_mels)
+    _, probabilidades = modelo_whisper.detect_language(mel.to(modelo_whisper.device))
+    return max(probabilidades, key=probabilidades.get)
+
+def transcrever_cascata(tarefa, audio, dispositivo, etapas):
+    """Transcreve em cascata: rascunho com o modelo pequeno e revisão com o modelo da tarefa.
+
+    O modelo de rascunho detecta o idioma (quando a tarefa pede `auto`) e
+    transcreve o áudio inteiro. Cada grupo de segmentos incertos consecutivos é
+    recortado do áudio e transcrito pelo modelo da tarefa, com o texto anterior
+    do rascunho como contexto, e os segmentos resultantes substituem os do
+    grupo. Os dois modelos nunca ficam reservados ao mesmo tempo. Retorna o
+    resultado e o tempo gasto.
+    """
+    tarefa_id = tarefa["id"]
+    duracao = len(audio) / whisper.audio.SAMPLE_RATE
+    opcoes = opcoes_transcricao(tarefa, dispositivo)
+    inicio_transcricao = time.time()
+
+    # Rascunho com o modelo pequeno
+    nome_rascunho = modelo_execucao(tarefa, tarefa["cascata"])
+    inicio_etapa = time.time()
+    modelo_rascunho = carregar_modelo(nome_rascunho, dispositivo)
+    etapas["carregamento_modelo"] = round(time.time() - inicio_etapa, 3)
+    try:
+        atualizar_tarefa(tarefa_id, status="transcrevendo", progresso=calcular_progresso(0, duracao))
+        inicio_etapa = time.time()
+        if "language" not in opcoes:
+            opcoes["language"] = detectar_idioma(modelo_rascunho, audio)
+            print(f"Idioma detectado pelo modelo {nome_rascunho}: {opcoes['language']}")
+
+        def ao_avancar(segundos_decodificados, segmentos_novos):
+            # O rascunho vale metade do progresso; os segmentos só são publicados no final
+            atualizar_tarefa(tarefa_id, progresso=calcular_progresso(segundos_decodificados / 2, duracao))
+
+        with observar_transcricao(ObservadorTranscricao(ao_avancar)) as observador:
+            rascunho = modelo_rascunho.transcribe(audio, **opcoes)
+        etapas["rascunho"] = round(time.time() - inicio_etapa, 3)
+    finally:
+        liberar_modelo(nome_rascunho, dispositivo, modelo_rascunho)
+
+    segmentos = rascunho["segments"]
+    grupos = agrupar_incertos(segmentos)
+    segundos_incertos = sum(segmentos[grupo[-1]]["end"] - segmentos[grupo[0]]["start"] for grupo in grupos)
+    print(f"Rascunho com {len(segmentos)} segmentos, {len(grupos)} trechos incertos ({segundos_incertos:.1f} s)")
+
+    # Revisão dos trechos incertos com o modelo da tarefa
+    revisados = {}
+    if grupos:
+        modelo_nome = modelo_execucao(tarefa)
+        inicio_etapa = time.time()
+        modelo_whisper = carregar_modelo(modelo_nome, dispositivo)
+        etapas["carregamento_modelo"] += round(time.time() - inicio_etapa, 3)
+        try:
+            inicio_etapa = time.time()
+            segundos_revisados = 0.0
+            for grupo in grupos:
+                inicio = segmentos[grupo[0]]["start"]
+                fim = segmentos[grupo[-1]]["end"]
+                trecho = audio[int(inicio * whisper.audio.SAMPLE_RATE):int(fim * whisper.audio.SAMPLE_RATE)]
+                contexto = "".join(segmento["text"] for segmento in segmentos[max(0, grupo[0] - 3):grupo[0]]).strip()
+                resultado_trecho = modelo_whisper.transcribe(
+                    trecho,
+                    **dict(opcoes, condition_on_previous_text=False, initial_prompt=contexto or None)
+                )
+                revisados[grupo[0]] = [
+                    {**segmento, "start": inicio + segmento["start"], "end": min(fim, inicio + segmento["end"])}
+                    for segmento in resultado_trecho["segments"]
+                ]
+                segundos_revisados += fim - inicio
+                fracao = segundos_revisados / segundos_incertos if segundos_incertos > 0 else 1.0
+                atualizar_tarefa(tarefa_id, progresso=calcular_progresso(duracao * (1 + fracao) / 2, duracao))
+            etapas["revisao"] = round(time.time() - inicio_etapa, 3)
+        finally:
+            liberar_modelo(modelo_nome, dispositivo, modelo_whisper)
+
+    # Monta o resultado: segmentos confiáveis do rascunho e trechos revisados
+    substituidos = {indice for grupo in grupos for indice in grupo}
+    finais = []
+    for indice, segmento in enumerate(segmentos):
+        if indice in revisados:
+            finais.extend(revisados[indice])
+        elif indice not in substituidos:
+            finais.append(segmento)
+    for numero, segmento in enumerate(finais):
+        segmento["id"] = numero
+    resultado = {
+        "text": "".join(segmento["text"] for segmento in finais),
+        "segments": finais,
+        "language": opcoes["language"]
+    }
+    publicar_segmentos(tarefa_id, finais)
+
+    tempo_transcricao = time.time() - inicio_transcricao
+    etapas["mel"] = round(observador.tempo_mel, 3)
+    etapas["janelas"] = resumir_janelas(observador.tempos_janelas)
+    etapas["transcricao"] = round(tempo_transcricao, 3)
+    atualizar_tarefa(tarefa_id, cascata_resumo={
+        "modelo_rascunho": tarefa["cascata"],
+        "idioma": opcoes["language"],
+        "segmentos_rascunho": len(segmentos),
+        "segmentos_revisados": len(substituidos),
+        "segundos_revisados": round(segundos_incertos, 1),
+        "fracao_revisada": round(segundos_incertos / duracao, 3) if duracao else 0.0
+    })
+    print(f"Transcrição em cascata concluída em {tempo_transcricao:.2f} segundos")
+    return resultado, tempo_transcricao
+
+# Progresso parcial das transcrições, para retomar depois de uma queda
+checkpoints_transcricao = CheckpointsTranscricao(os.path.join(DADOS_DIR, 'checkpoints'))
+
+# Resultado canônico de cada tarefa, a partir do qual os formatos de saída são gerados
+resultados_tarefas = ResultadosTarefas(os.path.join(DADOS_DIR, 'resultados'), RENDERIZADOS_MAXIMO, RESULTADOS_COMPRESSAO)
+
+def salvar_resultado(tarefa, resultado):
+    """Grava o resultado canônico da tarefa em resultados/. Retorna o caminho do arquivo."""
+    return resultados_tarefas.salvar(tarefa["id"], resultado)
+
+def concluir_tarefa(tarefa, resultado, tempo_transcricao, em_cache=False, etapas=None):
+    """Salva o resultado de uma tarefa e a marca como concluída.
+
+    Registra o tempo de escrita em `etapas` e, quando houve transcrição, o fator
+    de tempo real (segundos de processamento por segundo de áudio).
+    """
+    etapas = dict(etapas or {})
+    inicio_escrita = time.time()
+    caminho_resultado = salvar_resultado(tarefa, resultado)
+    etapas["escrita"] = round(time.time() - inicio_escrita, 3)
+    checkpoints_transcricao.remover(tarefa["id"])
+
+    campos = {}
+    modelo = chave_desempenho(tarefa)
+    duracao = (copiar_tarefa(tarefa["id"]) or {}).get("duracao_audio")
+    if not em_cache and duracao and tempo_transcricao > 0:
+        campos["fator_tempo_real"] = round(tempo_transcricao / duracao, 4)
+        registrar_fator_tempo_real(modelo, tarefa["dispositivo"], campos["fator_tempo_real"])
+        metrica_audio.incrementar(duracao, modelo=modelo, dispositivo=tarefa["dispositivo"])
+    if not em_cache:
+        metrica_transcricao.observar(tempo_transcricao, modelo=modelo, dispositivo=tarefa["dispositivo"])
+        metrica_inferencia.incrementar(tempo_transcricao, modelo=modelo, dispositivo=tarefa["dispositivo"])
+    metrica_tarefas.incrementar(resultado="cache" if em_cache else "concluido")
+
+    atualizar_tarefa(
+        tarefa["id"],
+        status="concluido",
+        arquivo_resultado=caminho_resultado,
+        nome_arquivo_saida=os.path.splitext(tarefa["nome_arquivo"])[0] + f'.{tarefa["formato"]}',
+        tempo_processamento=tempo_transcricao,
+        em_cache=em_cache,
+        etapas=etapas,
+        tempo_restante_estimado=None,
+        progresso=100,
+        **campos
+    )
+
+def remover_arquivos_temporarios(tarefa):
+    """Remove o áudio enviado e o diretório temporário de uma tarefa concluída.
+
+    O áudio de uma tarefa que não foi concluída (erro) é mantido para que o
+    /reenviar não precise de um novo upload.
+    """
+    atual = copiar_tarefa(tarefa["id"])
+    if atual is not None and atual["status"] != "concluido":
+        return
+    try:
+        shutil.rmtree(tarefa["temp_dir"])
+        print("Arquivos temporários removidos")
+    except Exception as e:
+        print(f"Erro ao remover arquivos temporários: {str(e)}")
+
+def etapas_iniciais(tarefa):
+    """Retorna as etapas de uma tarefa retirada da fila, com o tempo de espera na fila."""
+    etapas = {}
+    if "enfileirado_em" in tarefa:
+        etapas["fila"] = round(time.time() - tarefa["enfileirado_em"], 3)
+        metrica_espera_fila.observar(etapas["fila"], modelo=tarefa["modelo"])
+    return etapas
+
+def registrar_erro(tarefa, erro, etapas):
+    """Registra no status da tarefa um erro ocorrido durante o processamento."""
+    import traceback
+    print(f"Erro durante a transcrição: {str(erro)}")
+    print(traceback.format_exc())
+    atualizar_tarefa(tarefa["id"], status="erro", erro=str(erro), etapas=etapas, tempo_restante_estimado=None)
+    metrica_tarefas.incrementar(resultado="erro")
+
+def processar_tarefa(tarefa, dispositivo, etapas, audio=None):
+    """Transcreve uma tarefa, ou reaproveita o cache, e a conclui."""
+    try:
+        # Reaproveita uma transcrição idêntica feita enquanto a tarefa esperava na fila
+        chave = chave_transcricao(tarefa)
+        resultado = cache_transcricoes.obter(chave, contar=False)
+        em_cache = resultado is not None
+        if em_cache:
+            print(f"Resultado da tarefa {tarefa['id']} encontrado no cache")
+            tempo_transcricao = 0.0
+        else:
+            resultado, tempo_transcricao = transcrever_tarefa(tarefa, dispositivo, etapas, audio)
+            cache_transcricoes.salvar(chave, resultado)
+
+        # Salva o resultado e atualiza o status da tarefa
+        concluir_tarefa(tarefa, resultado, tempo_transcricao, em_cache, etapas)
+
+    except Exception as e:
+        registrar_erro(tarefa, e, etapas)
+
+def processar_lote(lote, dispositivo):
+    """Processa tarefas retiradas juntas da fila para a decodificação em lote.
+
+    As tarefas de até 30 s são decodificadas em uma única passada do modelo.
+    Uma tarefa mais longa segue o caminho normal: a primeira do lote neste
+    worker, as demais de volta para a fila. Os arquivos temporários das
+    tarefas processadas aqui são removidos ao final.
+    """
+    curtas = []
+    longa = None
+    processadas = []
+    fontes = []
+    try:
+        for indice, tarefa in enumerate(lote):
+            etapas = etapas_iniciais(tarefa)
+            try:
+                fonte = abrir_audio(tarefa)
+                fontes.append(fonte)
+                # Uma duração medida errada não pode trazer o áudio inteiro de
+                # uma tarefa longa para a memória só para descobrir que ela não cabe no lote
+                longo = fonte.aguardar(whisper.audio.N_SAMPLES + 1) > whisper.audio.N_SAMPLES
+                if not longo:
+                    audio = decodificar_audio(tarefa, etapas, fonte)
+            except Exception as e:
+                processadas.append(tarefa)
+                registrar_erro(tarefa, e, etapas)
+                continue
+            if longo:
+                if indice == 0:
+                    processadas.append(tarefa)
+                    longa = (tarefa, etapas, fonte)
+                else:
+                    if tarefa.get("rebaixamento"):
+                        atualizar_tarefa(tarefa["id"], **desfazer_rebaixamento(tarefa))
+                    tarefas_fila.devolver(item_pedido(tarefa))
+                continue
+
+            processadas.append(tarefa)
+            atualizar_tarefa(tarefa["id"], status="processando", progresso=5, etapas=etapas)
+            resultado = cache_transcricoes.obter(chave_transcricao(tarefa), contar=False)
+            if resultado is not None:
+                print(f"Resultado da tarefa {tarefa['id']} encontrado no cache")
+                concluir_tarefa(tarefa, resultado, 0.0, True, etapas)
+            else:
+                curtas.append((tarefa, etapas, audio))
+
+        if curtas:
+            transcrever_curtas(curtas, dispositivo)
+        if longa is not None:
+            tarefa, etapas, fonte = longa
+            atualizar_tarefa(tarefa["id"], status="processando", progresso=5, etapas=etapas)
+            processar_tarefa(tarefa, dispositivo, etapas, fonte)
+    finally:
+        for fonte in fontes:
+            fonte.fechar()
+        for tarefa in processadas:
+            remover_arquivos_temporarios(tarefa)
+
+def transcrever_curtas(curtas, dispositivo):
+    """Decodifica em lote as tarefas curtas de `processar_lote` e conclui cada uma.
+
+    Com o VAD, o lote recebe só a fala de cada áudio, e as tarefas sem fala são
+    concluídas sem passar pelo modelo.
+    """
+    falas = []
+    for tarefa, etapas, audio in curtas:
+        try:
+            audio_fala, mapa_fala = detectar_fala(tarefa, audio, etapas)
+            if mapa_fala is not None and len(audio_fala) == 0:
+                resultado = resultado_sem_fala(tarefa)
+                cache_transcricoes.salvar(chave_transcricao(tarefa), resultado)
+                concluir_tarefa(tarefa, resultado, 0.0, etapas=etapas)
+            else:
+                falas.append((tarefa, etapas, audio, audio_fala, mapa_fala))
+        except Exception as e:
+            registrar_erro(tarefa, e, etapas)
+    if not falas:
+        return
+
+    modelo_nome = modelo_execucao(falas[0][0])
+    try:
+        inicio_etapa = time.time()
+        modelo_whisper = carregar_modelo(modelo_nome, dispositivo)
+        tempo_carregamento = round(time.time() - inicio_etapa, 3)
+        try:
+            for tarefa, _, _, _, _ in falas:
+                atualizar_tarefa(tarefa["id"], status="transcrevendo", progresso=calcular_progresso(0, 1))
+            inicio_lote = time.time()
+            resultados = transcrever_lote(
+                modelo_whisper,
+                [audio_fala for _, _, _, audio_fala, _ in falas],
+                opcoes_transcricao(falas[0][0], dispositivo)
+            )
+            tempo_lote = time.time() - inicio_lote
+        finally:
+            liberar_modelo(modelo_nome, dispositivo, modelo_whisper)
+    except Exception as e:
+        for tarefa, etapas, _, _, _ in falas:
+            registrar_erro(tarefa, e, etapas)
+        return
+    print(f"Lote de {len(falas)} tarefas decodificado em {tempo_lote:.2f} segundos")
+
+    for (tarefa, etapas, audio, _, mapa_fala), resultado in zip(falas, resultados):
+        try:
+            etapas["carregamento_modelo"] = tempo_carregamento
+            etapas["transcricao"] = round(tempo_lote, 3)
+            etapas["lote"] = len(falas)
+            if resultado is None:
+                # O resultado guloso não passou nos limiares: refaz com o fallback de temperatura
+                print(f"Tarefa {tarefa['id']}: refazendo a transcrição fora do lote")
+                resultado, tempo_transcricao = transcrever_tarefa(tarefa, dispositivo, etapas, audio)
+            else:
+                if mapa_fala is not None:
+                    resultado = voz.remapear_resultado(resultado, mapa_fala)
+                publicar_segmentos(tarefa["id"], resultado["segments"])
+                tempo_transcricao = tempo_lote
+            cache_transcricoes.salvar(chave_transcricao(tarefa), resultado)
+            concluir_tarefa(tarefa, resultado, tempo_transcricao, etapas=etapas)
+        except Exception as e:
+            registrar_erro(tarefa, e, etapas)
+
+def tarefa_ajustada(tarefa, nivel):
+    """Retorna a tarefa como deve ser executada no nível da política de carga.
+
+    No nível 1 o perfil passa um passo para o mais rápido; no nível 2 o modelo
+    também é trocado pelo de MODELOS_MENORES (menos nas tarefas em cascata).
+    Retorna a própria tarefa se nada muda ou se ela já foi rebaixada antes.
+    """
+    if nivel == 0 or tarefa.get("rebaixamento"):
+        return tarefa
+    perfil = tarefa.get("perfil") or "equilibrado"
+    perfil_novo = ORDEM_PERFIS[max(0, ORDEM_PERFIS.index(perfil) - 1)]
+    modelo_novo = tarefa["modelo"]
+    if nivel >= 2 and not tarefa.get("cascata"):
+        modelo_novo = MODELOS_MENORES.get(tarefa["modelo"], tarefa["modelo"])
+    if perfil_novo == perfil and modelo_novo == tarefa["modelo"]:
+        return tarefa
+    return dict(tarefa, perfil=perfil_novo, modelo=modelo_novo, rebaixamento=nivel,
+                perfil_pedido=perfil, modelo_pedido=tarefa["modelo"])
+
+def item_pedido(item):
+    """Retorna o item com o modelo e o perfil pedidos, sem o rebaixamento, para voltar à fila."""
+    if not item.get("rebaixamento"):
+        return item
+    pedido = {campo: valor for campo, valor in item.items() if campo not in ("rebaixamento", "perfil_pedido", "modelo_pedido")}
+    pedido.update(perfil=item["perfil_pedido"], modelo=item["modelo_pedido"])
+    return pedido
+
+def desfazer_rebaixamento(tarefa):
+    """Campos que devolvem ao registro de uma tarefa rebaixada o modelo e o perfil pedidos.
+
+    Usado quando a tarefa volta para a fila: ela é avaliada de novo pela
+    política de carga ao sair, no nível do momento.
+    """
+    if not tarefa.get("rebaixamento"):
+        return {}
+    return {
+        "perfil": tarefa.get("perfil_pedido") or tarefa.get("perfil"),
+        "modelo": tarefa.get("modelo_pedido") or tarefa["modelo"],
+        "rebaixamento": None,
+        "perfil_pedido": None,
+        "modelo_pedido": None
+    }
+
+def ajustar_a_carga(tarefa, nivel):
+    """Aplica a política de carga a uma tarefa retirada da fila e registra o rebaixamento no status."""
+    ajustada = tarefa_ajustada(tarefa, nivel)
+    if ajustada is not tarefa:
+        print(f"Tarefa {tarefa['id']} rebaixada pela política de carga: "
+              f"{ajustada['modelo_pedido']}/{ajustada['perfil_pedido']} -> {ajustada['modelo']}/{ajustada['perfil']}")
+        atualizar_tarefa(
+            tarefa["id"],
+            perfil=ajustada["perfil"],
+            modelo=ajustada["modelo"],
+            rebaixamento=nivel,
+            perfil_pedido=ajustada["perfil_pedido"],
+            modelo_pedido=ajustada["modelo_pedido"]
+        )
+    return ajustada
+
+# Thread worker para processar tarefas em segundo plano
+def worker_thread(dispositivo="cpu"):
+    tipo_dispositivo = dispositivo.split(':')[0]
+    nome_worker = threading.current_thread().name
+    estado_workers[nome_worker] = False
+    if tipo_dispositivo == "cpu":
+        # Com o OpenMP, o número de threads vale para as operações iniciadas por esta thread
+        torch.set_num_threads(threads_por_worker())
+    while True:
+        try:
+            # Obtém uma tarefa da fila que este worker pode executar
+            tarefa = tarefas_fila.get(tipo_dispositivo)
+            if tarefa is None:
+                break
+            estado_workers[nome_worker] = True
+            
+            # Trecho de um áudio longo de outra tarefa
+            if "trecho" in tarefa:
+                try:
+                    processar_trecho(tarefa, dispositivo)
+                finally:
+                    tarefas_fila.task_done(tarefa)
+                continue
+
+            # Rebaixa o perfil e o modelo se a fila passou do SLO; a vaga no limite
+            # do modelo continua sendo a do item retirado da fila
+            nivel_carga = politica_carga.avaliar()
+            execucao = ajustar_a_carga(tarefa, nivel_carga)
+
+            # Reúne as tarefas compatíveis que chegarem logo em seguida
+            lote = [execucao]
+            if LOTE_MAXIMO > 1 and not execucao.get("cascata") and cabe_em_lote(execucao):
+                compativeis = tarefas_fila.obter_compativeis(
+                    execucao, LOTE_MAXIMO - 1, LOTE_ESPERA_SEGUNDOS,
+                    ajustar=lambda candidata: tarefa_ajustada(candidata, nivel_carga)
+                )
+                lote += [ajustar_a_carga(compativel, nivel_carga) for compativel in compativeis]
+            if len(lote) > 1:
+                try:
+                    processar_lote(lote, dispositivo)
+                finally:
+                    tarefas_fila.task_done(tarefa)
+                continue
+                
+            # Atualiza o status da tarefa, registrando o tempo de espera na fila
+            etapas = etapas_iniciais(execucao)
+            atualizar_tarefa(execucao["id"], status="processando", progresso=5, etapas=etapas)
+            
+            # Processa a tarefa
+            try:
+                processar_tarefa(execucao, dispositivo, etapas)
+            finally:
+                # Limpa os arquivos temporários
+                remover_arquivos_temporarios(execucao)
+                
+                # Marca a tarefa como concluída na fila
+                tarefas_fila.task_done(tarefa)
+                
+        except Exception as e:
+            print(f"Erro no worker {dispositivo}: {str(e)}")
+        finally:
+            estado_workers[nome_worker] = False
+
+def item_da_tarefa(tarefa, duracao_estimada=None, enfileirado_em=None):
+    """Monta o item da fila a partir do registro salvo de uma tarefa.
+
+    Uma tarefa rebaixada pela política de carga volta com o modelo e o perfil pedidos.
+    """
+    campos = ("id", "arquivo_temp", "temp_dir", "nome_arquivo", "modelo", "formato", "dispositivo", "idioma",
+              "tarefa", "quantizacao", "cascata", "vad", "perfil", "prioridade", "cliente", "hash_audio")
+    item = {campo: tarefa.get(campo) for campo in campos}
+    item["modelo"] = tarefa.get("modelo_pedido") or item["modelo"]
+    item["perfil"] = tarefa.get("perfil_pedido") or item["perfil"]
+    item["prioridade"] = item["prioridade"] or 0
+    item["duracao_estimada"] = duracao_estimada
+    item["enfileirado_em"] = enfileirado_em or time.time()
+    return item
+
+def retomar_tarefas():
+    """Recoloca na fila as tarefas interrompidas por um reinício.
+
+    Tarefas enfileiradas ou em andamento cujo áudio foi guardado voltam para a
+    fila, na ordem em que foram criadas, e retomam dos checkpoints. As que não
+    têm mais o áudio (de versões anteriores) são marcadas com erro. Diretórios
+    de upload que nenhuma tarefa usa (envios interrompidos) são apagados.
+    """
+    interrompidos = ("enfileirado", "processando", "carregando_modelo", "transcrevendo")
+    with tarefas_lock:
+        ids = [tarefa_id for status in interrompidos for tarefa_id in armazenamento_tarefas.listar(status=status)]
+        tarefas = sorted((dict(tarefas_status[tarefa_id]) for tarefa_id in ids), key=lambda t: t.get("data_criacao") or "")
+        em_uso = {tarefa.get("temp_dir") for tarefa in tarefas_status.values() if tarefa.get("temp_dir")}
+
+    retomadas = 0
+    for tarefa in tarefas:
+        if not tarefa.get("arquivo_temp") or not os.path.exists(tarefa["arquivo_temp"]):
+            atualizar_tarefa(tarefa["id"], status="erro", erro="Tarefa interrompida por um reinício do servidor. Envie o arquivo novamente.")
+            continue
+        try:
+            enfileirado_em = datetime.fromisoformat(tarefa["data_criacao"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            enfileirado_em = None
+        atualizar_tarefa(tarefa["id"], status="enfileirado", **desfazer_rebaixamento(tarefa))
+        tarefas_fila.put(item_da_tarefa(tarefa, tarefa.get("duracao_audio"), enfileirado_em))
+        retomadas += 1
+    if tarefas:
+        print(f"{retomadas} tarefas interrompidas recolocadas na fila, {len(tarefas) - retomadas} marcadas com erro")
+
+    for nome in os.listdir(UPLOADS_DIR):
+        caminho = os.path.join(UPLOADS_DIR, nome)
+        # No papel 'inferencia', os processos da API podem estar recebendo um upload agora
+        if PAPEL == "inferencia" and time.time() - os.path.getmtime(caminho) < 24 * 3600:
+            continue
+        if caminho not in em_uso:
+            shutil.rmtree(caminho, ignore_errors=True)
+
+def enfileirar(item):
+    """Coloca uma tarefa na fila de inferência.
+
+    No papel 'api', envia o item ao serviço de inferência. Se ele estiver fora
+    do ar, a tarefa continua salva como enfileirada e é recolhida quando ele voltar.
+    """
+    if PAPEL != "api":
+        tarefas_fila.put(item)
+        return
+    try:
+        cliente_inferencia.chamar("enfileirar", item=item)
+    except (InferenciaIndisponivel, RuntimeError) as e:
+        print(f"Tarefa {item['id']} salva, mas não entregue ao serviço de inferência: {str(e)}")
+
+def receber_tarefa(item):
+    """Recebe no serviço de inferência uma tarefa criada por um processo da API.
+
+    Lê o registro salvo pela API e coloca o item na fila, a não ser que a tarefa
+    já esteja na fila ou em andamento (um reenvio do mesmo pedido).
+    """
+    tarefa = armazenamento_tarefas.obter(item["id"])
+    if tarefa is None:
+        return False
+    with tarefas_lock:
+        atual = tarefas_status.get(item["id"])
+        if atual is not None and atual["status"] not in STATUS_FINAIS:
+            return False
+        tarefas_status[item["id"]] = tarefa
+    tarefas_fila.put(item)
+    return True
+
+def recolher_pendentes(idade_minima=60):
+    """Coloca na fila as tarefas enfileiradas pela API que não chegaram ao serviço de inferência.
+
+    Só considera tarefas criadas há mais de `idade_minima` segundos, para não
+    disputar com a API uma tarefa que ela ainda está enviando.
+    """
+    limite = datetime.fromtimestamp(time.time() - idade_minima).isoformat()
+    for tarefa_id in armazenamento_tarefas.listar(status="enfileirado", ate=limite):
+        with tarefas_lock:
+            atual = tarefas_status.get(tarefa_id)
+            if atual is not None and atual["status"] not in STATUS_FINAIS:
+                continue
+        tarefa = armazenamento_tarefas.obter(tarefa_id)
+        if tarefa is not None and tarefa.get("arquivo_temp") and os.path.exists(tarefa["arquivo_temp"]):
+            print(f"Tarefa {tarefa_id} recolhida do armazenamento")
+            receber_tarefa(item_da_tarefa(tarefa, tarefa.get("duracao_audio")))
+
+def arrendar_para_no(no, dispositivo, modelos, espera=0):
+    """Entrega a próxima tarefa da fila a um nó remoto.
+
+    Dá preferência a uma tarefa cujo modelo o nó já tem carregado. Tarefas com
+    o resultado no cache são concluídas aqui mesmo, sem passar pelo nó. Retorna
+    o arrendamento, com o que o nó precisa para transcrever, ou None se nenhuma
+    tarefa aparecer em `espera` segundos.
+    """
+    tipo_dispositivo = dispositivo.split(':')[0]
+    carregados = set(modelos)
+    prazo = time.time() + espera
+    while True:
+        coordenador_nos.visto(no, dispositivo, modelos)
+        item = tarefas_fila.arrendar(tipo_dispositivo, lambda tarefa: modelo_execucao(tarefa) in carregados,
+                                     max(0, prazo - time.time()))
+        if item is None:
+            return None
+        item = ajustar_a_carga(item, politica_carga.avaliar())
+        etapas = etapas_iniciais(item)
+        resultado = cache_transcricoes.obter(chave_transcricao(item), contar=False)
+        if resultado is not None:
+            print(f"Resultado da tarefa {item['id']} encontrado no cache")
+            concluir_tarefa(item, resultado, 0.0, True, etapas)
+            remover_arquivos_temporarios(item)
+            continue
+
+        arrendamento_id = coordenador_nos.registrar(no, dispositivo, modelos, item)
+        atualizar_tarefa(item["id"], status="processando", progresso=5, etapas=etapas, no=no)
+        metrica_arrendamentos.incrementar(evento="arrendado")
+        print(f"Tarefa {item['id']} arrendada ao nó {no}")
+        return {
+            "arrendamento": arrendamento_id,
+            "arrendamento_segundos": coordenador_nos.duracao,
+            "tarefa_id": item["id"],
+            "nome_arquivo": item["nome_arquivo"],
+            "modelo": modelo_execucao(item),
+            "opcoes": opcoes_transcricao(item, tipo_dispositivo),
+            "vad": VAD_SILENCIO_SEGUNDOS if item.get("vad") else None,
+            "etapas": etapas
+        }
+
+def audio_arrendado(arrendamento, no):
+    """Caminho do áudio de um arrendamento vigente do nó, ou None."""
+    item = coordenador_nos.item(arrendamento, no)
+    return item["arquivo_temp"] if item is not None else None
+
+def renovar_arrendamento(arrendamento, no, modelos=None, duracao_audio=None, segundos_decodificados=None, segmentos=None):
+    """Renova o arrendamento de um nó e registra o progresso informado por ele.
+
+    Retorna False se o arrendamento venceu ou não é deste nó.
+    """
+    item = coordenador_nos.renovar(arrendamento, no, modelos)
+    if item is None:
+        return False
+    campos = {}
+    if duracao_audio:
+        campos["duracao_audio"] = round(duracao_audio, 2)
+    if segundos_decodificados is not None:
+        duracao = duracao_audio or (copiar_tarefa(item["id"]) or {}).get("duracao_audio") or 0
+        campos["status"] = "transcrevendo"
+        campos["progresso"] = calcular_progresso(segundos_decodificados, duracao)
+        campos["segundos_decodificados"] = round(min(segundos_decodificados, duracao or segundos_decodificados), 1)
+    if campos:
+        atualizar_tarefa(item["id"], **campos)
+    if segmentos:
+        publicar_segmentos(item["id"], segmentos)
+    return True
+
+def concluir_arrendamento(arrendamento, no, resultado, tempo_transcricao, etapas=None, duracao_audio=None):
+    """Recebe o resultado de um nó, conclui a tarefa e guarda o resultado no cache.
+
+    Retorna False se o arrendamento venceu antes (a tarefa voltou para a fila).
+    Se a conclusão falhar, a tarefa fica com erro e é levantado RuntimeError.
+    """
+    item = coordenador_nos.encerrar(arrendamento, no)
+    if item is None:
+        return False
+    try:
+        if duracao_audio:
+            atualizar_tarefa(item["id"], duracao_audio=round(duracao_audio, 2))
+        concluir_tarefa(item, resultado, tempo_transcricao, etapas=etapas)
+    except Exception as e:
+        # O arrendamento já foi encerrado: sem registrar o erro, a tarefa ficaria
+        # em processamento para sempre
+        registrar_erro(item, e, etapas or {})
+        metrica_arrendamentos.incrementar(evento="erro")
+        raise RuntimeError(f"Não foi possível concluir a tarefa {item['id']}: {str(e)}") from e
+    # Só vai para o cache um resultado que chegou a concluir a tarefa
+    cache_transcricoes.salvar(chave_transcricao(item), resultado)
+    remover_arquivos_temporarios(item)
+    metrica_arrendamentos.incrementar(evento="concluido")
+    print(f"Tarefa {item['id']} concluída pelo nó {no}")
+    return True
+
+def falhar_arrendamento(arrendamento, no, erro, etapas=None):
+    """Registra o erro informado por um nó. Retorna False se o arrendamento não está mais com ele."""
+    item = coordenador_nos.encerrar(arrendamento, no)
+    if item is None:
+        return False
+    registrar_erro(item, RuntimeError(f"Nó {no}: {erro}"), etapas or {})
+    metrica_arrendamentos.incrementar(evento="erro")
+    return True
+
+def devolver_arrendamentos_vencidos():
+    """Devolve para a fila as tarefas cujos nós pararam de renovar o arrendamento."""
+    for _, item, no in coordenador_nos.vencidos():
+        atual = copiar_tarefa(item["id"])
+        if atual is None or atual["status"] in STATUS_FINAIS:
+            continue
+        print(f"Arrendamento da tarefa {item['id']} pelo nó {no} venceu; tarefa de volta na fila")
+        atualizar_tarefa(item["id"], status="enfileirado", progresso=0, no=None,
+                         segundos_decodificados=None, tempo_restante_estimado=None, **desfazer_rebaixamento(atual))
+        tarefas_fila.put(item_pedido(item))
+        metrica_arrendamentos.incrementar(evento="vencido")
+
+def vigiar_arrendamentos():
+    while True:
+        time.sleep(max(1, min(5, ARRENDAMENTO_SEGUNDOS / 4)))
+        try:
+            devolver_arrendamentos_vencidos()
+        except Exception as e:
+            print(f"Erro ao verificar os arrendamentos: {str(e)}")
+
+# Operações dos nós remotos, chamadas pelas rotas /nos ou, no papel 'api', pelo serviço de inferência
+COMANDOS_NOS = {
+    "arrendar": arrendar_para_no,
+    "audio": audio_arrendado,
+    "renovar": renovar_arrendamento,
+    "concluir": concluir_arrendamento,
+    "falhar": falhar_arrendamento,
+    "nos": coordenador_nos.estado
+}
+
+def tratar_comando_inferencia(comando, dados):
+    """Atende um comando enviado por um processo da API ao serviço de inferência."""
+    if comando in COMANDOS_NOS:
+        return COMANDOS_NOS[comando](**dados)
+    if comando == "enfileirar":
+        return receber_tarefa(dados["item"])
+    if comando == "previsao":
+        return tarefas_fila.previsao(dados["tarefa_id"], workers_por_tipo())
+    if comando == "segmentos":
+        return canal_eventos.segmentos(dados["tarefa_id"], dados.get("desde", 0))
+    if comando == "pronto":
+        return estado_prontidao()
+    if comando == "modelos":
+        return estado_modelos()
+    if comando == "metricas":
+        return metricas.exportar()
+    if comando == "cache":
+        return estado_caches()
+    raise ValueError(f"Comando desconhecido: {comando}")
+
+def recolhimento_periodico(intervalo=30):
+    while True:
+        time.sleep(intervalo)
+        try:
+            recolher_pendentes()
+        except Exception as e:
+            print(f"Erro ao recolher tarefas pendentes: {str(e)}")
+
+workers = []
+if PAPEL == "api":
+    # A inferência roda em outro processo; as tarefas são entregues a ele pelo cliente
+    cliente_inferencia = ClienteInferencia(INFERENCIA_ENDERECO, lambda: chave_compartilhada(DADOS_DIR))
+else:
+    retomar_tarefas()
+    
+    # Inicia o pool de workers
+    for indice_worker, dispositivo_worker in enumerate(dispositivos_workers()):
+        worker = threading.Thread(
+            target=worker_thread,
+            args=(dispositivo_worker,),
+            name=f"{dispositivo_worker}#{indice_worker}",
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+    print(f"Pool de workers iniciado: {', '.join(dispositivos_workers()) or 'nenhum worker local'}")
+    if NOS_CHAVE:
+        threading.Thread(target=vigiar_arrendamentos, name="arrendamentos", daemon=True).start()
+
+# Estado do pré-carregamento: 'modelo@dispositivo' -> 'carregando', 'pronto' ou a mensagem de erro
+precarregamento = {}
+
+def precarregar_modelos(itens):
+    """Carrega os modelos pedidos em WHISPER_PRECARREGAR, um de cada vez.
+
+    Os modelos ficam no cache de modelos como qualquer outro: ociosos e sujeitos
+    ao descarte LRU se o orçamento de memória precisar.
+    """
+    pares = []
+    for item in itens:
+        nome_modelo, _, dispositivo = item.partition('@')
+        for dispositivo in ([dispositivo] if dispositivo else sorted(set(dispositivos_workers()))):
+            pares.append((nome_modelo, dispositivo))
+            precarregamento[f"{nome_modelo}@{dispositivo}"] = "carregando"
+    for nome_modelo, dispositivo in pares:
+        chave = f"{nome_modelo}@{dispositivo}"
+        try:
+            modelo = carregar_modelo(nome_modelo, dispositivo)
+            liberar_modelo(nome_modelo, dispositivo, modelo)
+            precarregamento[chave] = "pronto"
+        except Exception as e:
+            print(f"Erro ao pré-carregar o modelo {chave}: {str(e)}")
+            precarregamento[chave] = f"erro: {str(e)}"
+
+if PRECARREGAR and PAPEL != "api":
+    threading.Thread(target=precarregar_modelos, args=(PRECARREGAR,), name="precarregamento", daemon=True).start()
+
+def remover_tarefa(tarefa_id):
+    """Apaga uma tarefa finalizada e tudo o que ela ocupa em disco.
+
+    Remove o registro, o resultado e os formatos gerados, o áudio guardado e os
+    checkpoints. Retorna False se a tarefa não existe ou ainda não terminou.
+    """
+    global versao_tarefas, tarefas_alteradas_em
+    with tarefas_lock:
+        tarefa = tarefas_status.get(tarefa_id) or armazenamento_tarefas.obter(tarefa_id)
+        if tarefa is None or tarefa["status"] not in STATUS_FINAIS:
+            return False
+        tarefas_status.pop(tarefa_id, None)
+        armazenamento_tarefas.remover(tarefa_id)
+        versao_tarefas += 1
+        tarefas_alteradas_em = time.time()
+        ids_remessa = remessas.get(tarefa.get("remessa_id"))
+        if ids_remessa is not None and tarefa_id in ids_remessa:
+            ids_remessa.remove(tarefa_id)
+            if not ids_remessa:
+                del remessas[tarefa["remessa_id"]]
+    resultados_tarefas.remover(tarefa_id)
+    checkpoints_transcricao.remover(tarefa_id)
+    if tarefa.get("temp_dir"):
+        shutil.rmtree(tarefa["temp_dir"], ignore_errors=True)
+    return True
+
+def limpar_armazenamento():
+    """Apaga as tarefas finalizadas vencidas ou em excesso e compacta o armazenamento.
+
+    Percorre as tarefas finalizadas da atualizada há mais tempo para a mais
+    recente, apagando as que passaram de WHISPER_RETENCAO_DIAS, as concluídas
+    cujo resultado não existe mais (como as de tarefas.json com caminhos de
+    outra máquina) e, enquanto resultados/ ou o número de tarefas estiverem
+    acima do limite, as mais antigas. Tarefas enfileiradas ou em andamento nunca
+    são apagadas. As tarefas são lidas do armazenamento, que no papel
+    'inferencia' inclui as concluídas pela API sem passar pela fila. Retorna
+    quantas tarefas foram apagadas.
+    """
+    ids_finalizadas = [tarefa_id for status in STATUS_FINAIS for tarefa_id in armazenamento_tarefas.listar(status=status)]
+    finalizadas = sorted(
+        filter(None, (armazenamento_tarefas.obter(tarefa_id) for tarefa_id in ids_finalizadas)),
+        key=lambda tarefa: tarefa.get("atualizado_em") or tarefa.get("data_criacao") or ""
+    )
+    total_tarefas = len(armazenamento_tarefas.listar())
+    tamanhos = resultados_tarefas.tamanhos()
+    total_bytes = sum(tamanhos.values())
+    limite_bytes = RESULTADOS_MAXIMO_MB * 1024 * 1024
+    vencimento = (datetime.now() - timedelta(days=RETENCAO_DIAS)).isoformat() if RETENCAO_DIAS > 0 else None
+
+    removidas = 0
+    for tarefa in finalizadas:
+        if vencimento is not None and (tarefa.get("atualizado_em") or tarefa.get("data_criacao") or "") < vencimento:
+            motivo = "vencida"
+        elif (limite_bytes > 0 and total_bytes > limite_bytes) or (TAREFAS_MAXIMO > 0 and total_tarefas - removidas > TAREFAS_MAXIMO):
+            motivo = "excesso"
+        elif tarefa["status"] == "concluido" and not any(
+            caminho and os.path.exists(caminho) for caminho in (tarefa.get("arquivo_resultado"), tarefa.get("arquivo_saida"))
+        ):
+            motivo = "sem_resultado"
         else:
-            print("Arquivo de tarefas não encontrado. Iniciando com lista vazia.")
-            tarefas_status = {}
-    except Exception as e:
-        print(f"Erro ao carregar tarefas: {str(e)}")
-        tarefas_status = {}
+            continue
+        if remover_tarefa(tarefa["id"]):
+            removidas += 1
+            total_bytes -= tamanhos.get(tarefa["id"], 0)
+            metrica_tarefas_removidas.incrementar(motivo=motivo)
 
-# Função para salvar tarefas no arquivo
-def salvar_tarefas():
-    try:
-        with open(TAREFAS_ARQUIVO, 'w', encoding='utf-8') as f:
-            json.dump(tarefas_status, f, ensure_ascii=False, indent=2)
-        print(f"Salvas {len(tarefas_status)} tarefas no arquivo.")
-    except Exception as e:
-        print(f"Erro ao salvar tarefas: {str(e)}")
-
-# Carrega as tarefas ao iniciar
-carregar_tarefas()
-
-def carregar_modelo(nome_modelo):
-    """Carrega um modelo Whisper se ainda não estiver carregado."""
-    if nome_modelo not in modelos_carregados:
-        print(f"Carregando modelo {nome_modelo}...")
-        # Atualiza o status de todas as tarefas que estão esperando por este modelo
-        for tarefa_id, tarefa in tarefas_status.items():
-            if tarefa["status"] == "processando" and tarefa["modelo"] == nome_modelo:
-                tarefa["status"] = "carregando_modelo"
-                tarefa["progresso"] = 10
-                print(f"Atualizando status da tarefa {tarefa_id} para 'carregando_modelo'")
-        
-        # Salva o status atualizado
-        salvar_tarefas()
-        
-        # Verifica se CUDA está disponível
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        # Carrega o modelo
-        inicio_carregamento = time.time()
-        modelos_carregados[nome_modelo] = whisper.load_model(nome_modelo).to(device)
-        tempo_carregamento = time.time() - inicio_carregamento
-        
-        print(f"Modelo {nome_modelo} carregado em {tempo_carregamento:.2f} segundos")
-        
-        # Atualiza novamente o status das tarefas
-        for tarefa_id, tarefa in tarefas_status.items():
-            if tarefa["status"] == "carregando_modelo" and tarefa["modelo"] == nome_modelo:
-                tarefa["status"] = "transcrevendo"
-                tarefa["progresso"] = 30
-                print(f"Atualizando status da tarefa {tarefa_id} para 'transcrevendo'")
-        
-        # Salva o status atualizado
-        salvar_tarefas()
-    
-    return modelos_carregados[nome_modelo]
+    # Arquivos e checkpoints que ficaram sem tarefa (quedas no meio de uma remoção, versões anteriores)
+    ids = set(armazenamento_tarefas.listar())
+    orfaos = resultados_tarefas.remover_orfaos(ids)
+    for tarefa_id in checkpoints_transcricao.tarefas():
+        if tarefa_id not in ids:
+            checkpoints_transcricao.remover(tarefa_id)
 
-# Thread worker para processar tarefas em segundo plano
-def worker_thread():
+    if removidas:
+        armazenamento_tarefas.compactar()
+    if removidas or orfaos:
+        print(f"Limpeza: {removidas} tarefas e {orfaos} arquivos de resultado órfãos apagados")
+    return removidas
+
+def limpeza_periodica():
+    """Roda a limpeza ao iniciar e depois a cada WHISPER_LIMPEZA_INTERVALO segundos."""
     while True:
         try:
-            # Obtém uma tarefa da fila
-            tarefa = tarefas_fila.get()
-            if tarefa is None:
-                break
-                
-            # Atualiza o status da tarefa
-            tarefa_id = tarefa["id"]
-            tarefas_status[tarefa_id]["status"] = "processando"
-            tarefas_status[tarefa_id]["progresso"] = 5
-            salvar_tarefas()  # Salva o status atualizado
-            
-            # Processa a tarefa
-            try:
-                # Carrega o modelo
-                modelo_nome = tarefa["modelo"]
-                print(f"Carregando modelo {modelo_nome}...")
-                modelo_whisper = carregar_modelo(modelo_nome)
-                
-                # Define o dispositivo para o modelo
-                torch_device = tarefa["dispositivo"]
-                if torch_device == "cuda":
-                    modelo_whisper.to(torch_device)
-                
-                # Configura as opções de transcrição
-                opcoes = {
-                    "task": "translate" if tarefa["tarefa"] == "traducao" else "transcribe",
-                    "fp16": torch.cuda.is_available() and torch_device == "cuda"
-                }
-                
-                # Adiciona o idioma se não for auto
-                if tarefa["idioma"] != 'auto':
-                    opcoes["language"] = tarefa["idioma"]
-                
-                print(f"Iniciando transcrição com opções: {opcoes}")
-                
-                # Atualiza o status
-                tarefas_status[tarefa_id]["status"] = "transcrevendo"
-                tarefas_status[tarefa_id]["progresso"] = 40
-                salvar_tarefas()  # Salva o status atualizado
-                
-                # Realiza a transcrição
-                tempo_inicio_transcricao = time.time()
-                resultado = modelo_whisper.transcribe(tarefa["arquivo_temp"], **opcoes)
-                tempo_transcricao = time.time() - tempo_inicio_transcricao
-                print(f"Transcrição concluída em {tempo_transcricao:.2f} segundos")
-                
-                # Atualiza o progresso
-                tarefas_status[tarefa_id]["progresso"] = 70
-                salvar_tarefas()  # Salva o status atualizado
-                
-                # Cria um arquivo temporário para a saída
-                formato = tarefa["formato"]
-                saida_temp = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{formato}')
-                
-                # Escreve o resultado no formato solicitado
-                if formato == 'txt':
-                    with open(saida_temp.name, 'w', encoding='utf-8') as f:
-                        f.write(resultado["text"])
-                elif formato == 'srt':
-                    with open(saida_temp.name, 'w', encoding='utf-8') as f:
-                        write_srt(resultado["segments"], f)
-                elif formato == 'vtt':
-                    with open(saida_temp.name, 'w', encoding='utf-8') as f:
-                        write_vtt(resultado["segments"], f)
-                elif formato == 'json':
-                    with open(saida_temp.name, 'w', encoding='utf-8') as f:
-                        import json
-                        json.dump(resultado, f, ensure_ascii=False, indent=2)
-                
-                # Cria um diretório para armazenar os resultados permanentemente
-                resultados_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
-                os.makedirs(resultados_dir, exist_ok=True)
-                
-                # Cria um nome de arquivo único para o resultado
-                nome_arquivo_resultado = f"{tarefa_id}_{os.path.splitext(tarefa['nome_arquivo'])[0]}.{formato}"
-                caminho_resultado = os.path.join(resultados_dir, nome_arquivo_resultado)
-                
-                # Copia o arquivo temporário para o diretório de resultados
-                with open(saida_temp.name, 'rb') as f_src:
-                    with open(caminho_resultado, 'wb') as f_dst:
-                        f_dst.write(f_src.read())
-                
-                # Atualiza o status da tarefa
-                tarefas_status[tarefa_id]["status"] = "concluido"
-                tarefas_status[tarefa_id]["arquivo_saida"] = caminho_resultado
-                tarefas_status[tarefa_id]["nome_arquivo_saida"] = os.path.splitext(tarefa["nome_arquivo"])[0] + f'.{formato}'
-                tarefas_status[tarefa_id]["tempo_processamento"] = tempo_transcricao
-                tarefas_status[tarefa_id]["progresso"] = 100
-                salvar_tarefas()  # Salva o status atualizado
-                
-            except Exception as e:
-                import traceback
-                print(f"Erro durante a transcrição: {str(e)}")
-                print(traceback.format_exc())
-                
-                # Atualiza o status da tarefa com o erro
-                tarefas_status[tarefa_id]["status"] = "erro"
-                tarefas_status[tarefa_id]["erro"] = str(e)
-                salvar_tarefas()  # Salva o status atualizado
-            
-            finally:
-                # Limpa os arquivos temporários
-                try:
-                    os.remove(tarefa["arquivo_temp"])
-                    os.rmdir(tarefa["temp_dir"])
-                    print("Arquivos temporários removidos")
-                except Exception as e:
-                    print(f"Erro ao remover arquivos temporários: {str(e)}")
-                
-                # Marca a tarefa como concluída na fila
-                tarefas_fila.task_done()
-                
+            limpar_armazenamento()
         except Exception as e:
-            print(f"Erro no worker: {str(e)}")
+            print(f"Erro na limpeza do armazenamento: {str(e)}")
+        time.sleep(LIMPEZA_INTERVALO)
 
-# Inicia o thread worker
-worker = threading.Thread(target=worker_thread, daemon=True)
-worker.start()
+if LIMPEZA_INTERVALO > 0 and PAPEL != "api":
+    threading.Thread(target=limpeza_periodica, name="limpeza", daemon=True).start()
 
 @app.route('/', methods=['GET', 'HEAD'])
 def health_check():
     """Rota para verificação de saúde do servidor."""
     return jsonify({"status": "online", "message": "Servidor Whisper está funcionando"}), 200
 
-@app.route('/transcrever', methods=['POST'])
-def transcrever():
-    print("Iniciando processo de transcrição...")
-    
-    # Verifica se o arquivo foi enviado
-    if 'arquivo' not in request.files:
-        print("Erro: Nenhum arquivo enviado")
-        return jsonify({"erro": "Nenhum arquivo enviado"}), 400
-    
-    arquivo = request.files['arquivo']
-    
-    # Verifica se o nome do arquivo é válido
-    if arquivo.filename == '':
-        print("Erro: Nome de arquivo inválido")
-        return jsonify({"erro": "Nome de arquivo inválido"}), 400
-    
-    # Obtém os parâmetros da requisição
+def estado_prontidao():
+    """Workers vivos e estado do pré-carregamento; pronto quando todos os workers estão
+    vivos e os modelos de WHISPER_PRECARREGAR estão carregados."""
+    workers_vivos = sum(1 for worker in workers if worker.is_alive())
+    estado = dict(precarregamento)
+    pronto = workers_vivos == len(workers) and all(valor == "pronto" for valor in estado.values())
+    return {
+        "pronto": pronto,
+        "workers": workers_vivos,
+        "modelos": estado
+    }
+
+def estado_modelos():
+    """Modelos em memória, uso do orçamento, eventos e fatores de tempo real."""
+    estado = modelos_carregados.estado()
+    with fatores_lock:
+        estado["fatores_tempo_real"] = dict(fatores_tempo_real)
+    return estado
+
+def consultar_estado(comando, local):
+    """Retorna o estado pedido: de `local()` ou, no papel 'api', do serviço de inferência.
+
+    Levanta InferenciaIndisponivel se o serviço não responder.
+    """
+    if PAPEL != "api":
+        return local()
+    return cliente_inferencia.chamar(comando)
+
+def inferencia_indisponivel(e):
+    return jsonify({"erro": f"Serviço de inferência indisponível: {str(e)}"}), 503
+
+@app.route('/pronto', methods=['GET'])
+def verificar_prontidao():
+    """Rota de prontidão: 200 quando os workers estão vivos e os modelos de
+    WHISPER_PRECARREGAR estão carregados, 503 enquanto não estão ou se algum falhou.
+    No papel 'api', reflete o serviço de inferência (503 se ele não responder)."""
+    try:
+        estado = consultar_estado("pronto", estado_prontidao)
+    except InferenciaIndisponivel as e:
+        return jsonify({"pronto": False, "erro": f"Serviço de inferência indisponível: {str(e)}"}), 503
+    return jsonify(estado), 200 if estado["pronto"] else 503
+
+@app.route('/modelos', methods=['GET'])
+def listar_modelos():
+    """Lista os modelos em memória, o uso do orçamento, os eventos de carregamento e descarte
+    e o fator de tempo real médio de cada modelo por tipo de dispositivo."""
+    try:
+        return jsonify(consultar_estado("modelos", estado_modelos))
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Exporta as métricas da fila, dos modelos, dos workers e do cache no formato de texto do Prometheus."""
+    try:
+        texto = consultar_estado("metricas", metricas.exportar)
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    return Response(texto, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/cache', methods=['GET'])
+def estado_cache():
+    """Retorna o tamanho e os contadores de acertos e faltas do cache de transcrições e do cache de áudio."""
+    try:
+        return jsonify(consultar_estado("cache", estado_caches))
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+
+def ler_parametros_transcricao():
+    """Lê e valida os parâmetros de transcrição do formulário da requisição.
+
+    Retorna o dicionário de parâmetros e None, ou None e a resposta de erro.
+    """
     modelo = request.form.get('modelo', 'tiny')
     formato = request.form.get('formato', 'txt')
     dispositivo = request.form.get('dispositivo', 'cpu')
@@ -293,6 +2904,43 @@ def transcrever():
     
     print(f"Parâmetros recebidos: modelo={modelo}, formato={formato}, dispositivo={dispositivo}, idioma={idioma}, tarefa={tarefa}")
     
+    if formato not in FORMATOS:
+        return None, (jsonify({"erro": f"Formato inválido. Use um destes: {', '.join(FORMATOS)}"}), 400)
+    
+    # Prioridade explícita: de -10 a 10, as maiores saem antes da fila
+    try:
+        prioridade = int(request.form.get('prioridade', '0'))
+    except ValueError:
+        prioridade = None
+    if prioridade is None or not -10 <= prioridade <= 10:
+        return None, (jsonify({"erro": "Prioridade inválida. Use um inteiro de -10 a 10"}), 400)
+    
+    # Quantização int8 na CPU: o padrão do servidor, se o envio não escolher
+    quantizacao = request.form.get('quantizacao', QUANTIZACAO_CPU)
+    if quantizacao not in QUANTIZACOES:
+        return None, (jsonify({"erro": f"Quantização inválida. Use uma destas: {', '.join(QUANTIZACOES)}"}), 400)
+    
+    # Cascata: '1' usa o modelo de rascunho do servidor; outro valor é o nome do modelo de rascunho
+    cascata = request.form.get('cascata', '0')
+    if cascata in ('0', ''):
+        cascata = None
+    elif cascata == '1':
+        cascata = CASCATA_MODELO
+    elif cascata not in whisper.available_models():
+        return None, (jsonify({"erro": f"Modelo de rascunho inválido: {cascata}"}), 400)
+    if cascata == modelo:
+        cascata = None
+    
+    # Perfil de decodificação: o padrão do servidor, se o envio não escolher
+    perfil = request.form.get('perfil', PERFIL_PADRAO)
+    if perfil not in PERFIS_DECODIFICACAO:
+        return None, (jsonify({"erro": f"Perfil inválido. Use um destes: {', '.join(ORDEM_PERFIS)}"}), 400)
+    
+    # VAD: '1' decodifica só as regiões com fala, '0' o áudio inteiro; sem o parâmetro, vale WHISPER_VAD
+    vad = request.form.get('vad', '1' if VAD_PADRAO else '0')
+    if vad not in ('0', '1'):
+        return None, (jsonify({"erro": "VAD inválido. Use 0 ou 1"}), 400)
+    
     # Configura o dispositivo
     cuda_disponivel = torch.cuda.is_available()
     if dispositivo == 'cuda' and cuda_disponivel:
@@ -304,45 +2952,118 @@ def transcrever():
             print("AVISO: CUDA solicitado, mas não está disponível. Usando CPU.")
         else:
             print("Usando CPU para processamento.")
+    if torch_device != "cpu":
+        quantizacao = "nenhuma"
     
-    # Salva o arquivo temporariamente
-    temp_dir = tempfile.mkdtemp()
-    temp_path = os.path.join(temp_dir, arquivo.filename)
-    arquivo.save(temp_path)
-    print(f"Arquivo salvo temporariamente em: {temp_path}")
-    
-    # Gera um ID único para a tarefa
-    tarefa_id = str(uuid.uuid4())
-    
-    # Cria uma entrada no dicionário de status
-    tarefas_status[tarefa_id] = {
-        "id": tarefa_id,
-        "nome_arquivo": arquivo.filename,
+    return {
         "modelo": modelo,
         "formato": formato,
         "dispositivo": torch_device,
         "idioma": idioma,
         "tarefa": tarefa,
+        "quantizacao": quantizacao,
+        "cascata": cascata,
+        "vad": vad == '1',
+        "perfil": perfil,
+        "prioridade": prioridade,
+        # Cliente para a divisão justa da fila: o cabeçalho X-Cliente ou o endereço de origem
+        "cliente": request.headers.get('X-Cliente') or request.remote_addr
+    }, None
+
+def criar_tarefa(parametros, nome_arquivo, temp_path, temp_dir, hash_audio, remessa_id=None):
+    """Registra uma tarefa para um áudio já gravado.
+
+    Se o mesmo áudio já foi transcrito com os mesmos parâmetros, a tarefa é
+    concluída pelo cache. Retorna o ID da tarefa e o item a colocar na fila
+    (None se a tarefa já foi concluída).
+    """
+    # Gera um ID único para a tarefa
+    tarefa_id = str(uuid.uuid4())
+    
+    # Cria uma entrada no dicionário de status
+    nova_tarefa = {
+        "id": tarefa_id,
+        "nome_arquivo": nome_arquivo,
+        **parametros,
+        "hash_audio": hash_audio,
+        "arquivo_temp": temp_path,
+        "temp_dir": temp_dir,
         "status": "enfileirado",
         "data_criacao": datetime.now().isoformat(),
-        "progresso": 0
+        "progresso": 0,
+        "versao": 0
     }
+    if remessa_id is not None:
+        nova_tarefa["remessa_id"] = remessa_id
     
-    # Salva o status das tarefas
-    salvar_tarefas()
+    # Registra e salva o status da tarefa
+    with tarefas_lock:
+        if PAPEL != "api":
+            # No papel 'api', as tarefas e as remessas são lidas do armazenamento
+            tarefas_status[tarefa_id] = nova_tarefa
+            if remessa_id is not None:
+                remessas.setdefault(remessa_id, []).append(tarefa_id)
+        salvar_tarefa(nova_tarefa)
     
-    # Adiciona a tarefa à fila
-    tarefas_fila.put({
+    item_fila = {
         "id": tarefa_id,
         "arquivo_temp": temp_path,
         "temp_dir": temp_dir,
-        "nome_arquivo": arquivo.filename,
-        "modelo": modelo,
-        "formato": formato,
-        "dispositivo": torch_device,
-        "idioma": idioma,
-        "tarefa": tarefa
-    })
+        "nome_arquivo": nome_arquivo,
+        **parametros,
+        "hash_audio": hash_audio,
+        "enfileirado_em": time.time()
+    }
+    
+    # Se o mesmo áudio já foi transcrito com os mesmos parâmetros, conclui sem usar o modelo
+    resultado = cache_transcricoes.obter(chave_transcricao(item_fila))
+    if resultado is not None:
+        print(f"Resultado da tarefa {tarefa_id} encontrado no cache")
+        concluir_tarefa(item_fila, resultado, 0.0, em_cache=True)
+        remover_arquivos_temporarios(item_fila)
+        return tarefa_id, None
+    
+    # Mede a duração do áudio para o escalonamento da fila
+    item_fila["duracao_estimada"] = medir_duracao(temp_path)
+    if item_fila["duracao_estimada"] is not None:
+        atualizar_tarefa(tarefa_id, duracao_audio=round(item_fila["duracao_estimada"], 2))
+    return tarefa_id, item_fila
+
+@app.route('/transcrever', methods=['POST'])
+def transcrever():
+    print("Iniciando processo de transcrição...")
+    
+    # Verifica se o arquivo foi enviado
+    if 'arquivo' not in request.files:
+        print("Erro: Nenhum arquivo enviado")
+        return jsonify({"erro": "Nenhum arquivo enviado"}), 400
+    
+    arquivo = request.files['arquivo']
+    
+    # Verifica se o nome do arquivo é válido
+    if arquivo.filename == '':
+        print("Erro: Nome de arquivo inválido")
+        return jsonify({"erro": "Nome de arquivo inválido"}), 400
+    
+    # Obtém os parâmetros da requisição
+    parametros, erro = ler_parametros_transcricao()
+    if erro is not None:
+        return erro
+    
+    # O arquivo já foi gravado no diretório temporário durante a leitura da requisição
+    temp_path, temp_dir, hash_audio = receber_upload(arquivo)
+    print(f"Arquivo salvo temporariamente em: {temp_path}")
+    
+    tarefa_id, item_fila = criar_tarefa(parametros, arquivo.filename, temp_path, temp_dir, hash_audio)
+    if item_fila is None:
+        return jsonify({
+            "id": tarefa_id,
+            "mensagem": "Transcrição encontrada no cache",
+            "status": "concluido"
+        })
+    
+    # Adiciona a tarefa à fila
+    enfileirar(item_fila)
     
     # Retorna o ID da tarefa
     return jsonify({
@@ -351,101 +3072,592 @@ def transcrever():
         "status": "enfileirado"
     })
 
+# Intervalo entre as consultas ao armazenamento no papel 'api', que não é
+# notificado das alterações feitas pelo serviço de inferência
+INTERVALO_CONSULTA = 0.25
+
+def aguardar_no_armazenamento(tarefa_id, versao, aguardar):
+    """Lê a tarefa do armazenamento, esperando até `aguardar` segundos ela sair da `versao`."""
+    limite = time.time() + aguardar
+    while True:
+        tarefa = armazenamento_tarefas.obter(tarefa_id)
+        if (tarefa is None or versao is None or tarefa.get("versao", 0) != versao
+                or tarefa["status"] in STATUS_FINAIS or time.time() >= limite):
+            return tarefa
+        time.sleep(INTERVALO_CONSULTA)
+
 @app.route('/status/<tarefa_id>', methods=['GET'])
 def status_tarefa(tarefa_id):
-    """Retorna o status de uma tarefa."""
-    if tarefa_id not in tarefas_status:
+    """Retorna o status de uma tarefa.
+
+    Com os parâmetros `versao` e `aguardar` (em segundos, até 60), a resposta
+    espera até a tarefa mudar de versão ou o tempo acabar (long polling).
+    """
+    versao = request.args.get('versao', type=int)
+    aguardar = min(request.args.get('aguardar', 0, type=float), 60)
+    
+    if PAPEL == "api":
+        tarefa = aguardar_no_armazenamento(tarefa_id, versao, aguardar)
+        if tarefa is None:
+            return jsonify({"erro": "Tarefa não encontrada"}), 404
+    else:
+        with tarefas_alteradas:
+            if tarefa_id not in tarefas_status:
+                return jsonify({"erro": "Tarefa não encontrada"}), 404
+            
+            if versao is not None and aguardar > 0:
+                tarefas_alteradas.wait_for(
+                    lambda: tarefas_status[tarefa_id].get("versao", 0) != versao
+                    or tarefas_status[tarefa_id]["status"] in STATUS_FINAIS,
+                    timeout=aguardar
+                )
+            tarefa = dict(tarefas_status[tarefa_id])
+    
+    # Posição na fila e início estimado, enquanto a tarefa espera
+    etag = f"{tarefa_id}-{tarefa.get('versao', 0)}"
+    if tarefa["status"] == "enfileirado":
+        if PAPEL == "api":
+            try:
+                previsao = cliente_inferencia.chamar("previsao", tarefa_id=tarefa_id)
+            except InferenciaIndisponivel:
+                previsao = None
+        else:
+            previsao = tarefas_fila.previsao(tarefa_id, workers_por_tipo())
+        if previsao is not None:
+            posicao, espera = previsao
+            tarefa["posicao_fila"] = posicao
+            tarefa["espera_estimada"] = round(espera, 1)
+            tarefa["inicio_estimado"] = datetime.fromtimestamp(time.time() + espera).isoformat()
+            etag += f"-{posicao}-{round(espera)}"
+    
+    modificado_em = datetime.fromisoformat(tarefa.get("atualizado_em") or tarefa["data_criacao"]).timestamp()
+    return resposta_condicional(etag, modificado_em, lambda: jsonify(tarefa))
+
+@app.route('/eventos/<tarefa_id>', methods=['GET'])
+def eventos_tarefa(tarefa_id):
+    """Transmite o status e os segmentos de uma tarefa via Server-Sent Events.
+
+    Eventos `status` trazem a tarefa completa a cada alteração e eventos
+    `segmento` trazem cada trecho transcrito (start, end, text) assim que o
+    Whisper o produz. O fluxo termina quando a tarefa é concluída ou falha.
+    No papel 'api', a tarefa e os segmentos são consultados a cada 250 ms.
+    """
+    if copiar_tarefa(tarefa_id) is None:
         return jsonify({"erro": "Tarefa não encontrada"}), 404
     
-    return jsonify(tarefas_status[tarefa_id])
+    def formatar_evento(tipo, dados):
+        return f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+    
+    def gerar_remoto():
+        # No papel 'api': a tarefa vem do armazenamento e os segmentos, do serviço de inferência
+        versao = None
+        publicados = 0
+        ultimo_envio = time.time()
+        while True:
+            tarefa = armazenamento_tarefas.obter(tarefa_id)
+            if tarefa is None:
+                return
+            if tarefa["status"] not in STATUS_FINAIS:
+                try:
+                    novos = cliente_inferencia.chamar("segmentos", tarefa_id=tarefa_id, desde=publicados)
+                except InferenciaIndisponivel:
+                    novos = []
+                for segmento in novos:
+                    yield formatar_evento("segmento", segmento)
+                publicados += len(novos)
+                if novos:
+                    ultimo_envio = time.time()
+            if tarefa.get("versao", 0) != versao:
+                versao = tarefa.get("versao", 0)
+                yield formatar_evento("status", tarefa)
+                ultimo_envio = time.time()
+                if tarefa["status"] in STATUS_FINAIS:
+                    return
+            elif time.time() - ultimo_envio >= 15:
+                yield ": ping\n\n"
+                ultimo_envio = time.time()
+            time.sleep(INTERVALO_CONSULTA)
+    
+    def gerar():
+        fila, segmentos = canal_eventos.assinar(tarefa_id)
+        try:
+            # Estado atual e segmentos já transcritos, para quem se conecta no meio da tarefa
+            tarefa = copiar_tarefa(tarefa_id)
+            yield formatar_evento("status", tarefa)
+            if tarefa["status"] in STATUS_FINAIS:
+                return
+            for segmento in segmentos:
+                yield formatar_evento("segmento", segmento)
+            
+            while True:
+                try:
+                    tipo, dados = fila.get(timeout=15)
+                except queue.Empty:
+                    # Comentário SSE para manter a conexão aberta em proxies
+                    yield ": ping\n\n"
+                    continue
+                yield formatar_evento(tipo, dados)
+                if tipo == "status" and dados["status"] in STATUS_FINAIS:
+                    return
+        finally:
+            canal_eventos.cancelar(tarefa_id, fila)
+    
+    return Response(
+        stream_with_context(gerar_remoto() if PAPEL == "api" else gerar()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Tipos MIME dos formatos de saída
+TIPOS_MIME = {
+    "txt": "text/plain; charset=utf-8",
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "json": "application/json"
+}
 
 @app.route('/download/<tarefa_id>', methods=['GET'])
 def download_resultado(tarefa_id):
-    """Permite o download do resultado de uma tarefa concluída."""
-    if tarefa_id not in tarefas_status:
+    """Permite o download do resultado de uma tarefa concluída.
+
+    O formato é o escolhido no envio, ou o informado em `?formato=txt|srt|vtt|json`;
+    cada formato é gerado a partir do resultado canônico na primeira vez em que é pedido.
+    """
+    tarefa = copiar_tarefa(tarefa_id)
+    if tarefa is None:
         return jsonify({"erro": "Tarefa não encontrada"}), 404
     
-    tarefa = tarefas_status[tarefa_id]
-    
     if tarefa["status"] != "concluido":
         return jsonify({"erro": "Tarefa ainda não concluída"}), 400
     
-    if not os.path.exists(tarefa["arquivo_saida"]):
+    formato = request.args.get('formato', tarefa["formato"])
+    if formato not in FORMATOS:
+        return jsonify({"erro": f"Formato inválido. Use um destes: {', '.join(FORMATOS)}"}), 400
+    
+    if "arquivo_resultado" in tarefa:
+        caminho = resultados_tarefas.obter(tarefa_id, formato)
+    elif formato == tarefa["formato"]:
+        # Tarefas antigas guardam só o arquivo no formato escolhido no envio
+        caminho = tarefa.get("arquivo_saida")
+    else:
+        return jsonify({"erro": "Esta tarefa só está disponível no formato escolhido no envio"}), 404
+    
+    if caminho is None or not os.path.exists(caminho):
         return jsonify({"erro": "Arquivo de resultado não encontrado"}), 404
     
-    return send_file(
-        tarefa["arquivo_saida"],
-        as_attachment=True,
-        download_name=tarefa["nome_arquivo_saida"],
-        mimetype='application/octet-stream'
-    )
+    download_name = os.path.splitext(tarefa["nome_arquivo"])[0] + f'.{formato}'
+    codificacao = codificacao_arquivo(caminho)
+    if codificacao is None or request.accept_encodings[codificacao]:
+        # Entrega o arquivo sem carregá-lo na memória: o servidor WSGI usa sendfile quando
+        # oferece wsgi.file_wrapper, e Range, ETag e If-Modified-Since são respeitados.
+        # Um arquivo compactado vai como está, com Content-Encoding
+        resposta = send_file(
+            caminho,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype=TIPOS_MIME[formato],
+            conditional=True,
+            etag=True
+        )
+        if codificacao is not None:
+            resposta.headers['Content-Encoding'] = codificacao
+    else:
+        # O cliente não aceita a codificação: descompacta enquanto envia, sem Range.
+        # O corpo é um gerador, e não o arquivo aberto, porque o servidor WSGI
+        # usaria sendfile no descritor e enviaria os bytes compactados do disco
+        info = os.stat(caminho)
+
+        def gerar_descompactado():
+            with abrir_resultado(caminho) as arquivo:
+                yield from iter(lambda: arquivo.read(TAMANHO_BLOCO_UPLOAD), b'')
+
+        def gerar_resposta():
+            resposta = Response(gerar_descompactado(), mimetype=TIPOS_MIME[formato])
+            definir_anexo(resposta, download_name)
+            return resposta
+
+        resposta = resposta_condicional(
+            f"{info.st_mtime_ns:x}-{info.st_size:x}-identity", info.st_mtime, gerar_resposta
+        )
+    if codificacao is not None:
+        resposta.vary.add('Accept-Encoding')
+    return resposta
+
+def definir_anexo(resposta, nome):
+    """Marca a resposta como download com o nome `nome`, como o send_file faz.
+
+    Nomes fora do ASCII vão também em `filename*`, codificados em UTF-8.
+    """
+    try:
+        nome.encode('ascii')
+        nomes = {"filename": nome}
+    except UnicodeEncodeError:
+        simples = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+        nomes = {"filename": simples, "filename*": f"UTF-8''{quote(nome, safe='!#$&+^`|~')}"}
+    resposta.headers.set('Content-Disposition', 'attachment', **nomes)
+
+def resposta_condicional(etag, modificado_em, gerar_resposta):
+    """Responde 304 se o cliente já tem esta versão (If-None-Match ou If-Modified-Since).
+
+    Senão chama `gerar_resposta`. As duas respostas levam ETag e Last-Modified;
+    o corpo só é gerado quando necessário.
+    """
+    ultima_alteracao = datetime.fromtimestamp(int(modificado_em), timezone.utc)
+    if request.if_none_match:
+        nao_modificado = request.if_none_match.contains(etag)
+    else:
+        nao_modificado = request.if_modified_since is not None and ultima_alteracao <= request.if_modified_since
+    resposta = Response(status=304) if nao_modificado else gerar_resposta()
+    resposta.set_etag(etag)
+    resposta.last_modified = ultima_alteracao
+    resposta.cache_control.no_cache = True
+    return resposta
+
+def _codificar_cursor(tarefa):
+    dados = json.dumps([tarefa.get("data_criacao") or "", tarefa["id"]])
+    return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii')
+
+def _decodificar_cursor(cursor):
+    data_criacao, tarefa_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return str(data_criacao), str(tarefa_id)
+
+# Tamanho padrão e máximo das páginas de /tarefas
+LIMITE_PAGINA_PADRAO = 50
+LIMITE_PAGINA_MAXIMO = 500
 
 @app.route('/tarefas', methods=['GET'])
 def listar_tarefas():
-    """Lista todas as tarefas."""
-    return jsonify(list(tarefas_status.values()))
+    """Lista as tarefas da mais recente para a mais antiga, em páginas.
+
+    Filtros opcionais: `status`, `modelo`, `desde` e `ate` (datas ISO 8601 de
+    criação). `limite` define o tamanho da página e `cursor` continua a partir
+    do `proximo_cursor` da página anterior. As consultas usam os índices do
+    armazenamento, sem varrer todas as tarefas.
+    """
+    try:
+        limite = min(max(1, int(request.args.get('limite', LIMITE_PAGINA_PADRAO))), LIMITE_PAGINA_MAXIMO)
+        cursor = request.args.get('cursor')
+        antes_de = _decodificar_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({"erro": "Parâmetros de paginação inválidos"}), 400
+    
+    ate = request.args.get('ate')
+    if ate is not None and len(ate) == 10:
+        # Uma data sem horário inclui o dia inteiro
+        ate += "T23:59:59.999999"
+    
+    def paginar():
+        return armazenamento_tarefas.paginar(
+            status=request.args.get('status'),
+            modelo=request.args.get('modelo'),
+            desde=request.args.get('desde'),
+            ate=ate,
+            antes_de=antes_de,
+            limite=limite
+        )
+
+    def pagina_tarefas(ids):
+        tarefas = ler_tarefas(ids)
+        return jsonify({
+            "tarefas": tarefas,
+            "proximo_cursor": _codificar_cursor(tarefas[-1]) if len(ids) == limite and tarefas else None
+        })
+    
+    if PAPEL == "api":
+        # Sem o contador de versões do processo de inferência, a ETag vem das
+        # versões das tarefas da página, lidas pelo índice sem carregar as
+        # tarefas; a página só é montada quando o cliente não a tem
+        ids = paginar()
+        versoes = armazenamento_tarefas.versoes(ids)
+        etag = "tarefas-" + hashlib.sha1(json.dumps(
+            [(tarefa_id, versoes[tarefa_id][0]) for tarefa_id in ids if tarefa_id in versoes]
+        ).encode()).hexdigest()[:16]
+        modificado_em = max(
+            (datetime.fromisoformat(atualizado_em).timestamp() for _, atualizado_em in versoes.values() if atualizado_em),
+            default=0
+        )
+        return resposta_condicional(etag, modificado_em, lambda: pagina_tarefas(ids))
+    with tarefas_lock:
+        etag = f"tarefas-{id_inicializacao}-{versao_tarefas}"
+        modificado_em = tarefas_alteradas_em
+    return resposta_condicional(etag, modificado_em, lambda: pagina_tarefas(paginar()))
+
+def gravar_entrada(origem, nome, restante_remessa=None):
+    """Copia uma entrada de um pacote, em blocos, para o diretório temporário de uma nova tarefa.
+
+    `restante_remessa` é quanto ainda cabe, em bytes, no limite de extração da
+    remessa (None sem limite). Retorna o caminho, o diretório temporário e o
+    SHA-256 calculado durante a cópia.
+    """
+    temp_dir = tempfile.mkdtemp(dir=UPLOADS_DIR)
+    caminho = os.path.join(temp_dir, secure_filename(os.path.basename(nome)) or 'audio')
+    hash_audio = hashlib.sha256()
+    limite = app.config['MAX_CONTENT_LENGTH']
+    gravados = 0
+    try:
+        with open(caminho, 'wb') as destino:
+            for bloco in iter(lambda: origem.read(TAMANHO_BLOCO_UPLOAD), b''):
+                gravados += len(bloco)
+                if limite is not None and gravados > limite:
+                    raise ValueError(f"{nome} é maior que o limite de {UPLOAD_MAXIMO_MB} MB")
+                if restante_remessa is not None and gravados > restante_remessa:
+                    raise ValueError(f"Os arquivos extraídos passam do limite de {REMESSA_MAXIMO_MB} MB por remessa")
+                hash_audio.update(bloco)
+                destino.write(bloco)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return caminho, temp_dir, hash_audio.hexdigest()
+
+def entradas_pacote(caminho, nome_pacote):
+    """Percorre os arquivos de um pacote zip ou tar já gravado, um de cada vez, sem extraí-lo inteiro.
+
+    Gera pares (nome da entrada, arquivo aberto para leitura). Diretórios e
+    arquivos ocultos (como os de metadados do macOS) são ignorados.
+    """
+    def ignorada(nome):
+        partes = [parte for parte in nome.split('/') if parte not in ('', '.')]
+        return any(parte.startswith('.') or parte == '__MACOSX' for parte in partes)
+
+    if nome_pacote.lower().endswith('.zip'):
+        with zipfile.ZipFile(caminho) as pacote:
+            for info in pacote.infolist():
+                if not info.is_dir() and not ignorada(info.filename):
+                    with pacote.open(info) as entrada:
+                        yield info.filename, entrada
+    else:
+        # 'r|*' lê o tar como fluxo, sem buscar para trás, com qualquer compressão
+        with tarfile.open(caminho, 'r|*') as pacote:
+            for membro in pacote:
+                if membro.isfile() and not ignorada(membro.name):
+                    yield membro.name, pacote.extractfile(membro)
+
+def resumo_remessa(remessa_id):
+    """Retorna as tarefas de uma remessa e o andamento agregado, ou None se ela não existir."""
+    if PAPEL == "api":
+        ids = armazenamento_tarefas.listar_remessa(remessa_id)
+        if not ids:
+            return None
+    else:
+        with tarefas_lock:
+            ids = remessas.get(remessa_id)
+            if ids is None:
+                return None
+            ids = list(ids)
+    tarefas = ler_tarefas(ids)
+    contagem = {}
+    for tarefa in tarefas:
+        contagem[tarefa["status"]] = contagem.get(tarefa["status"], 0) + 1
+    return {
+        "id": remessa_id,
+        "atualizado_em": max((tarefa.get("atualizado_em") or tarefa["data_criacao"] for tarefa in tarefas), default=None),
+        "total": len(tarefas),
+        "status": contagem,
+        "progresso": round(sum(tarefa.get("progresso", 0) for tarefa in tarefas) / len(tarefas), 1) if tarefas else 100,
+        "concluida": all(tarefa["status"] in ("concluido", "erro") for tarefa in tarefas),
+        "tarefas": [
+            {campo: tarefa.get(campo) for campo in ("id", "nome_arquivo", "status", "progresso", "erro", "versao")}
+            for tarefa in tarefas
+        ]
+    }
+
+@app.route('/remessas', methods=['POST'])
+def enviar_remessa():
+    """Cria uma tarefa para cada arquivo enviado de uma vez.
+
+    Aceita vários arquivos no campo `arquivos` (ou `arquivo`) e pacotes zip ou
+    tar, cujos arquivos são extraídos um a um. Os parâmetros de transcrição são
+    os mesmos de /transcrever e valem para todos os arquivos. As tarefas só
+    entram na fila depois que a remessa inteira foi registrada, então o
+    escalonador e os lotes de decodificação enxergam todas juntas.
+    """
+    arquivos = [
+        arquivo for campo in ('arquivos', 'arquivo')
+        for arquivo in request.files.getlist(campo) if arquivo.filename
+    ]
+    if not arquivos:
+        return jsonify({"erro": "Nenhum arquivo enviado"}), 400
+    
+    parametros, erro = ler_parametros_transcricao()
+    if erro is not None:
+        return erro
+    
+    remessa_id = str(uuid.uuid4())
+    recebidos = []
+    extraidos = 0
+    try:
+        for arquivo in arquivos:
+            if arquivo.filename.lower().endswith(EXTENSOES_PACOTE):
+                # O pacote fica no disco só até o fim da requisição
+                arquivo.stream.flush()
+                for nome, entrada in entradas_pacote(arquivo.stream.raw.caminho, arquivo.filename):
+                    if len(recebidos) >= REMESSA_MAXIMO_ARQUIVOS:
+                        raise ValueError(f"A remessa passa do limite de {REMESSA_MAXIMO_ARQUIVOS} arquivos")
+                    restante = REMESSA_MAXIMO_MB * 1024 * 1024 - extraidos if REMESSA_MAXIMO_MB > 0 else None
+                    recebidos.append((os.path.basename(nome), *gravar_entrada(entrada, nome, restante)))
+                    extraidos += os.path.getsize(recebidos[-1][1])
+            else:
+                if len(recebidos) >= REMESSA_MAXIMO_ARQUIVOS:
+                    raise ValueError(f"A remessa passa do limite de {REMESSA_MAXIMO_ARQUIVOS} arquivos")
+                recebidos.append((arquivo.filename, *receber_upload(arquivo)))
+    except Exception as e:
+        for _, _, temp_dir, _ in recebidos:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({"erro": f"Remessa inválida: {str(e)}"}), 400
+    
+    if not recebidos:
+        return jsonify({"erro": "Nenhum arquivo encontrado nos pacotes enviados"}), 400
+    
+    itens = []
+    for nome_arquivo, temp_path, temp_dir, hash_audio in recebidos:
+        _, item_fila = criar_tarefa(parametros, nome_arquivo, temp_path, temp_dir, hash_audio, remessa_id)
+        if item_fila is not None:
+            itens.append(item_fila)
+    for item_fila in itens:
+        enfileirar(item_fila)
+    print(f"Remessa {remessa_id} recebida com {len(recebidos)} arquivos ({len(itens)} enfileirados)")
+    
+    return jsonify(resumo_remessa(remessa_id))
+
+@app.route('/remessas/<remessa_id>', methods=['GET'])
+def status_remessa(remessa_id):
+    """Retorna o andamento agregado de uma remessa e o status de cada tarefa."""
+    resumo = resumo_remessa(remessa_id)
+    if resumo is None:
+        return jsonify({"erro": "Remessa não encontrada"}), 404
+    etag = f"{remessa_id}-{sum(tarefa['versao'] or 0 for tarefa in resumo['tarefas'])}"
+    modificado_em = datetime.fromisoformat(resumo["atualizado_em"]).timestamp() if resumo["atualizado_em"] else time.time()
+    return resposta_condicional(etag, modificado_em, lambda: jsonify(resumo))
+
+class _SaidaZip(io.RawIOBase):
+    """Destino sem busca para o zipfile: acumula os bytes escritos até serem retirados."""
+
+    def __init__(self):
+        self._blocos = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._blocos.append(bytes(dados))
+        return len(dados)
+
+    def retirar(self):
+        dados = b"".join(self._blocos)
+        self._blocos = []
+        return dados
+
+@app.route('/remessas/<remessa_id>/download', methods=['GET'])
+def download_remessa(remessa_id):
+    """Baixa um zip com os resultados das tarefas concluídas da remessa.
+
+    O formato é o escolhido no envio, ou o informado em `?formato=`. O zip é
+    gerado enquanto é enviado, sem ser montado na memória ou no disco, e traz
+    um `remessa.json` com o status de cada arquivo.
+    """
+    resumo = resumo_remessa(remessa_id)
+    if resumo is None:
+        return jsonify({"erro": "Remessa não encontrada"}), 404
+    formato = request.args.get('formato')
+    if formato is not None and formato not in FORMATOS:
+        return jsonify({"erro": f"Formato inválido. Use um destes: {', '.join(FORMATOS)}"}), 400
+    
+    def gerar():
+        saida = _SaidaZip()
+        nomes_usados = set()
+        manifesto = []
+        with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as pacote:
+            for resumo_tarefa in resumo["tarefas"]:
+                tarefa = copiar_tarefa(resumo_tarefa["id"]) or resumo_tarefa
+                item = {"id": tarefa["id"], "nome_arquivo": tarefa["nome_arquivo"], "status": tarefa["status"]}
+                manifesto.append(item)
+                if tarefa["status"] != "concluido":
+                    item["erro"] = tarefa.get("erro")
+                    continue
+                formato_tarefa = formato or tarefa["formato"]
+                if "arquivo_resultado" in tarefa:
+                    caminho = resultados_tarefas.obter(tarefa["id"], formato_tarefa)
+                elif formato_tarefa == tarefa["formato"]:
+                    caminho = tarefa.get("arquivo_saida")
+                else:
+                    caminho = None
+                if caminho is None or not os.path.exists(caminho):
+                    item["erro"] = "Arquivo de resultado não encontrado"
+                    continue
+                
+                base = os.path.splitext(os.path.basename(tarefa["nome_arquivo"]))[0]
+                nome, numero = f"{base}.{formato_tarefa}", 1
+                while nome in nomes_usados:
+                    numero += 1
+                    nome = f"{base}-{numero}.{formato_tarefa}"
+                nomes_usados.add(nome)
+                item["arquivo"] = nome
+                with abrir_resultado(caminho) as origem, pacote.open(nome, 'w') as destino:
+                    for bloco in iter(lambda: origem.read(TAMANHO_BLOCO_UPLOAD), b''):
+                        destino.write(bloco)
+                        yield saida.retirar()
+            pacote.writestr("remessa.json", json.dumps(manifesto, ensure_ascii=False, indent=2))
+        yield saida.retirar()
+    
+    resposta = Response(stream_with_context(gerar()), mimetype='application/zip')
+    resposta.headers['Content-Disposition'] = f'attachment; filename="remessa-{remessa_id}.zip"'
+    return resposta
 
 @app.route('/reenviar/<tarefa_id>', methods=['POST'])
 def reenviar_tarefa(tarefa_id):
-    """Reenvia uma tarefa que falhou para processamento."""
-    if tarefa_id not in tarefas_status:
+    """Reenvia uma tarefa que falhou para processamento.
+
+    Sem um novo arquivo, usa o áudio guardado desde o envio original e retoma
+    a transcrição do ponto salvo nos checkpoints.
+    """
+    tarefa = copiar_tarefa(tarefa_id)
+    if tarefa is None:
         return jsonify({"erro": "Tarefa não encontrada"}), 404
     
-    tarefa = tarefas_status[tarefa_id]
-    
     # Verifica se a tarefa está em estado de erro
     if tarefa["status"] != "erro":
         return jsonify({"erro": "Apenas tarefas com erro podem ser reenviadas"}), 400
     
-    # Verifica se o arquivo de áudio original ainda existe
     arquivo_original = request.files.get('arquivo')
     
-    if not arquivo_original and 'arquivo_temp' not in tarefa:
-        return jsonify({"erro": "Arquivo original não encontrado. Por favor, faça upload novamente."}), 400
-    
     # Se um novo arquivo foi enviado, use-o
     if arquivo_original:
-        # Salva o arquivo temporariamente
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, arquivo_original.filename)
-        arquivo_original.save(temp_path)
+        # O arquivo já foi gravado no diretório da tarefa durante a leitura da requisição
+        temp_path, temp_dir, hash_audio = receber_upload(arquivo_original)
         print(f"Novo arquivo salvo temporariamente em: {temp_path}")
         
+        # Descarta o áudio e o progresso anteriores, que eram de outro arquivo
+        if tarefa.get("temp_dir"):
+            shutil.rmtree(tarefa["temp_dir"], ignore_errors=True)
+        checkpoints_transcricao.remover(tarefa_id)
+        
         # Atualiza o nome do arquivo se necessário
         tarefa["nome_arquivo"] = arquivo_original.filename
+    elif tarefa.get("arquivo_temp") and os.path.exists(tarefa["arquivo_temp"]):
+        temp_path, temp_dir, hash_audio = tarefa["arquivo_temp"], tarefa["temp_dir"], tarefa.get("hash_audio")
     else:
-        # Usa as informações da tarefa original
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, tarefa["nome_arquivo"])
-        
-        # Aqui precisaríamos ter o arquivo original, mas como não temos,
-        # retornamos um erro informando que é necessário enviar o arquivo novamente
+        # O áudio original não foi guardado (tarefas de versões anteriores)
         return jsonify({
             "erro": "Arquivo original não disponível. Por favor, envie o arquivo novamente.",
             "precisa_arquivo": True
         }), 400
     
-    # Atualiza o status da tarefa
-    tarefa["status"] = "enfileirado"
-    tarefa["data_criacao"] = datetime.now().isoformat()
-    tarefa["progresso"] = 0
-    tarefa["erro"] = None
-    
-    # Salva o status atualizado
-    salvar_tarefas()
+    # Atualiza e salva o status da tarefa
+    atualizar_tarefa(
+        tarefa_id,
+        nome_arquivo=tarefa["nome_arquivo"],
+        hash_audio=hash_audio,
+        arquivo_temp=temp_path,
+        temp_dir=temp_dir,
+        status="enfileirado",
+        data_criacao=datetime.now().isoformat(),
+        progresso=0,
+        erro=None,
+        **desfazer_rebaixamento(tarefa)
+    )
     
     # Adiciona a tarefa à fila
-    tarefas_fila.put({
-        "id": tarefa_id,
-        "arquivo_temp": temp_path,
-        "temp_dir": temp_dir,
-        "nome_arquivo": tarefa["nome_arquivo"],
-        "modelo": tarefa["modelo"],
-        "formato": tarefa["formato"],
-        "dispositivo": tarefa["dispositivo"],
-        "idioma": tarefa["idioma"],
-        "tarefa": tarefa["tarefa"]
-    })
+    enfileirar(item_da_tarefa(copiar_tarefa(tarefa_id), duracao_estimada=medir_duracao(temp_path)))
     
     # Retorna o status atualizado
     return jsonify({
@@ -454,8 +3666,212 @@ def reenviar_tarefa(tarefa_id):
         "status": "enfileirado"
     })
 
+def autorizar_no():
+    """Confere a chave enviada por um nó remoto. Retorna a resposta de erro, ou None se autorizado."""
+    if not NOS_CHAVE:
+        return jsonify({"erro": "Nós remotos desativados neste servidor (WHISPER_NOS_CHAVE)"}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {NOS_CHAVE}".encode()):
+        return jsonify({"erro": "Chave do nó inválida"}), 401
+    return None
+
+def executar_comando_no(comando, **dados):
+    """Executa uma operação dos nós remotos aqui ou, no papel 'api', no serviço de inferência."""
+    if PAPEL == "api":
+        return cliente_inferencia.chamar(comando, **dados)
+    return COMANDOS_NOS[comando](**dados)
+
+def arrendamento_perdido():
+    return jsonify({"erro": "Arrendamento vencido ou de outro nó; a tarefa voltou para a fila"}), 409
+
+def falha_comando_no(e):
+    # No papel 'api', os erros do serviço de inferência chegam como RuntimeError
+    return jsonify({"erro": str(e)}), 500
+
+def segmentos_validos(segmentos):
+    """Confere se cada segmento enviado por um nó tem start e end numéricos e text em texto."""
+    def numero(valor):
+        return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+    return all(
+        isinstance(segmento, dict) and numero(segmento.get("start")) and numero(segmento.get("end"))
+        and isinstance(segmento.get("text"), str)
+        for segmento in segmentos
+    )
+
+@app.route('/nos', methods=['GET'])
+def listar_nos():
+    """Lista os nós remotos vistos recentemente e os arrendamentos em andamento."""
+    erro = autorizar_no()
+    if erro:
+        return erro
+    try:
+        return jsonify(executar_comando_no("nos"))
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+
+@app.route('/nos/arrendar', methods=['POST'])
+def arrendar_tarefa():
+    """Entrega a um nó remoto a próxima tarefa que ele pode executar (204 se não houver).
+
+    Corpo JSON: `no` (nome do nó), `dispositivo` (cpu ou cuda), `modelos` (os
+    que o nó tem carregados, no formato de /modelos) e `espera` (segundos, até
+    30, para aguardar uma tarefa). O nó deve renovar o arrendamento antes de
+    `arrendamento_segundos` e baixar o áudio em /nos/arrendamentos/<id>/audio.
+    """
+    erro = autorizar_no()
+    if erro:
+        return erro
+    dados = request.get_json(silent=True) or {}
+    no = str(dados.get("no") or "")
+    dispositivo = str(dados.get("dispositivo") or "cpu")
+    if not no or dispositivo.split(':')[0] not in ("cpu", "cuda"):
+        return jsonify({"erro": "Informe o nome do nó e o dispositivo (cpu ou cuda)"}), 400
+    try:
+        espera = min(max(float(dados.get("espera") or 0), 0), 30)
+    except (TypeError, ValueError):
+        return jsonify({"erro": "Espera inválida"}), 400
+    modelos = [str(modelo) for modelo in dados.get("modelos") or []]
+
+    prazo = time.time() + espera
+    try:
+        while True:
+            # No papel 'api' a espera é feita aqui, sem prender a conexão com o serviço de inferência
+            arrendamento = executar_comando_no("arrendar", no=no, dispositivo=dispositivo, modelos=modelos,
+                                              espera=0 if PAPEL == "api" else espera)
+            if arrendamento is not None or PAPEL != "api" or time.time() >= prazo:
+                break
+            time.sleep(INTERVALO_CONSULTA)
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+    if arrendamento is None:
+        return Response(status=204)
+    return jsonify(arrendamento)
+
+@app.route('/nos/arrendamentos/<arrendamento>/audio', methods=['GET'])
+def audio_arrendamento(arrendamento):
+    """Envia ao nó o áudio original da tarefa arrendada (parâmetro `no`)."""
+    erro = autorizar_no()
+    if erro:
+        return erro
+    try:
+        caminho = executar_comando_no("audio", arrendamento=arrendamento, no=request.args.get('no', ''))
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+    if caminho is None:
+        return arrendamento_perdido()
+    if not os.path.exists(caminho):
+        return jsonify({"erro": "Áudio da tarefa não encontrado"}), 404
+    return send_file(caminho, as_attachment=True, download_name=os.path.basename(caminho), conditional=True)
+
+@app.route('/nos/arrendamentos/<arrendamento>/renovar', methods=['POST'])
+def renovar_arrendamento_no(arrendamento):
+    """Renova um arrendamento (heartbeat) e registra o progresso do nó.
+
+    Corpo JSON: `no` e, opcionalmente, `modelos` carregados, `duracao_audio`,
+    `segundos_decodificados` e os `segmentos` novos desde a última renovação.
+    Responde 409 se o arrendamento venceu: o nó deve abandonar a tarefa.
+    """
+    erro = autorizar_no()
+    if erro:
+        return erro
+    dados = request.get_json(silent=True) or {}
+    try:
+        renovado = executar_comando_no(
+            "renovar",
+            arrendamento=arrendamento,
+            no=str(dados.get("no") or ""),
+            modelos=dados.get("modelos"),
+            duracao_audio=dados.get("duracao_audio"),
+            segundos_decodificados=dados.get("segundos_decodificados"),
+            segmentos=dados.get("segmentos")
+        )
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+    if not renovado:
+        return arrendamento_perdido()
+    return jsonify({"arrendamento_segundos": ARRENDAMENTO_SEGUNDOS})
+
+@app.route('/nos/arrendamentos/<arrendamento>/concluir', methods=['POST'])
+def concluir_arrendamento_no(arrendamento):
+    """Recebe o resultado de uma tarefa arrendada e a conclui.
+
+    Corpo JSON: `no`, `resultado` (text, segments e language, como o
+    transcribe do Whisper), `tempo_transcricao`, `duracao_audio` e `etapas`.
+    """
+    erro = autorizar_no()
+    if erro:
+        return erro
+    dados = request.get_json(silent=True) or {}
+    resultado = dados.get("resultado")
+    if not isinstance(resultado, dict) or not isinstance(resultado.get("text"), str) or not isinstance(resultado.get("segments"), list):
+        return jsonify({"erro": "Resultado inválido: informe text e segments"}), 400
+    if not segmentos_validos(resultado["segments"]):
+        return jsonify({"erro": "Resultado inválido: cada segmento precisa de start e end numéricos e de text"}), 400
+    try:
+        concluido = executar_comando_no(
+            "concluir",
+            arrendamento=arrendamento,
+            no=str(dados.get("no") or ""),
+            resultado=resultado,
+            tempo_transcricao=float(dados.get("tempo_transcricao") or 0),
+            etapas=dados.get("etapas") if isinstance(dados.get("etapas"), dict) else None,
+            duracao_audio=dados.get("duracao_audio")
+        )
+    except (TypeError, ValueError):
+        return jsonify({"erro": "Tempo de transcrição inválido"}), 400
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+    if not concluido:
+        return arrendamento_perdido()
+    return jsonify({"status": "concluido"})
+
+@app.route('/nos/arrendamentos/<arrendamento>/falhar', methods=['POST'])
+def falhar_arrendamento_no(arrendamento):
+    """Registra que o nó não conseguiu transcrever a tarefa arrendada (corpo JSON: `no`, `erro`, `etapas`)."""
+    erro = autorizar_no()
+    if erro:
+        return erro
+    dados = request.get_json(silent=True) or {}
+    try:
+        registrado = executar_comando_no(
+            "falhar",
+            arrendamento=arrendamento,
+            no=str(dados.get("no") or ""),
+            erro=str(dados.get("erro") or "erro desconhecido"),
+            etapas=dados.get("etapas") if isinstance(dados.get("etapas"), dict) else None
+        )
+    except InferenciaIndisponivel as e:
+        return inferencia_indisponivel(e)
+    except RuntimeError as e:
+        return falha_comando_no(e)
+    if not registrado:
+        return arrendamento_perdido()
+    return jsonify({"status": "erro"})
+
+# O serviço de inferência atende a API só depois de todo o módulo carregado
+if PAPEL == "inferencia":
+    servidor_inferencia = ServidorInferencia(INFERENCIA_ENDERECO, chave_compartilhada(DADOS_DIR, criar=True), tratar_comando_inferencia)
+    servidor_inferencia.iniciar()
+    threading.Thread(target=recolhimento_periodico, name="recolhimento", daemon=True).start()
+    print(f"Serviço de inferência aguardando a API em {INFERENCIA_ENDERECO}")
+
 if __name__ == '__main__':
     print(f"CUDA disponível: {torch.cuda.is_available()}")
     if torch.cuda.is_available():
         print(f"Dispositivo CUDA: {torch.cuda.get_device_name(0)}")
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    if PAPEL == "inferencia":
+        # Só a fila e os workers: a API roda em outros processos
+        threading.Event().wait()
+    # Sem o recarregador do modo debug, que importaria o módulo de novo em outro
+    # processo e iniciaria um segundo pool de workers
+    app.run(host='0.0.0.0', port=int(os.environ.get('WHISPER_PORTA', '5000')),
+            debug=os.environ.get('WHISPER_DEBUG', '0') == '1', use_reloader=False)
@@ -0,0 +1,511 @@
+"""
+Benchmark de ponta a ponta do backend: envio, acompanhamento e download de transcrições.
+
+Gera áudios sintéticos de várias durações e os envia em paralelo pelo cliente de
+teste do Flask (/transcrever -> /status -> /download), sem rede e sem GPU. O
+resultado é um JSON com latências p50/p95, tarefas por minuto, fator de tempo
+real e pico de memória, para comparar versões do backend.
+
+Modos:
+- simulado (padrão): um modelo falso que gasta `--fator-simulado` segundos por
+  segundo de áudio, para medir só o custo do servidor (fila, armazenamento,
+  escrita e download);
+- `--modelo-real`: o modelo tiny do Whisper, que precisa estar no cache local
+  (~/.cache/whisper, veja download_models.py);
+- `--vad`: não usa o servidor; mede quanto da fala de áudios sintéticos com
+  duração de fala conhecida a detecção de voz (voz.py) mantém e quanto do resto pula;
+- `--instancias`: não usa o servidor; confere que workers decodificando ao mesmo
+  tempo instâncias de um mesmo modelo do GerenciadorModelos chegam aos mesmos
+  tokens que um worker sozinho (o modelo tem pesos aleatórios, sem download);
+- `--checkpoints`: não usa o servidor; confere que os checkpoints de uma tarefa
+  só são retomados com a mesma chave de modelo e opções (checkpoints.py).
+
+Exemplos:
+    python benchmark.py --trabalhos 40 --concorrencia 8 --saida base.json
+    python benchmark.py --comparar base.json --tolerancia 10
+    python benchmark.py --vad --vad-cobertura-minima 0.98
+    python benchmark.py --instancias --instancias-workers 4
+    python benchmark.py --checkpoints
+"""
+import os
+import io
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import resource
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TAXA_AMOSTRAGEM = 16000
+
+def gerar_audio(duracao, semente):
+    """Gera um WAV mono de 16 kHz com tons modulados, ruído e pausas, parecido com fala."""
+    rng = np.random.default_rng(semente)
+    t = np.arange(int(duracao * TAXA_AMOSTRAGEM)) / TAXA_AMOSTRAGEM
+    frequencias = rng.uniform(120, 300, size=3)
+    sinal = sum(np.sin(2 * np.pi * f * t) for f in frequencias) / 3
+    sinal *= 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    sinal += rng.normal(0, 0.02, size=t.shape)
+    # Uma pausa de meio segundo a cada 4 a 8 segundos
+    posicao = rng.uniform(4, 8)
+    while posicao < duracao:
+        inicio = int(posicao * TAXA_AMOSTRAGEM)
+        sinal[inicio:inicio + TAXA_AMOSTRAGEM // 2] *= 0.01
+        posicao += rng.uniform(4, 8)
+    pcm = (np.clip(sinal, -1, 1) * 32767 * 0.8).astype(np.int16)
+
+    saida = io.BytesIO()
+    with wave.open(saida, 'wb') as arquivo:
+        arquivo.setnchannels(1)
+        arquivo.setsampwidth(2)
+        arquivo.setframerate(TAXA_AMOSTRAGEM)
+        arquivo.writeframes(pcm.tobytes())
+    return saida.getvalue()
+
+def gerar_fala(duracao, semente):
+    """Gera áudio sintético com as regiões de fala conhecidas, para avaliar a detecção de voz.
+
+    Cada fala é uma sequência de palavras (harmônicos de uma fundamental entre
+    100 e 250 Hz) separadas por pausas curtas, com falantes fracos e fortes e
+    algumas vogais longas. Entre as falas há silêncio, ruído branco ou um tom
+    constante. Retorna o áudio em float32 e a lista [(início, fim), ...] da fala.
+    """
+    rng = np.random.default_rng(semente)
+    sinal = rng.normal(0, 0.003, size=int(duracao * TAXA_AMOSTRAGEM)).astype(np.float32)
+    regioes = []
+    posicao = rng.uniform(0.5, 2)
+    while posicao < duracao - 8:
+        amplitude = rng.choice([0.02, 0.05, 0.15, 0.3])
+        fundamental = rng.uniform(100, 250)
+        inicio_fala = posicao
+        fim_fala = posicao + rng.uniform(2, 6)
+        while posicao < fim_fala:
+            duracao_palavra = rng.uniform(1.0, 1.6) if rng.random() < 0.15 else rng.uniform(0.15, 0.5)
+            t = np.arange(int(duracao_palavra * TAXA_AMOSTRAGEM)) / TAXA_AMOSTRAGEM
+            fase = 2 * np.pi * np.cumsum(fundamental * (1 + 0.03 * np.sin(2 * np.pi * rng.uniform(3, 6) * t))) / TAXA_AMOSTRAGEM
+            palavra = sum(np.sin(harmonico * fase) / harmonico for harmonico in range(1, 9)) / 1.5
+            palavra *= amplitude * np.sqrt(np.hanning(len(t)))
+            indice = int(posicao * TAXA_AMOSTRAGEM)
+            sinal[indice:indice + len(palavra)] += palavra.astype(np.float32)
+            posicao += duracao_palavra + rng.uniform(0.05, 0.35)
+        regioes.append((inicio_fala, posicao))
+
+        intervalo = rng.uniform(1.5, 4)
+        inicio, fim = int(posicao * TAXA_AMOSTRAGEM), int(min(duracao, posicao + intervalo) * TAXA_AMOSTRAGEM)
+        tipo = rng.integers(3)
+        if tipo == 1:
+            sinal[inicio:fim] += rng.normal(0, 0.03, size=fim - inicio).astype(np.float32)
+        elif tipo == 2:
+            t = np.arange(fim - inicio) / TAXA_AMOSTRAGEM
+            sinal[inicio:fim] += (0.1 * np.sin(2 * np.pi * rng.uniform(200, 800) * t)).astype(np.float32)
+        posicao += intervalo
+    return sinal, regioes
+
+def avaliar_vad(argumentos):
+    """Roda voz.regioes_fala sobre áudios de gerar_fala e mede a cobertura da fala e o trecho pulado."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import voz
+
+    def mascara(regioes, tamanho):
+        marcados = np.zeros(tamanho, dtype=bool)
+        for inicio, fim in regioes:
+            marcados[int(inicio * TAXA_AMOSTRAGEM):int(fim * TAXA_AMOSTRAGEM)] = True
+        return marcados
+
+    coberturas = []
+    pulados = []
+    tempo_total = 0.0
+    for semente in range(argumentos.vad_audios):
+        audio, verdade = gerar_fala(argumentos.vad_duracao, semente)
+        inicio = time.time()
+        detectadas = voz.regioes_fala(audio, argumentos.vad_silencio)
+        tempo_total += time.time() - inicio
+        fala = mascara(verdade, len(audio))
+        mantido = mascara(detectadas, len(audio))
+        coberturas.append(float(mantido[fala].mean()))
+        pulados.append(float(1 - mantido[~fala].mean()))
+
+    return {
+        "modo": "vad",
+        "parametros": {
+            "audios": argumentos.vad_audios,
+            "duracao": argumentos.vad_duracao,
+            "silencio_minimo": argumentos.vad_silencio
+        },
+        "cobertura_fala": {"minima": round(min(coberturas), 4), "media": round(float(np.mean(coberturas)), 4)},
+        "fracao_pulada": round(float(np.mean(pulados)), 4),
+        "segundos_por_hora": round(tempo_total / (argumentos.vad_audios * argumentos.vad_duracao) * 3600, 3)
+    }
+
+def avaliar_instancias(argumentos):
+    """Decodifica os mesmos áudios com um worker e com vários ao mesmo tempo e compara os tokens."""
+    os.environ.setdefault('WHISPER_DADOS_DIR', tempfile.mkdtemp(prefix='whisper-instancias-'))
+    os.environ['WHISPER_WORKERS_CPU'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import torch
+    import whisper
+    import backend
+
+    torch.manual_seed(0)
+    # Dimensões mínimas com o vocabulário multilíngue, para usar o tokenizador do Whisper
+    dimensoes = whisper.model.ModelDimensions(80, 1500, 64, 1, 2, 51865, 448, 64, 1, 2)
+    modelo = whisper.model.Whisper(dimensoes).eval()
+    gerenciador = backend.GerenciadorModelos(lambda nome, dispositivo: modelo, lambda dispositivo: 1 << 20)
+
+    mels = [
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(gerar_fala(20, semente)[0]))
+        for semente in range(argumentos.instancias_audios)
+    ]
+    opcoes = whisper.DecodingOptions(language="pt", fp16=False, sample_len=argumentos.instancias_tokens)
+
+    def decodificar(mel):
+        instancia = gerenciador.obter("aleatorio", "cpu")
+        try:
+            with torch.no_grad():
+                return whisper.decode(instancia, mel, opcoes).tokens
+        finally:
+            gerenciador.liberar("aleatorio", "cpu", instancia)
+
+    inicio = time.time()
+    referencia = [decodificar(mel) for mel in mels]
+    tempo_sozinho = time.time() - inicio
+
+    inicio = time.time()
+    with ThreadPoolExecutor(max_workers=argumentos.instancias_workers) as executor:
+        concorrentes = list(executor.map(decodificar, mels * argumentos.instancias_workers))
+    tempo_concorrente = time.time() - inicio
+
+    divergentes = sum(
+        1 for indice, tokens in enumerate(concorrentes) if tokens != referencia[indice % len(mels)]
+    )
+    return {
+        "modo": "instancias",
+        "parametros": {
+            "audios": argumentos.instancias_audios,
+            "workers": argumentos.instancias_workers,
+            "tokens": argumentos.instancias_tokens
+        },
+        "decodificacoes": len(concorrentes),
+        "divergentes": divergentes,
+        "instancias": gerenciador.estado()["modelos"][0]["instancias"],
+        "tempo_sozinho": round(tempo_sozinho, 3),
+        "tempo_concorrente": round(tempo_concorrente, 3)
+    }
+
+def avaliar_checkpoints(argumentos):
+    """Grava checkpoints com uma chave e os lê com a mesma e com outra. Retorna as verificações."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from checkpoints import CheckpointsTranscricao
+
+    diretorio = tempfile.mkdtemp(prefix='whisper-checkpoints-')
+    try:
+        checkpoints = CheckpointsTranscricao(diretorio)
+        segmentos = [{"start": 0.0, "end": 30.0, "text": " Um."}, {"start": 30.0, "end": 60.0, "text": " Dois."}]
+        verificacoes = {}
+
+        checkpoints.acrescentar_janela("direta", "tiny|pt|transcribe", 30.0, segmentos[:1])
+        checkpoints.acrescentar_janela("direta", "tiny|pt|transcribe", 60.0, segmentos[1:])
+        verificacoes["janelas_mesma_chave"] = checkpoints.janelas("direta", "tiny|pt|transcribe") == (60.0, segmentos)
+        verificacoes["janelas_outra_chave"] = (
+            checkpoints.janelas("direta", "base|pt|transcribe") == (0.0, [])
+            and "direta" not in checkpoints.tarefas()
+        )
+
+        # Janelas gravadas antes de os checkpoints terem chave
+        os.makedirs(os.path.join(diretorio, "antiga"))
+        with open(os.path.join(diretorio, "antiga", "janelas.jsonl"), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"segundos": 30.0, "segmentos": segmentos[:1]}) + "\n")
+        verificacoes["janelas_sem_chave"] = checkpoints.janelas("antiga", "tiny|pt|transcribe") == (0.0, [])
+
+        checkpoints.salvar_plano("longa", "tiny|pt|transcribe", {"cortes": [600.0], "idioma": "pt"})
+        checkpoints.salvar_trecho("longa", 0, segmentos)
+        plano = checkpoints.plano("longa", "tiny|pt|transcribe")
+        verificacoes["plano_mesma_chave"] = plano is not None and plano["cortes"] == [600.0] and checkpoints.trechos("longa") == {0: segmentos}
+        verificacoes["plano_outra_chave"] = (
+            checkpoints.plano("longa", "tiny|pt|transcribe|perfil=rapido") is None
+            and checkpoints.trechos("longa") == {}
+        )
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    return {"modo": "checkpoints", "verificacoes": verificacoes, "falhas": [nome for nome, ok in verificacoes.items() if not ok]}
+
+def ler_wav(caminho, sr=TAXA_AMOSTRAGEM):
+    """Lê um WAV gerado por `gerar_audio` no formato do whisper.load_audio, sem o ffmpeg."""
+    with wave.open(caminho, 'rb') as arquivo:
+        pcm = np.frombuffer(arquivo.readframes(arquivo.getnframes()), dtype=np.int16)
+    return pcm.astype(np.float32) / 32768.0
+
+def blocos_wav(origem, taxa=TAXA_AMOSTRAGEM):
+    """Lê um WAV gerado por `gerar_audio` em blocos de PCM s16le, no lugar do ffmpeg do audio_pcm."""
+    with wave.open(origem, 'rb') as arquivo:
+        while True:
+            bloco = arquivo.readframes(10 * taxa)
+            if not bloco:
+                break
+            yield bloco
+
+def duracao_wav(caminho):
+    with wave.open(caminho, 'rb') as arquivo:
+        return arquivo.getnframes() / arquivo.getframerate()
+
+def preparar_backend(argumentos, diretorio_dados):
+    """Configura o ambiente, importa o backend e instala o modelo simulado se for o caso."""
+    os.environ['WHISPER_DADOS_DIR'] = diretorio_dados
+    os.environ['WHISPER_WORKERS_CPU'] = str(argumentos.workers)
+    if not argumentos.cache:
+        os.environ['WHISPER_CACHE_MB'] = '0'
+        os.environ['WHISPER_CACHE_PCM_MB'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import torch
+    import whisper
+    import audio_pcm
+    import backend
+
+    # Sem o ffmpeg, os WAVs sintéticos são lidos diretamente
+    if shutil.which('ffmpeg') is None:
+        whisper.load_audio = ler_wav
+        audio_pcm.blocos_pcm = blocos_wav
+    if shutil.which('ffprobe') is None:
+        backend.medir_duracao = duracao_wav
+
+    if argumentos.modelo_real:
+        return backend
+
+    fator = argumentos.fator_simulado
+
+    def segmentos_simulados(duracao):
+        segmentos = []
+        inicio = 0.0
+        while inicio < duracao:
+            fim = min(duracao, inicio + 5.0)
+            segmentos.append({"id": len(segmentos), "start": inicio, "end": fim, "text": f" Trecho {len(segmentos) + 1}."})
+            inicio = fim
+        return {"text": "".join(s["text"] for s in segmentos), "segments": segmentos, "language": "pt"}
+
+    class ModeloSimulado(torch.nn.Module):
+        """Modelo falso que só espera o tempo proporcional à duração do áudio."""
+
+        def __init__(self):
+            super().__init__()
+            self.peso = torch.nn.Parameter(torch.zeros(1024))
+
+        def transcribe(self, audio, **opcoes):
+            duracao = len(audio) / TAXA_AMOSTRAGEM
+            time.sleep(fator * duracao)
+            return segmentos_simulados(duracao)
+
+    def lote_simulado(modelo_whisper, audios, opcoes):
+        duracoes = [len(audio) / TAXA_AMOSTRAGEM for audio in audios]
+        time.sleep(fator * sum(duracoes))
+        return [segmentos_simulados(duracao) for duracao in duracoes]
+
+    whisper.load_model = lambda nome, device=None, **kwargs: ModeloSimulado().to(device)
+    backend.transcrever_lote = lote_simulado
+    return backend
+
+def executar_trabalho(cliente, indice, duracao, argumentos):
+    """Envia um áudio, acompanha a tarefa até o fim e baixa o resultado. Retorna as medidas."""
+    dados = gerar_audio(duracao, indice)
+    inicio = time.time()
+    resposta = cliente.post('/transcrever', data={
+        'arquivo': (io.BytesIO(dados), f'bench_{indice}.wav'),
+        'modelo': argumentos.modelo,
+        'formato': argumentos.formato,
+        'idioma': 'pt',
+        'quantizacao': argumentos.quantizacao
+    }, headers={'X-Cliente': f'bench-{indice % argumentos.concorrencia}'})
+    if resposta.status_code != 200:
+        return {"duracao": duracao, "erro": resposta.get_json()}
+    tarefa_id = resposta.get_json()["id"]
+
+    versao = -1
+    while True:
+        tarefa = cliente.get(f'/status/{tarefa_id}?versao={versao}&aguardar=30').get_json()
+        versao = tarefa.get("versao", 0)
+        if tarefa["status"] in ("concluido", "erro"):
+            break
+    if tarefa["status"] == "erro":
+        return {"duracao": duracao, "erro": tarefa.get("erro")}
+
+    download = cliente.get(f'/download/{tarefa_id}')
+    fim = time.time()
+    return {
+        "duracao": duracao,
+        "latencia": fim - inicio,
+        "tempo_processamento": tarefa.get("tempo_processamento") or 0.0,
+        "fila": (tarefa.get("etapas") or {}).get("fila"),
+        "bytes_download": len(download.data),
+        "erro": None if download.status_code == 200 else f"download {download.status_code}"
+    }
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    return float(np.percentile(valores, p))
+
+def pico_rss_mb():
+    """Pico de memória residente do processo, em MB."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024, 1)
+
+def executar(argumentos):
+    diretorio_dados = tempfile.mkdtemp(prefix='whisper_bench_')
+    # Os logs do backend vão para stderr, para o JSON sair limpo em stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return _executar(argumentos, diretorio_dados)
+
+def _executar(argumentos, diretorio_dados):
+    try:
+        backend = preparar_backend(argumentos, diretorio_dados)
+        cliente = backend.app.test_client()
+        duracoes = [float(d) for d in argumentos.duracoes.split(',')]
+        trabalhos = [(indice, duracoes[indice % len(duracoes)]) for indice in range(argumentos.trabalhos)]
+
+        inicio = time.time()
+        with ThreadPoolExecutor(max_workers=argumentos.concorrencia) as executor:
+            medidas = list(executor.map(lambda t: executar_trabalho(cliente, t[0], t[1], argumentos), trabalhos))
+        tempo_total = time.time() - inicio
+    finally:
+        shutil.rmtree(diretorio_dados, ignore_errors=True)
+
+    sucessos = [m for m in medidas if not m["erro"]]
+    latencias = [m["latencia"] for m in sucessos]
+    audio_total = sum(m["duracao"] for m in sucessos)
+    processamento_total = sum(m["tempo_processamento"] for m in sucessos)
+    por_duracao = {}
+    for duracao in sorted({m["duracao"] for m in sucessos}):
+        latencias_duracao = [m["latencia"] for m in sucessos if m["duracao"] == duracao]
+        por_duracao[f"{duracao:g}"] = {
+            "p50": percentil(latencias_duracao, 50),
+            "p95": percentil(latencias_duracao, 95)
+        }
+
+    return {
+        "modo": "real" if argumentos.modelo_real else "simulado",
+        "modelo": argumentos.modelo,
+        "parametros": {
+            "trabalhos": argumentos.trabalhos,
+            "concorrencia": argumentos.concorrencia,
+            "workers": argumentos.workers,
+            "duracoes": duracoes,
+            "formato": argumentos.formato,
+            "fator_simulado": None if argumentos.modelo_real else argumentos.fator_simulado,
+            "cache": argumentos.cache,
+            "quantizacao": argumentos.quantizacao
+        },
+        "concluidos": len(sucessos),
+        "erros": [m["erro"] for m in medidas if m["erro"]],
+        "tempo_total": round(tempo_total, 3),
+        "latencia": {
+            "p50": percentil(latencias, 50),
+            "p95": percentil(latencias, 95),
+            "media": float(np.mean(latencias)) if latencias else None,
+            "maximo": max(latencias) if latencias else None
+        },
+        "latencia_por_duracao": por_duracao,
+        "espera_fila_p95": percentil([m["fila"] for m in sucessos if m["fila"] is not None], 95),
+        "trabalhos_por_minuto": round(len(sucessos) / tempo_total * 60, 2) if tempo_total else None,
+        "fator_tempo_real": round(processamento_total / audio_total, 4) if audio_total else None,
+        "audio_segundos_por_segundo": round(audio_total / tempo_total, 2) if tempo_total else None,
+        "pico_rss_mb": pico_rss_mb()
+    }
+
+# Métricas comparadas com a execução de referência: nome -> True se maior é melhor
+METRICAS_COMPARADAS = {
+    ("latencia", "p50"): False,
+    ("latencia", "p95"): False,
+    ("trabalhos_por_minuto",): True,
+    ("fator_tempo_real",): False,
+    ("pico_rss_mb",): False
+}
+
+def comparar(atual, referencia, tolerancia):
+    """Compara com uma execução anterior. Retorna as variações e as métricas que pioraram além da tolerância."""
+    variacoes = {}
+    regressoes = []
+    for caminho, maior_melhor in METRICAS_COMPARADAS.items():
+        valor_atual, valor_referencia = atual, referencia
+        for chave in caminho:
+            valor_atual = (valor_atual or {}).get(chave)
+            valor_referencia = (valor_referencia or {}).get(chave)
+        if not valor_atual or not valor_referencia:
+            continue
+        variacao = (valor_atual - valor_referencia) / valor_referencia * 100
+        nome = ".".join(caminho)
+        variacoes[nome] = round(variacao, 1)
+        piora = -variacao if maior_melhor else variacao
+        if piora > tolerancia:
+            regressoes.append(nome)
+    return variacoes, regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do backend do Whisper Web UI")
+    parser.add_argument('--trabalhos', type=int, default=40, help="Número de áudios enviados")
+    parser.add_argument('--concorrencia', type=int, default=8, help="Clientes enviando ao mesmo tempo")
+    parser.add_argument('--duracoes', default='5,20,60,180', help="Durações dos áudios, em segundos, separadas por vírgula")
+    parser.add_argument('--workers', type=int, default=2, help="Workers de CPU do backend (WHISPER_WORKERS_CPU)")
+    parser.add_argument('--formato', default='srt', help="Formato de saída baixado")
+    parser.add_argument('--modelo', default='tiny', help="Nome do modelo enviado nas tarefas")
+    parser.add_argument('--quantizacao', default='nenhuma', choices=('nenhuma', 'int8'), help="Quantização dos modelos na CPU")
+    parser.add_argument('--modelo-real', action='store_true', help="Usa o modelo do Whisper em vez do simulado")
+    parser.add_argument('--fator-simulado', type=float, default=0.01, help="Segundos do modelo simulado por segundo de áudio")
+    parser.add_argument('--cache', action='store_true', help="Mantém ativos o cache de transcrições e o de áudio decodificado")
+    parser.add_argument('--saida', help="Arquivo onde salvar o JSON do resultado")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--tolerancia', type=float, default=10.0, help="Piora máxima aceita na comparação, em %%")
+    parser.add_argument('--vad', action='store_true', help="Avalia só a detecção de voz, sem o servidor")
+    parser.add_argument('--vad-audios', type=int, default=8, help="Áudios sintéticos avaliados com --vad")
+    parser.add_argument('--vad-duracao', type=float, default=120.0, help="Duração de cada áudio de --vad, em segundos")
+    parser.add_argument('--vad-silencio', type=float, default=1.0, help="Pausa mínima pulada (WHISPER_VAD_SILENCIO_SEGUNDOS)")
+    parser.add_argument('--vad-cobertura-minima', type=float, default=0.98, help="Fração da fala que cada áudio precisa manter com --vad")
+    parser.add_argument('--instancias', action='store_true', help="Confere a decodificação concorrente de instâncias do mesmo modelo, sem o servidor")
+    parser.add_argument('--instancias-workers', type=int, default=4, help="Workers decodificando ao mesmo tempo com --instancias")
+    parser.add_argument('--instancias-audios', type=int, default=3, help="Áudios sintéticos decodificados com --instancias")
+    parser.add_argument('--instancias-tokens', type=int, default=24, help="Tokens gerados por áudio com --instancias")
+    parser.add_argument('--checkpoints', action='store_true', help="Confere a retomada dos checkpoints pela chave de modelo e opções, sem o servidor")
+    argumentos = parser.parse_args()
+
+    if argumentos.checkpoints:
+        resultado = avaliar_checkpoints(argumentos)
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        sys.exit(1 if resultado["falhas"] else 0)
+
+    if argumentos.instancias:
+        resultado = avaliar_instancias(argumentos)
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        sys.exit(0 if resultado["divergentes"] == 0 else 1)
+
+    if argumentos.vad:
+        resultado = avaliar_vad(argumentos)
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        sys.exit(0 if resultado["cobertura_fala"]["minima"] >= argumentos.vad_cobertura_minima else 1)
+
+    resultado = executar(argumentos)
+
+    codigo_saida = 0
+    if argumentos.comparar:
+        with open(argumentos.comparar, 'r', encoding='utf-8') as f:
+            referencia = json.load(f)
+        variacoes, regressoes = comparar(resultado, referencia, argumentos.tolerancia)
+        resultado["comparacao"] = {"referencia": argumentos.comparar, "variacao_percentual": variacoes, "regressoes": regressoes}
+        codigo_saida = 1 if regressoes else 0
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if argumentos.saida:
+        with open(argumentos.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+    sys.exit(codigo_saida)
+
+if __name__ == "__main__":
+    main()
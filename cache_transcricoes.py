@@ -0,0 +1,117 @@
+import os
+import gzip
+import json
+import threading
+
+class CacheTranscricoes:
+    """Cache persistente de resultados do Whisper, endereçado pelo conteúdo.
+
+    A chave é calculada pelo backend a partir do hash do áudio e dos parâmetros
+    que mudam o resultado (modelo, idioma, tarefa). Cada resultado fica em um
+    arquivo JSON compactado com gzip. A data de modificação do arquivo marca o
+    último acesso e guia o descarte LRU quando o total passa de `limite_bytes`.
+    Com `limite_bytes` igual a zero o cache fica desativado.
+    """
+
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        # chave -> [tamanho, último acesso]
+        self._entradas = {}
+        self.contadores = {"acertos": 0, "faltas": 0, "descartes": 0}
+        if self.limite_bytes > 0:
+            os.makedirs(diretorio, exist_ok=True)
+            self._indexar()
+
+    def _indexar(self):
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith('.json.gz'):
+                continue
+            info = os.stat(os.path.join(self.diretorio, nome))
+            self._entradas[nome[:-len('.json.gz')]] = [info.st_size, info.st_mtime]
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.json.gz")
+
+    def obter(self, chave, contar=True):
+        """Retorna o resultado salvo para a chave, ou None.
+
+        Com `contar=False` a consulta não entra nos contadores de acertos e
+        faltas: é o caso das novas consultas de uma tarefa que já foi contada
+        no envio.
+        """
+        if chave is None or self.limite_bytes <= 0:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        if entrada is None:
+            # Pode ter sido gravada por outro processo que usa o mesmo diretório
+            try:
+                info = os.stat(self._caminho(chave))
+            except OSError:
+                if contar:
+                    with self._lock:
+                        self.contadores["faltas"] += 1
+                return None
+            entrada = [info.st_size, info.st_mtime]
+            with self._lock:
+                self._entradas[chave] = entrada
+        try:
+            with gzip.open(self._caminho(chave), 'rt', encoding='utf-8') as f:
+                resultado = json.load(f)
+            os.utime(self._caminho(chave))
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler o cache {chave}: {str(e)}")
+            with self._lock:
+                self._entradas.pop(chave, None)
+                if contar:
+                    self.contadores["faltas"] += 1
+            return None
+        with self._lock:
+            entrada[1] = os.path.getmtime(self._caminho(chave))
+            if contar:
+                self.contadores["acertos"] += 1
+        return resultado
+
+    def salvar(self, chave, resultado):
+        """Salva o resultado e descarta as entradas menos usadas se passar do limite."""
+        if chave is None or self.limite_bytes <= 0:
+            return
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with gzip.open(temporario, 'wt', encoding='utf-8', compresslevel=3) as f:
+            json.dump(resultado, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        with self._lock:
+            self._entradas[chave] = [os.path.getsize(caminho), os.path.getmtime(caminho)]
+            self._descartar_excesso()
+
+    def _descartar_excesso(self):
+        total = sum(tamanho for tamanho, _ in self._entradas.values())
+        if total <= self.limite_bytes:
+            return
+        for chave, (tamanho, _) in sorted(self._entradas.items(), key=lambda item: item[1][1]):
+            try:
+                os.remove(self._caminho(chave))
+            except OSError as e:
+                print(f"Erro ao remover entrada do cache {chave}: {str(e)}")
+            del self._entradas[chave]
+            self.contadores["descartes"] += 1
+            total -= tamanho
+            if total <= self.limite_bytes:
+                break
+
+    def estado(self):
+        """Retorna o tamanho do cache e os contadores de acertos, faltas e descartes."""
+        with self._lock:
+            consultas = self.contadores["acertos"] + self.contadores["faltas"]
+            tamanho = sum(tamanho for tamanho, _ in self._entradas.values())
+            return {
+                "entradas": len(self._entradas),
+                "tamanho_bytes": tamanho,
+                "tamanho_mb": round(tamanho / (1024 * 1024), 2),
+                "limite_mb": round(self.limite_bytes / (1024 * 1024), 2),
+                "taxa_acertos": self.contadores["acertos"] / consultas if consultas else None,
+                **self.contadores
+            }
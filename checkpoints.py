@@ -0,0 +1,131 @@
+import os
+import json
+import shutil
+import threading
+
+class CheckpointsTranscricao:
+    """Progresso parcial das transcrições, gravado para retomar depois de uma queda.
+
+    Cada tarefa tem um diretório próprio com:
+
+    - `janelas.jsonl`: uma linha com a chave da transcrição seguida de uma
+      linha por janela de 30 s da transcrição direta, com os segundos já
+      decodificados e os segmentos novos da janela;
+    - `plano.json`: a chave, os cortes e o idioma de uma transcrição longa em trechos;
+    - `trecho_<n>.json`: os segmentos de cada trecho já transcrito.
+
+    A chave identifica o modelo e as opções que produziram os segmentos. Ao
+    retomar com outra chave (a tarefa voltou com outro modelo, por exemplo),
+    o progresso salvo é apagado em vez de misturado ao do novo modelo.
+
+    Uma linha incompleta, deixada por uma queda no meio da escrita, é ignorada;
+    os arquivos JSON são gravados em um temporário e substituídos atomicamente.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, tarefa_id, nome):
+        return os.path.join(self.diretorio, tarefa_id, nome)
+
+    def _gravar_json(self, tarefa_id, nome, dados):
+        caminho = self._caminho(tarefa_id, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+    def _ler_json(self, tarefa_id, nome):
+        try:
+            with open(self._caminho(tarefa_id, nome), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def janelas(self, tarefa_id, chave):
+        """Retorna os segundos já decodificados e os segmentos salvos da transcrição direta.
+
+        Se as janelas foram gravadas com outra chave, apaga o progresso da tarefa
+        e retorna (0.0, []).
+        """
+        try:
+            with open(self._caminho(tarefa_id, 'janelas.jsonl'), 'r', encoding='utf-8') as f:
+                linhas = f.readlines()
+        except OSError:
+            return 0.0, []
+        registros = []
+        for linha in linhas:
+            try:
+                registros.append(json.loads(linha))
+            except json.JSONDecodeError:
+                break
+        if not registros or registros[0].get("chave") != chave:
+            self._descartar(tarefa_id)
+            return 0.0, []
+
+        segundos = 0.0
+        segmentos = []
+        for registro in registros[1:]:
+            segundos = registro["segundos"]
+            segmentos.extend(registro["segmentos"])
+        return segundos, segmentos
+
+    def acrescentar_janela(self, tarefa_id, chave, segundos, segmentos):
+        """Registra uma janela decodificada: até onde o áudio foi e os segmentos novos."""
+        caminho = self._caminho(tarefa_id, 'janelas.jsonl')
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        linha = json.dumps({"segundos": segundos, "segmentos": segmentos}, ensure_ascii=False)
+        with self._lock:
+            with open(caminho, 'a', encoding='utf-8') as f:
+                if f.tell() == 0:
+                    linha = json.dumps({"chave": chave}) + "\n" + linha
+                f.write(linha + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def plano(self, tarefa_id, chave):
+        """Retorna o plano salvo de uma transcrição longa (cortes e idioma), ou None.
+
+        Um plano gravado com outra chave é apagado junto com os trechos da tarefa.
+        """
+        plano = self._ler_json(tarefa_id, 'plano.json')
+        if plano is not None and plano.get("chave") != chave:
+            self._descartar(tarefa_id)
+            return None
+        return plano
+
+    def salvar_plano(self, tarefa_id, chave, plano):
+        self._gravar_json(tarefa_id, 'plano.json', dict(plano, chave=chave))
+
+    def trechos(self, tarefa_id):
+        """Retorna os segmentos dos trechos já transcritos, indexados pelo número do trecho."""
+        diretorio = os.path.join(self.diretorio, tarefa_id)
+        concluidos = {}
+        if not os.path.isdir(diretorio):
+            return concluidos
+        for nome in os.listdir(diretorio):
+            if nome.startswith('trecho_') and nome.endswith('.json'):
+                segmentos = self._ler_json(tarefa_id, nome)
+                if segmentos is not None:
+                    concluidos[int(nome[len('trecho_'):-len('.json')])] = segmentos
+        return concluidos
+
+    def salvar_trecho(self, tarefa_id, indice, segmentos):
+        self._gravar_json(tarefa_id, f'trecho_{indice}.json', segmentos)
+
+    def tarefas(self):
+        """Retorna os IDs das tarefas com progresso salvo."""
+        return [nome for nome in os.listdir(self.diretorio) if os.path.isdir(os.path.join(self.diretorio, nome))]
+
+    def _descartar(self, tarefa_id):
+        print(f"Checkpoints da tarefa {tarefa_id} gravados com outro modelo ou opções; descartados")
+        self.remover(tarefa_id)
+
+    def remover(self, tarefa_id):
+        """Apaga o progresso salvo de uma tarefa."""
+        shutil.rmtree(os.path.join(self.diretorio, tarefa_id), ignore_errors=True)
@@ -1,10 +1,12 @@
 import os
+import argparse
 import whisper
 import torch
+import pesos
 
-def download_models():
+def download_models(modelos=None):
     """
-    Baixa todos os modelos do Whisper para o cache local.
+    Baixa os modelos do Whisper para o cache local (todos, se nenhum for informado).
     """
     print("Verificando disponibilidade de CUDA...")
     cuda_disponivel = torch.cuda.is_available()
@@ -14,7 +16,8 @@ def download_models():
         print("CUDA não disponível. Usando CPU.")
     
     # Lista de todos os modelos disponíveis
-    modelos = ["tiny", "base", "small", "medium", "large", "large-v3"]
+    if not modelos:
+        modelos = ["tiny", "base", "small", "medium", "large", "large-v3"]
     
     # Diretório de cache
     cache_dir = os.path.expanduser("~/.cache/whisper")
@@ -48,5 +51,29 @@ def download_models():
             tamanho = os.path.getsize(os.path.join(cache_dir, modelo)) / (1024 * 1024)  # Tamanho em MB
             print(f"- {modelo}: {tamanho:.1f} MB")
 
+def converter_modelos(modelos, tipo, diretorio):
+    """
+    Grava os modelos no formato de carregamento rápido usado pelo backend.
+    """
+    print(f"\nConvertendo modelos para {tipo} em {diretorio}...")
+    for modelo in modelos:
+        try:
+            caminho = pesos.converter_modelo(modelo, tipo, diretorio)
+            tamanho = os.path.getsize(caminho) / (1024 * 1024)
+            print(f"- {os.path.basename(caminho)}: {tamanho:.1f} MB")
+        except Exception as e:
+            print(f"Erro ao converter modelo {modelo}: {str(e)}")
+
 if __name__ == "__main__":
-    download_models() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Baixa os modelos do Whisper e, opcionalmente, os converte para carregamento rápido.")
+    parser.add_argument("modelos", nargs="*", help="Modelos a baixar (padrão: todos)")
+    parser.add_argument("--converter", action="store_true", help="Grava também os pesos no formato de carregamento rápido")
+    parser.add_argument("--tipo", choices=sorted(pesos.TIPOS), default="float32",
+                        help="Tipo dos pesos convertidos: float16 só vale para servidores com GPU")
+    parser.add_argument("--diretorio", default=os.environ.get("WHISPER_PESOS_DIR", pesos.DIRETORIO_PADRAO),
+                        help="Onde gravar os pesos convertidos (padrão: WHISPER_PESOS_DIR)")
+    argumentos = parser.parse_args()
+    download_models(argumentos.modelos)
+    if argumentos.converter:
+        converter_modelos(argumentos.modelos or ["tiny", "base", "small", "medium", "large", "large-v3"],
+                          argumentos.tipo, argumentos.diretorio)
@@ -0,0 +1,253 @@
+import os
+import re
+import gzip
+import json
+import time
+import threading
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Formatos de saída que podem ser gerados a partir do resultado canônico
+FORMATOS = ("txt", "srt", "vtt", "json")
+
+# Compressões aceitas para os arquivos gerados: nome -> extensão do arquivo.
+# O nome é também o valor do cabeçalho Content-Encoding
+COMPRESSOES = {"nenhuma": "", "gzip": ".gz", "zstd": ".zst"}
+
+def codificacao_arquivo(caminho):
+    """Retorna a compressão de um arquivo gerado pela extensão ('gzip', 'zstd'), ou None."""
+    for compressao, extensao in COMPRESSOES.items():
+        if extensao and caminho.endswith(extensao):
+            return compressao
+    return None
+
+def abrir_resultado(caminho):
+    """Abre um arquivo de resultado para leitura binária, descompactando se preciso."""
+    codificacao = codificacao_arquivo(caminho)
+    if codificacao == "gzip":
+        return gzip.open(caminho, 'rb')
+    if codificacao == "zstd":
+        return zstandard.open(caminho, 'rb')
+    return open(caminho, 'rb')
+
+def _tarefa_do_arquivo(nome):
+    # <tarefa_id>.json.gz, <tarefa_id>.<formato>[.gz|.zst] e, nas versões antigas, <tarefa_id>_<nome>.<formato>
+    return re.split(r'[._]', nome, maxsplit=1)[0]
+
+def formatar_tempo(segundos, separador=","):
+    """Formata um tempo em segundos como HH:MM:SS,mmm (SRT) ou HH:MM:SS.mmm (VTT)."""
+    milissegundos = int(round(segundos * 1000))
+    horas, milissegundos = divmod(milissegundos, 3600000)
+    minutos, milissegundos = divmod(milissegundos, 60000)
+    segundos, milissegundos = divmod(milissegundos, 1000)
+    return f"{horas:02d}:{minutos:02d}:{segundos:02d}{separador}{milissegundos:03d}"
+
+def formatar_srt(segmentos):
+    """Gera o conteúdo SRT dos segmentos em uma única string."""
+    partes = []
+    for numero, (inicio, fim, texto, *_) in enumerate(segmentos, start=1):
+        partes.append(f"{numero}\n{formatar_tempo(inicio)} --> {formatar_tempo(fim)}\n{texto.strip()}\n\n")
+    return "".join(partes)
+
+def formatar_vtt(segmentos):
+    """Gera o conteúdo WebVTT dos segmentos em uma única string."""
+    partes = ["WEBVTT\n\n"]
+    for inicio, fim, texto, *_ in segmentos:
+        partes.append(f"{formatar_tempo(inicio, '.')} --> {formatar_tempo(fim, '.')}\n{texto.strip()}\n\n")
+    return "".join(partes)
+
+# Campos de um segmento do Whisper guardados como [início, fim, texto]; os
+# demais (seek, tokens, temperature, avg_logprob, compression_ratio,
+# no_speech_prob, words) ficam em um dicionário no quarto elemento
+CAMPOS_POSICIONAIS = ("id", "start", "end", "text")
+
+def compactar_resultado(resultado):
+    """Reduz um resultado do Whisper ao texto, ao idioma e aos segmentos como [início, fim, texto, demais campos]."""
+    return {
+        "text": resultado["text"],
+        "language": resultado.get("language"),
+        "segments": [
+            [
+                round(segmento["start"], 3),
+                round(segmento["end"], 3),
+                segmento["text"],
+                {campo: valor for campo, valor in segmento.items() if campo not in CAMPOS_POSICIONAIS}
+            ]
+            for segmento in resultado["segments"]
+        ]
+    }
+
+def renderizar(canonico, formato):
+    """Gera o conteúdo do formato pedido a partir do resultado canônico.
+
+    O JSON traz os segmentos completos, como no resultado do Whisper. Os
+    resultados canônicos antigos, só com [início, fim, texto], geram segmentos
+    sem os demais campos.
+    """
+    segmentos = canonico["segments"]
+    if formato == "txt":
+        return canonico["text"]
+    if formato == "srt":
+        return formatar_srt(segmentos)
+    if formato == "vtt":
+        return formatar_vtt(segmentos)
+    if formato == "json":
+        return json.dumps({
+            "text": canonico["text"],
+            "segments": [
+                {"id": indice, "start": inicio, "end": fim, "text": texto, **(demais[0] if demais else {})}
+                for indice, (inicio, fim, texto, *demais) in enumerate(segmentos)
+            ],
+            "language": canonico["language"]
+        }, ensure_ascii=False, indent=2)
+    raise ValueError(f"Formato desconhecido: {formato}")
+
+class ResultadosTarefas:
+    """Guarda o resultado canônico de cada tarefa e gera os formatos de saída sob demanda.
+
+    O resultado canônico fica em `<tarefa_id>.json.gz` e só é apagado junto com
+    a tarefa. Cada formato pedido é gerado na primeira vez em
+    `<tarefa_id>.<formato>`, compactado com `compressao` se ela não for
+    'nenhuma', e reaproveitado nos pedidos seguintes; só os `maximo_renderizados`
+    arquivos gerados usados mais recentemente são mantidos.
+    """
+
+    def __init__(self, diretorio, maximo_renderizados, compressao="nenhuma"):
+        if compressao not in COMPRESSOES:
+            raise ValueError(f"Compressão desconhecida: {compressao}")
+        if compressao == "zstd" and zstandard is None:
+            raise ValueError("A compressão zstd precisa do pacote zstandard (pip install zstandard)")
+        self.diretorio = diretorio
+        self.maximo_renderizados = maximo_renderizados
+        self.compressao = compressao
+        self._extensao = COMPRESSOES[compressao]
+        self._lock = threading.Lock()
+        # (tarefa_id, formato) -> caminho, do menos para o mais usado
+        self._renderizados = OrderedDict()
+        os.makedirs(diretorio, exist_ok=True)
+        self._indexar()
+
+    def _indexar(self):
+        # Retoma os arquivos gerados em execuções anteriores, do mais antigo para o
+        # mais recente; os gerados com outra compressão são apagados e gerados de novo
+        encontrados = []
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            base = nome
+            for extensao in COMPRESSOES.values():
+                if extensao and base.endswith(extensao):
+                    base = base[:-len(extensao)]
+                    break
+            tarefa_id, _, formato = base.rpartition('.')
+            if formato not in FORMATOS or not os.path.exists(self.caminho_canonico(tarefa_id)):
+                continue
+            if nome != f"{base}{self._extensao}":
+                self._remover(caminho)
+                continue
+            encontrados.append((os.path.getmtime(caminho), (tarefa_id, formato), caminho))
+        for _, chave, caminho in sorted(encontrados):
+            self._renderizados[chave] = caminho
+
+    def caminho_canonico(self, tarefa_id):
+        return os.path.join(self.diretorio, f"{tarefa_id}.json.gz")
+
+    def salvar(self, tarefa_id, resultado):
+        """Grava o resultado canônico da tarefa. Retorna o caminho do arquivo."""
+        caminho = self.caminho_canonico(tarefa_id)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with gzip.open(temporario, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(compactar_resultado(resultado), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporario, caminho)
+        self._esquecer(tarefa_id)
+        return caminho
+
+    def _abrir_escrita(self, caminho):
+        if self.compressao == "gzip":
+            return gzip.open(caminho, 'wt', encoding='utf-8', compresslevel=6)
+        if self.compressao == "zstd":
+            return zstandard.open(caminho, 'wt', encoding='utf-8')
+        return open(caminho, 'w', encoding='utf-8')
+
+    def obter(self, tarefa_id, formato):
+        """Retorna o caminho do arquivo no formato pedido, gerando-o se preciso, ou None."""
+        chave = (tarefa_id, formato)
+        with self._lock:
+            caminho = self._renderizados.get(chave)
+            if caminho is not None and os.path.exists(caminho):
+                self._renderizados.move_to_end(chave)
+                return caminho
+
+        caminho_canonico = self.caminho_canonico(tarefa_id)
+        if not os.path.exists(caminho_canonico):
+            return None
+        with gzip.open(caminho_canonico, 'rt', encoding='utf-8') as f:
+            canonico = json.load(f)
+        caminho = os.path.join(self.diretorio, f"{tarefa_id}.{formato}{self._extensao}")
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with self._abrir_escrita(temporario) as f:
+            f.write(renderizar(canonico, formato))
+        os.replace(temporario, caminho)
+
+        with self._lock:
+            self._renderizados[chave] = caminho
+            self._renderizados.move_to_end(chave)
+            while len(self._renderizados) > self.maximo_renderizados:
+                _, antigo = self._renderizados.popitem(last=False)
+                self._remover(antigo)
+        return caminho
+
+    def remover(self, tarefa_id):
+        """Apaga o resultado canônico e os arquivos gerados de uma tarefa."""
+        self._esquecer(tarefa_id)
+        if os.path.exists(self.caminho_canonico(tarefa_id)):
+            self._remover(self.caminho_canonico(tarefa_id))
+
+    def tamanhos(self):
+        """Retorna os bytes ocupados por tarefa, somando todos os arquivos de cada uma."""
+        tamanhos = {}
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                    tarefa_id = _tarefa_do_arquivo(entrada.name)
+                    tamanhos[tarefa_id] = tamanhos.get(tarefa_id, 0) + entrada.stat().st_size
+        return tamanhos
+
+    def remover_orfaos(self, tarefas_ids, idade_minima=3600):
+        """Apaga os arquivos de tarefas que não existem mais. Retorna quantos foram apagados.
+
+        Arquivos mais novos que `idade_minima` segundos são mantidos, para não
+        apagar o resultado de uma tarefa criada depois de `tarefas_ids` ser
+        montado, nem um temporário ainda em escrita.
+        """
+        removidos = 0
+        limite = time.time() - idade_minima
+        for nome in os.listdir(self.diretorio):
+            tarefa_id = _tarefa_do_arquivo(nome)
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                antigo = os.path.getmtime(caminho) < limite
+            except OSError:
+                continue
+            if tarefa_id not in tarefas_ids and antigo:
+                self._esquecer(tarefa_id)
+                if os.path.exists(caminho):
+                    self._remover(caminho)
+                removidos += 1
+        return removidos
+
+    def _esquecer(self, tarefa_id):
+        with self._lock:
+            for formato in FORMATOS:
+                caminho = self._renderizados.pop((tarefa_id, formato), None)
+                if caminho is not None:
+                    self._remover(caminho)
+
+    def _remover(self, caminho):
+        try:
+            os.remove(caminho)
+        except OSError as e:
+            print(f"Erro ao remover o resultado gerado {caminho}: {str(e)}")
@@ -0,0 +1,132 @@
+import os
+import re
+import sys
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+class InferenciaIndisponivel(Exception):
+    """O serviço de inferência não respondeu (parado, reiniciando ou sem conexão)."""
+
+def endereco_padrao(diretorio):
+    """Endereço local do serviço de inferência: um socket Unix no diretório de dados, ou um pipe no Windows."""
+    if sys.platform == "win32":
+        return r"\\.\pipe\whisper-inferencia"
+    return os.path.join(diretorio, "inferencia.sock")
+
+def interpretar_endereco(endereco):
+    """Converte 'host:porta' em um endereço TCP; qualquer outro valor é um socket Unix ou pipe."""
+    correspondencia = re.fullmatch(r"([\w.-]+):(\d+)", endereco)
+    if correspondencia:
+        return correspondencia.group(1), int(correspondencia.group(2))
+    return endereco
+
+def chave_compartilhada(diretorio, criar=False):
+    """Chave que autentica as conexões entre a API e o serviço de inferência.
+
+    Vem de WHISPER_INFERENCIA_CHAVE ou do arquivo `inferencia.chave` no
+    diretório de dados, gerado pelo serviço de inferência (`criar=True`) com
+    permissão só para o dono.
+    """
+    if os.environ.get('WHISPER_INFERENCIA_CHAVE'):
+        return os.environ['WHISPER_INFERENCIA_CHAVE'].encode()
+    caminho = os.path.join(diretorio, "inferencia.chave")
+    if criar and not os.path.exists(caminho):
+        descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descritor, 'w') as f:
+            f.write(secrets.token_hex(32))
+    with open(caminho, 'r') as f:
+        return f.read().strip().encode()
+
+class ServidorInferencia:
+    """Atende os comandos das APIs no processo de inferência.
+
+    Cada conexão recebe uma thread que lê pedidos (comando, dados), chama
+    `tratar(comando, dados)` e devolve ("ok", resultado) ou ("erro", mensagem).
+    """
+
+    def __init__(self, endereco, chave, tratar):
+        endereco = interpretar_endereco(endereco)
+        if isinstance(endereco, str) and not endereco.startswith("\\\\") and os.path.exists(endereco):
+            # Socket deixado por uma execução anterior que caiu
+            os.remove(endereco)
+        self.tratar = tratar
+        self._ouvinte = Listener(endereco, authkey=chave)
+        self.endereco = self._ouvinte.address
+
+    def iniciar(self):
+        threading.Thread(target=self._aceitar, name="inferencia-ipc", daemon=True).start()
+
+    def _aceitar(self):
+        while True:
+            try:
+                conexao = self._ouvinte.accept()
+            except Exception as e:
+                print(f"Conexão recusada no serviço de inferência: {str(e)}")
+                continue
+            threading.Thread(target=self._atender, args=(conexao,), name="inferencia-conexao", daemon=True).start()
+
+    def _atender(self, conexao):
+        with conexao:
+            while True:
+                try:
+                    comando, dados = conexao.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    resposta = ("ok", self.tratar(comando, dados))
+                except Exception as e:
+                    resposta = ("erro", f"{type(e).__name__}: {str(e)}")
+                try:
+                    conexao.send(resposta)
+                except (EOFError, OSError):
+                    return
+
+class ClienteInferencia:
+    """Envia comandos ao serviço de inferência a partir de um processo da API.
+
+    Mantém uma conexão, aberta no primeiro uso e reaberta uma vez se cair. Os
+    pedidos de threads diferentes são enviados um de cada vez.
+    """
+
+    def __init__(self, endereco, obter_chave, tempo_limite=10):
+        self.endereco = interpretar_endereco(endereco)
+        self.obter_chave = obter_chave
+        self.tempo_limite = tempo_limite
+        self._lock = threading.Lock()
+        self._conexao = None
+
+    def chamar(self, comando, **dados):
+        """Executa o comando no serviço de inferência e retorna o resultado.
+
+        Levanta InferenciaIndisponivel se o serviço não puder ser alcançado, e
+        RuntimeError se o comando falhar do outro lado.
+        """
+        with self._lock:
+            for tentativa in range(2):
+                try:
+                    if self._conexao is None:
+                        self._conexao = Client(self.endereco, authkey=self.obter_chave())
+                    self._conexao.send((comando, dados))
+                    if not self._conexao.poll(self.tempo_limite):
+                        # Sem resposta: a conexão fica em um estado desconhecido e é descartada
+                        self._fechar()
+                        raise InferenciaIndisponivel(f"sem resposta ao comando {comando} em {self.tempo_limite} s")
+                    situacao, resultado = self._conexao.recv()
+                    break
+                except (OSError, EOFError, AuthenticationError) as e:
+                    self._fechar()
+                    if tentativa == 1:
+                        raise InferenciaIndisponivel(str(e)) from e
+        if situacao == "erro":
+            raise RuntimeError(resultado)
+        return resultado
+
+    def _fechar(self):
+        if self._conexao is not None:
+            try:
+                self._conexao.close()
+            except OSError:
+                pass
+            self._conexao = None
@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+# Limites padrão dos histogramas de tempo, em segundos
+LIMITES_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + "}"
+
+def _formatar_valor(valor):
+    if valor == float('inf'):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+class Contador:
+    """Contador que só cresce, com uma série por combinação de rótulos."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            return [(self.nome, list(zip(self.rotulos, chave)), valor) for chave, valor in self._valores.items()]
+
+class Histograma:
+    """Histograma com baldes cumulativos, soma e contagem por combinação de rótulos."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.limites = tuple(sorted(limites))
+        self._lock = threading.Lock()
+        # rótulos -> [contagem por balde, soma, contagem]
+        self._series = {}
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * len(self.limites), 0.0, 0]
+            indice = bisect.bisect_left(self.limites, valor)
+            if indice < len(self.limites):
+                serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def amostras(self):
+        resultado = []
+        with self._lock:
+            for chave, (baldes, soma, contagem) in self._series.items():
+                rotulos = list(zip(self.rotulos, chave))
+                acumulado = 0
+                for limite, quantidade in zip(self.limites, baldes):
+                    acumulado += quantidade
+                    resultado.append((f"{self.nome}_bucket", rotulos + [("le", _formatar_valor(limite))], acumulado))
+                resultado.append((f"{self.nome}_bucket", rotulos + [("le", "+Inf")], contagem))
+                resultado.append((f"{self.nome}_sum", rotulos, soma))
+                resultado.append((f"{self.nome}_count", rotulos, contagem))
+        return resultado
+
+class Coletor:
+    """Métrica lida de outra parte do sistema a cada exportação.
+
+    `coletar` retorna uma lista de pares (dicionário de rótulos, valor).
+    """
+
+    def __init__(self, nome, ajuda, tipo, coletar):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.tipo = tipo
+        self._coletar = coletar
+
+    def amostras(self):
+        return [(self.nome, sorted(rotulos.items()), valor) for rotulos, valor in self._coletar()]
+
+class RegistroMetricas:
+    """Conjunto de métricas exportado no formato de texto do Prometheus."""
+
+    def __init__(self):
+        self._metricas = []
+
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def coletor(self, nome, ajuda, tipo, coletar):
+        return self._registrar(Coletor(nome, ajuda, tipo, coletar))
+
+    def exportar(self):
+        """Gera o texto de exposição (versão 0.0.4) com todas as métricas."""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for nome, rotulos, valor in metrica.amostras():
+                linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}")
+        return "\n".join(linhas) + "\n"
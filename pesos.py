@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import torch
+import whisper
+from torch import nn
+from dataclasses import asdict
+from whisper.model import Whisper, ModelDimensions, AudioEncoder, TextDecoder, LayerNorm, Linear
+from torch.ao.quantization import quantize_dynamic
+
+# Diretório padrão dos pesos convertidos para carregamento rápido
+DIRETORIO_PADRAO = os.path.join(os.path.expanduser("~/.cache/whisper"), "convertidos")
+
+# Tipos aceitos na conversão
+TIPOS = {"float32": torch.float32, "float16": torch.float16}
+
+def _montar_sem_pesos(dims):
+    """Monta um Whisper com os parâmetros no dispositivo meta, sem alocar nem sortear pesos.
+
+    Os parâmetros são trocados pelos do arquivo com load_state_dict(assign=True).
+    Os buffers que não estão no arquivo (máscara causal do decodificador e
+    cabeças de alinhamento) são criados aqui na CPU, como o Whisper os cria.
+    O Whisper(dims) não pode ser montado inteiro no meta porque converte as
+    cabeças de alinhamento para tensor esparso, que o meta não suporta.
+    """
+    with torch.device("meta"):
+        codificador = AudioEncoder(dims.n_mels, dims.n_audio_ctx, dims.n_audio_state, dims.n_audio_head, dims.n_audio_layer)
+        decodificador = TextDecoder(dims.n_vocab, dims.n_text_ctx, dims.n_text_state, dims.n_text_head, dims.n_text_layer)
+    decodificador.mask = torch.empty(dims.n_text_ctx, dims.n_text_ctx).fill_(-np.inf).triu_(1)
+    modelo = Whisper.__new__(Whisper)
+    nn.Module.__init__(modelo)
+    modelo.dims = dims
+    modelo.encoder = codificador
+    modelo.decoder = decodificador
+    # Por padrão, usa a metade final das camadas do decodificador para o alinhamento
+    cabecas = torch.zeros(dims.n_text_layer, dims.n_text_head, dtype=torch.bool)
+    cabecas[dims.n_text_layer // 2:] = True
+    modelo.register_buffer("alignment_heads", cabecas.to_sparse(), persistent=False)
+    return modelo
+
+def caminho_convertido(diretorio, nome_modelo, tipo):
+    return os.path.join(diretorio, f"{nome_modelo}.{tipo}.pt")
+
+def converter_modelo(nome_modelo, tipo="float32", diretorio=DIRETORIO_PADRAO):
+    """Grava os pesos de um modelo já convertidos para `tipo`, prontos para mmap.
+
+    As camadas LayerNorm ficam sempre em float32, porque o Whisper as executa em
+    float32 mesmo quando o resto do modelo roda em float16. Retorna o caminho gravado.
+    """
+    modelo = whisper.load_model(nome_modelo, device="cpu")
+    manter_float32 = {
+        f"{nome}.{parametro}" if nome else parametro
+        for nome, modulo in modelo.named_modules() if isinstance(modulo, LayerNorm)
+        for parametro, _ in modulo.named_parameters(recurse=False)
+    }
+    pesos = {
+        chave: tensor if chave in manter_float32 or not tensor.is_floating_point() else tensor.to(TIPOS[tipo])
+        for chave, tensor in modelo.state_dict().items()
+    }
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = caminho_convertido(diretorio, nome_modelo, tipo)
+    temporario = f"{caminho}.tmp"
+    torch.save({"dims": asdict(modelo.dims), "model_state_dict": pesos}, temporario)
+    os.replace(temporario, caminho)
+    return caminho
+
+def carregar_convertido(nome_modelo, dispositivo, diretorio=DIRETORIO_PADRAO):
+    """Carrega um modelo convertido por converter_modelo, ou retorna None se não houver.
+
+    O arquivo é mapeado na memória em vez de desserializado: na CPU os tensores
+    ficam apoiados no próprio arquivo (no cache de páginas do sistema) e na GPU
+    são copiados direto dele. O modelo é montado sem sortear pesos aleatórios,
+    que seriam descartados em seguida. Na GPU, a versão float16 tem preferência.
+    """
+    tipos = ["float16", "float32"] if dispositivo.startswith("cuda") else ["float32"]
+    for tipo in tipos:
+        caminho = caminho_convertido(diretorio, nome_modelo, tipo)
+        if os.path.exists(caminho):
+            break
+    else:
+        return None
+
+    checkpoint = torch.load(caminho, map_location="cpu", mmap=True, weights_only=True)
+    dims = ModelDimensions(**checkpoint["dims"])
+    modelo = _montar_sem_pesos(dims)
+    modelo.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    if nome_modelo in whisper._ALIGNMENT_HEADS:
+        modelo.set_alignment_heads(whisper._ALIGNMENT_HEADS[nome_modelo])
+    return modelo.to(dispositivo)
+
+def quantizar_int8(modelo):
+    """Troca as camadas lineares do modelo por versões int8 com quantização dinâmica.
+
+    Só vale na CPU. Os pesos das camadas lineares passam a ocupar um quarto da
+    memória e as ativações são quantizadas a cada chamada; embeddings, convoluções
+    e LayerNorm continuam em float32. O modelo é alterado no lugar e retornado.
+    """
+    # O Linear do Whisper só acrescenta a conversão dos pesos para o tipo da
+    # entrada, que na CPU em float32 não faz nada; a quantização só aceita o nn.Linear
+    for modulo in modelo.modules():
+        if type(modulo) is Linear:
+            modulo.__class__ = nn.Linear
+    return quantize_dynamic(modelo.float(), {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def tamanho_bytes(modelo):
+    """Soma os bytes dos tensores do modelo, incluindo os pesos int8 empacotados."""
+    total = 0
+    for valor in modelo.state_dict().values():
+        for tensor in (valor if isinstance(valor, tuple) else (valor,)):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
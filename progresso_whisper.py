@@ -0,0 +1,114 @@
+import sys
+import time
+import types
+import threading
+import contextlib
+import tqdm
+import whisper
+
+# Acompanhamento das chamadas ao transcribe do Whisper, usado pelo backend e
+# pelo worker_remoto. A barra de progresso é instalada no whisper.transcribe
+# uma única vez por processo, ao importar este módulo.
+
+# Observador da transcrição em andamento em cada thread
+_observacao = threading.local()
+
+class ObservadorTranscricao:
+    """Mede uma chamada ao transcribe do Whisper, janela a janela.
+
+    Registra o tempo gasto no espectrograma mel, o tempo de cada janela de 30 s
+    e os segundos de áudio já decodificados. A cada janela, chama
+    ao_avancar(segundos_decodificados, segmentos_novos).
+    """
+
+    def __init__(self, ao_avancar):
+        self.ao_avancar = ao_avancar
+        self.tempo_mel = 0.0
+        self.tempos_janelas = []
+        self.segundos_decodificados = 0.0
+        self._publicados = 0
+        self._ultimo = time.time()
+
+    def ao_calcular_mel(self, segundos):
+        self.tempo_mel += segundos
+        self._ultimo = time.time()
+
+    def ao_decodificar_janela(self, quadros_decodificados, segmentos):
+        agora = time.time()
+        self.tempos_janelas.append(agora - self._ultimo)
+        self._ultimo = agora
+        self.segundos_decodificados = quadros_decodificados * whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE
+        novos = segmentos[self._publicados:]
+        self._publicados = len(segmentos)
+        self.ao_avancar(self.segundos_decodificados, novos)
+
+class _BarraProgressoWhisper(tqdm.tqdm):
+    """Barra de progresso instalada no whisper.transcribe para observar a transcrição.
+
+    O Whisper não oferece callback de progresso. A barra é atualizada ao fim de
+    cada janela de 30 s decodificada, com o avanço em quadros do mel, logo depois
+    de os novos segmentos entrarem na lista `all_segments` do transcribe, que é
+    lida do frame de quem chamou.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.quadros_decodificados = 0
+
+    def update(self, n=1):
+        resultado = super().update(n)
+        self.quadros_decodificados += n
+        observador = getattr(_observacao, "observador", None)
+        if observador is not None:
+            segmentos = sys._getframe(1).f_locals["all_segments"]
+            observador.ao_decodificar_janela(self.quadros_decodificados, segmentos)
+        return resultado
+
+def motivo_incompatibilidade(transcribe):
+    """Confere se o transcribe do Whisper instalado tem o que a barra de progresso usa.
+
+    Retorna None se tiver, ou o motivo da incompatibilidade. A barra depende de
+    detalhes internos do whisper.transcribe, que podem mudar entre versões.
+    """
+    codigo = getattr(transcribe, "__code__", None)
+    if codigo is None:
+        return "whisper.transcribe.transcribe não é uma função Python"
+    if "all_segments" not in codigo.co_varnames:
+        return "o transcribe não tem mais a variável local all_segments"
+    for nome in ("tqdm", "log_mel_spectrogram"):
+        if nome not in codigo.co_names:
+            return f"o transcribe não usa mais {nome}"
+    return None
+
+_whisper_transcribe = sys.modules["whisper.transcribe"]
+_log_mel_spectrogram = _whisper_transcribe.log_mel_spectrogram
+
+def _log_mel_spectrogram_medido(*args, **kwargs):
+    """Calcula o espectrograma mel do transcribe, informando o tempo gasto ao observador."""
+    inicio = time.time()
+    mel = _log_mel_spectrogram(*args, **kwargs)
+    observador = getattr(_observacao, "observador", None)
+    if observador is not None:
+        observador.ao_calcular_mel(time.time() - inicio)
+    return mel
+
+# Sem a barra, a transcrição direta funciona, mas sem segmentos parciais, sem
+# progresso por janela e sem checkpoints para retomar depois de uma queda
+_motivo_sem_progresso = motivo_incompatibilidade(_whisper_transcribe.transcribe)
+PROGRESSO_WHISPER = _motivo_sem_progresso is None
+if PROGRESSO_WHISPER:
+    _whisper_transcribe.tqdm = types.SimpleNamespace(tqdm=_BarraProgressoWhisper)
+    _whisper_transcribe.log_mel_spectrogram = _log_mel_spectrogram_medido
+else:
+    print(f"AVISO: versão do Whisper incompatível com o acompanhamento da transcrição ({_motivo_sem_progresso}); "
+          "segmentos parciais, progresso por janela e checkpoints desativados")
+
+@contextlib.contextmanager
+def observar_transcricao(observador):
+    """Associa um ObservadorTranscricao às chamadas ao transcribe feitas nesta thread."""
+    anterior = getattr(_observacao, "observador", None)
+    _observacao.observador = observador
+    try:
+        yield observador
+    finally:
+        _observacao.observador = anterior
@@ -6,7 +6,7 @@ import { Dropzone } from "@/components/ui/dropzone";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card";
 import * as TabsPrimitive from "@radix-ui/react-tabs";
-import { enviarParaTranscricao, verificarStatusTarefa, baixarResultadoTarefa, listarTarefas, StatusTarefa, reenviarTarefa } from "@/lib/api";
+import { enviarParaTranscricao, verificarStatusTarefa, acompanharTarefa, baixarResultadoTarefa, listarTarefas, StatusTarefa, SegmentoTranscricao, reenviarTarefa } from "@/lib/api";
 import { toast } from "sonner";
 import { carregarTarefasLocal, salvarTarefasLocal, formatarTamanhoArquivo, formatarData } from "@/lib/utils";
 import React from "react";
@@ -61,6 +61,7 @@ export default function WhisperInterface() {
   const [statusBackend, setStatusBackend] = useState<"verificando" | "online" | "offline">("verificando");
   const [tempoEstimado, setTempoEstimado] = useState<number | null>(null);
   const [tarefaAtual, setTarefaAtual] = useState<string | null>(null);
+  const [transcricaoParcial, setTranscricaoParcial] = useState<SegmentoTranscricao[]>([]);
   const [tarefas, setTarefas] = useState<StatusTarefa[]>([]);
   const [abaAtiva, setAbaAtiva] = useState<string>("nova");
   const [tarefaReenvio, setTarefaReenvio] = useState<StatusTarefa | null>(null);
@@ -108,7 +109,7 @@ export default function WhisperInterface() {
   const carregarTarefas = async () => {
     try {
       // Primeiro tenta carregar do backend
-      const tarefasData = await listarTarefas();
+      const { tarefas: tarefasData } = await listarTarefas();
       setTarefas(tarefasData);
       
       // Salva no localStorage para acesso offline
@@ -131,54 +132,81 @@ export default function WhisperInterface() {
     }
   }, []);
 
-  // Atualiza o status da tarefa atual
+  // Acompanha o status da tarefa atual via eventos do servidor, com long polling como alternativa
   useEffect(() => {
     if (!tarefaAtual || statusBackend !== "online") return;
 
-    const intervalId = setInterval(async () => {
-      try {
-        const status = await verificarStatusTarefa(tarefaAtual);
+    let encerrado = false;
+    setTranscricaoParcial([]);
+
+    // Aplica um novo status e retorna true quando a tarefa terminou
+    const aplicarStatus = (status: StatusTarefa): boolean => {
+      // Atualiza a lista de tarefas
+      setTarefas(tarefas => {
+        const tarefasAtualizadas = [...tarefas];
+        const index = tarefasAtualizadas.findIndex(t => t.id === tarefaAtual);
         
-        // Atualiza a lista de tarefas
-        setTarefas(tarefas => {
-          const tarefasAtualizadas = [...tarefas];
-          const index = tarefasAtualizadas.findIndex(t => t.id === tarefaAtual);
-          
-          if (index !== -1) {
-            tarefasAtualizadas[index] = status;
-          } else {
-            tarefasAtualizadas.push(status);
-          }
-          
-          // Salva no localStorage
-          salvarTarefasLocal(tarefasAtualizadas);
-          
-          return tarefasAtualizadas;
-        });
+        if (index !== -1) {
+          tarefasAtualizadas[index] = status;
+        } else {
+          tarefasAtualizadas.push(status);
+        }
         
-        // Atualiza o status de processamento
-        if (status.status === "concluido") {
-          setStatusProcessamento("concluido");
-          toast.success(`Transcrição concluída com sucesso em ${status.tempo_processamento?.toFixed(2) || "?"} segundos!`);
-          clearInterval(intervalId);
-          
-          // Reseta o estado para permitir novos uploads
-          setArquivo(null);
-          setStatusProcessamento("ocioso");
-        } else if (status.status === "erro") {
-          setStatusProcessamento("ocioso");
-          toast.error(`Erro na transcrição: ${status.erro || "Erro desconhecido"}`);
-          clearInterval(intervalId);
-          
-          // Reseta o estado para permitir novos uploads
-          setArquivo(null);
+        // Salva no localStorage
+        salvarTarefasLocal(tarefasAtualizadas);
+        
+        return tarefasAtualizadas;
+      });
+      
+      // Atualiza o status de processamento
+      if (status.status === "concluido") {
+        encerrado = true;
+        setStatusProcessamento("concluido");
+        toast.success(`Transcrição concluída com sucesso em ${status.tempo_processamento?.toFixed(2) || "?"} segundos!`);
+        
+        // Reseta o estado para permitir novos uploads
+        setArquivo(null);
+        setStatusProcessamento("ocioso");
+        return true;
+      } else if (status.status === "erro") {
+        encerrado = true;
+        setStatusProcessamento("ocioso");
+        toast.error(`Erro na transcrição: ${status.erro || "Erro desconhecido"}`);
+        
+        // Reseta o estado para permitir novos uploads
+        setArquivo(null);
+        return true;
+      }
+      return false;
+    };
+
+    // Alternativa quando o navegador ou um proxy não mantém a conexão de eventos
+    const acompanharPorLongPolling = async () => {
+      let versao: number | undefined;
+      while (!encerrado) {
+        try {
+          const status = await verificarStatusTarefa(tarefaAtual, versao);
+          versao = status.versao ?? 0;
+          if (aplicarStatus(status)) return;
+        } catch (error) {
+          console.error("Erro ao verificar status da tarefa:", error);
+          await new Promise(resolve => setTimeout(resolve, 2000));
         }
-      } catch (error) {
-        console.error("Erro ao verificar status da tarefa:", error);
       }
-    }, 2000);
+    };
 
-    return () => clearInterval(intervalId);
+    const encerrarEventos = acompanharTarefa(tarefaAtual, {
+      aoStatus: aplicarStatus,
+      aoSegmento: (segmento) => setTranscricaoParcial(segmentos => [...segmentos, segmento]),
+      aoFalhar: () => {
+        if (!encerrado) acompanharPorLongPolling();
+      },
+    });
+
+    return () => {
+      encerrado = true;
+      encerrarEventos();
+    };
   }, [tarefaAtual, statusBackend]);
 
   // Verifica se há alguma tarefa em andamento
@@ -685,9 +713,23 @@ export default function WhisperInterface() {
                         </div>
                       )}
                       
+                      {tarefa.status === "transcrevendo" && tarefa.tempo_restante_estimado != null && (
+                        <div className="text-sm text-muted-foreground mb-2">
+                          Tempo restante estimado: {Math.ceil(tarefa.tempo_restante_estimado)}s
+                        </div>
+                      )}
+                      
+                      {/* Transcrição parcial recebida em tempo real */}
+                      {tarefa.id === tarefaAtual && tarefa.status !== "concluido" && tarefa.status !== "erro" && transcricaoParcial.length > 0 && (
+                        <div className="text-sm bg-muted rounded-md p-2 mb-2 max-h-40 overflow-y-auto whitespace-pre-wrap">
+                          {transcricaoParcial.map(segmento => segmento.text.trim()).join("\n")}
+                        </div>
+                      )}
+                      
                       {tarefa.tempo_processamento && (
                         <div className="text-sm text-muted-foreground mb-2">
                           Tempo de processamento: {tarefa.tempo_processamento.toFixed(2)}s
+                          {tarefa.fator_tempo_real != null && ` (fator de tempo real: ${tarefa.fator_tempo_real.toFixed(2)})`}
                         </div>
                       )}
                       
@@ -11,6 +11,8 @@ export interface TranscricaoParams {
   dispositivo: string;
   idioma: string;
   tarefa: string;
+  quantizacao?: 'nenhuma' | 'int8';
+  cascata?: string;
 }
 
 // Interface para o status da tarefa
@@ -28,7 +30,58 @@ export interface StatusTarefa {
   erro?: string;
   tempo_processamento?: number;
   arquivo_saida?: string;
+  arquivo_resultado?: string;
   nome_arquivo_saida?: string;
+  versao?: number;
+  duracao_audio?: number;
+  segundos_decodificados?: number;
+  tempo_restante_estimado?: number | null;
+  fator_tempo_real?: number;
+  etapas?: EtapasTarefa;
+  prioridade?: number;
+  quantizacao?: 'nenhuma' | 'int8';
+  cascata?: string | null;
+  cascata_resumo?: ResumoCascata;
+  posicao_fila?: number;
+  espera_estimada?: number;
+  inicio_estimado?: string;
+}
+
+// Resumo de uma transcrição em cascata
+export interface ResumoCascata {
+  modelo_rascunho: string;
+  idioma: string;
+  segmentos_rascunho: number;
+  segmentos_revisados: number;
+  segundos_revisados: number;
+  fracao_revisada: number;
+}
+
+// Tempos, em segundos, de cada etapa do processamento de uma tarefa
+export interface EtapasTarefa {
+  fila?: number;
+  decodificacao_audio?: number;
+  carregamento_modelo?: number;
+  mel?: number;
+  janelas?: { quantidade: number; media: number; p95: number; maximo: number } | null;
+  transcricao?: number;
+  escrita?: number;
+  rascunho?: number;
+  revisao?: number;
+}
+
+// Interface para um segmento transcrito recebido em tempo real
+export interface SegmentoTranscricao {
+  start: number;
+  end: number;
+  text: string;
+}
+
+// Callbacks para acompanhar uma tarefa em tempo real
+export interface AcompanhamentoTarefa {
+  aoStatus: (status: StatusTarefa) => void;
+  aoSegmento?: (segmento: SegmentoTranscricao) => void;
+  aoFalhar?: () => void;
 }
 
 // Função para enviar o arquivo de áudio para transcrição
@@ -40,6 +93,12 @@ export async function enviarParaTranscricao(params: TranscricaoParams): Promise<
   formData.append('dispositivo', params.dispositivo);
   formData.append('idioma', params.idioma);
   formData.append('tarefa', params.tarefa);
+  if (params.quantizacao) {
+    formData.append('quantizacao', params.quantizacao);
+  }
+  if (params.cascata) {
+    formData.append('cascata', params.cascata);
+  }
 
   try {
     const response = await axios.post(`${API_URL}/transcrever`, formData, {
@@ -56,9 +115,11 @@ export async function enviarParaTranscricao(params: TranscricaoParams): Promise<
 }
 
 // Função para verificar o status de uma tarefa
-export async function verificarStatusTarefa(id: string): Promise<StatusTarefa> {
+// Com a versão conhecida, o servidor espera até a tarefa mudar (long polling)
+export async function verificarStatusTarefa(id: string, versao?: number, aguardar = 30): Promise<StatusTarefa> {
   try {
-    const response = await axios.get(`${API_URL}/status/${id}`);
+    const params = versao !== undefined ? { versao, aguardar } : undefined;
+    const response = await axios.get(`${API_URL}/status/${id}`, { params });
     return response.data;
   } catch (error) {
     console.error(`Erro ao verificar status da tarefa ${id}:`, error);
@@ -66,10 +127,45 @@ export async function verificarStatusTarefa(id: string): Promise<StatusTarefa> {
   }
 }
 
-// Função para baixar o resultado de uma tarefa
-export async function baixarResultadoTarefa(id: string): Promise<void> {
+// Função para acompanhar uma tarefa via Server-Sent Events
+// Retorna uma função que encerra o acompanhamento
+export function acompanharTarefa(id: string, callbacks: AcompanhamentoTarefa): () => void {
+  const fonte = new EventSource(`${API_URL}/eventos/${id}`);
+  let encerrado = false;
+
+  const encerrar = () => {
+    encerrado = true;
+    fonte.close();
+  };
+
+  fonte.addEventListener('status', (evento) => {
+    const status: StatusTarefa = JSON.parse((evento as MessageEvent).data);
+    if (status.status === 'concluido' || status.status === 'erro') {
+      encerrar();
+    }
+    callbacks.aoStatus(status);
+  });
+
+  fonte.addEventListener('segmento', (evento) => {
+    callbacks.aoSegmento?.(JSON.parse((evento as MessageEvent).data));
+  });
+
+  // Se o stream cair antes do fim da tarefa, quem chamou pode usar o long polling
+  fonte.onerror = () => {
+    if (encerrado) return;
+    console.error(`Conexão de eventos da tarefa ${id} perdida`);
+    encerrar();
+    callbacks.aoFalhar?.();
+  };
+
+  return encerrar;
+}
+
+// Função para baixar o resultado de uma tarefa, no formato do envio ou em outro formato
+export async function baixarResultadoTarefa(id: string, formato?: string): Promise<void> {
   try {
     const response = await axios.get(`${API_URL}/download/${id}`, {
+      params: formato ? { formato } : undefined,
       responseType: 'blob',
     });
 
@@ -116,9 +212,23 @@ export async function baixarResultadoTarefa(id: string): Promise<void> {
 }
 
 // Função para listar todas as tarefas
-export async function listarTarefas(): Promise<StatusTarefa[]> {
+export interface FiltrosTarefas {
+  status?: string;
+  modelo?: string;
+  desde?: string;
+  ate?: string;
+  limite?: number;
+  cursor?: string;
+}
+
+export interface PaginaTarefas {
+  tarefas: StatusTarefa[];
+  proximo_cursor: string | null;
+}
+
+export async function listarTarefas(filtros: FiltrosTarefas = {}): Promise<PaginaTarefas> {
   try {
-    const response = await axios.get(`${API_URL}/tarefas`);
+    const response = await axios.get(`${API_URL}/tarefas`, { params: filtros });
     return response.data;
   } catch (error) {
     console.error('Erro ao listar tarefas:', error);
@@ -126,6 +236,60 @@ export async function listarTarefas(): Promise<StatusTarefa[]> {
   }
 }
 
+// Andamento agregado de uma remessa (vários arquivos enviados de uma vez)
+export interface ResumoRemessa {
+  id: string;
+  atualizado_em: string | null;
+  total: number;
+  status: Record<string, number>;
+  progresso: number;
+  concluida: boolean;
+  tarefas: Pick<StatusTarefa, 'id' | 'nome_arquivo' | 'status' | 'progresso' | 'erro' | 'versao'>[];
+}
+
+// Função para enviar vários arquivos, ou pacotes zip/tar, em uma única remessa
+export async function enviarRemessa(
+  arquivos: File[],
+  params: Omit<TranscricaoParams, 'arquivo'>
+): Promise<ResumoRemessa> {
+  const formData = new FormData();
+  arquivos.forEach((arquivo) => formData.append('arquivos', arquivo));
+  Object.entries(params).forEach(([campo, valor]) => {
+    if (valor) {
+      formData.append(campo, valor);
+    }
+  });
+
+  try {
+    const response = await axios.post(`${API_URL}/remessas`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Erro ao enviar remessa:', error);
+    throw error;
+  }
+}
+
+// Função para verificar o andamento de uma remessa
+export async function verificarRemessa(id: string): Promise<ResumoRemessa> {
+  try {
+    const response = await axios.get(`${API_URL}/remessas/${id}`);
+    return response.data;
+  } catch (error) {
+    console.error('Erro ao verificar remessa:', error);
+    throw error;
+  }
+}
+
+// Endereço do zip com os resultados de uma remessa, para usar em um link de download
+export function urlDownloadRemessa(id: string, formato?: string): string {
+  const consulta = formato ? `?formato=${encodeURIComponent(formato)}` : '';
+  return `${API_URL}/remessas/${id}/download${consulta}`;
+}
+
 // Função para reenviar uma tarefa que falhou
 export async function reenviarTarefa(id: string, arquivo?: File): Promise<{ id: string }> {
   try {
@@ -0,0 +1,145 @@
+import bisect
+import numpy as np
+
+# Taxa de amostragem do áudio decodificado pelo Whisper
+TAXA_AMOSTRAGEM = 16000
+
+# Duração de cada quadro da análise, em segundos
+QUADRO_SEGUNDOS = 0.03
+
+# Quadros analisados de cada vez, para limitar a memória do espectro em áudios longos
+QUADROS_POR_BLOCO = 8192
+
+def _soma_movel(valores, largura):
+    """Soma da janela de `largura` (ímpar) valores centrada em cada posição, com zeros além das bordas."""
+    meio = largura // 2
+    acumulado = np.concatenate(([0], np.cumsum(np.pad(valores, meio))))
+    return acumulado[largura:] - acumulado[:-largura]
+
+def regioes_fala(audio, silencio_minimo=1.0, margem=0.3, fala_minima=0.25, taxa=TAXA_AMOSTRAGEM):
+    """Detecta as regiões com fala em um áudio mono e retorna [(início, fim), ...] em segundos.
+
+    Cada quadro de 30 ms é classificado pela energia, pela fração da energia
+    na faixa da voz (80 Hz a 4 kHz) e pela variação da energia em volta dele
+    (a fala alterna sílabas e pausas; ruído constante e música sustentada
+    variam pouco). O limiar de energia se adapta ao áudio: fica acima do piso
+    de ruído, mas abaixo dos trechos mais fortes. A variação não precisa
+    aparecer no próprio quadro, basta que apareça a até 0,5 s dele, para que
+    uma vogal longa não seja cortada. Uma mediana móvel de ~150 ms suaviza a
+    decisão e um prolongamento (hangover) de ~200 ms mantém os finais de
+    palavra, mais fracos.
+
+    Depois, cada região ganha `margem` segundos de cada lado e as separadas por
+    menos de `silencio_minimo` segundos são unidas. Só então saem as regiões
+    com menos de `fala_minima` segundos de quadros de fala, para que sílabas
+    curtas separadas por pausas breves não sejam descartadas uma a uma.
+    """
+    tamanho = int(QUADRO_SEGUNDOS * taxa)
+    total_quadros = len(audio) // tamanho
+    if total_quadros == 0:
+        return []
+    quadros = np.asarray(audio[:total_quadros * tamanho], dtype=np.float32).reshape(total_quadros, tamanho)
+
+    energia = 10 * np.log10(np.mean(quadros ** 2, axis=1) + 1e-10)
+    frequencias = np.fft.rfftfreq(tamanho, 1 / taxa)
+    faixa_voz = (frequencias >= 80) & (frequencias <= 4000)
+    janela = np.hanning(tamanho).astype(np.float32)
+    razao_voz = np.empty(total_quadros, dtype=np.float32)
+    for inicio in range(0, total_quadros, QUADROS_POR_BLOCO):
+        espectro = np.abs(np.fft.rfft(quadros[inicio:inicio + QUADROS_POR_BLOCO] * janela, axis=1)) ** 2
+        razao_voz[inicio:inicio + QUADROS_POR_BLOCO] = espectro[:, faixa_voz].sum(axis=1) / (espectro.sum(axis=1) + 1e-10)
+
+    # Desvio da energia em uma janela de ~0,5 s centrada em cada quadro
+    vizinhos = max(1, int(round(0.5 / QUADRO_SEGUNDOS))) | 1
+    energia64 = energia.astype(np.float64)
+    media = _soma_movel(energia64, vizinhos) / vizinhos
+    variacao = np.sqrt(np.maximum(_soma_movel(energia64 ** 2, vizinhos) / vizinhos - media ** 2, 0))
+
+    piso = np.percentile(energia, 10)
+    pico = np.percentile(energia, 95)
+    limiar = max(-55.0, min(piso + 10, pico - 25))
+    # A variação vale para a vizinhança do quadro: uma vogal longa entre
+    # sílabas continua valendo como fala, mas um tom ou ruído constante deixa
+    # de valer pouco depois de começar
+    alcance = int(round(0.5 / QUADRO_SEGUNDOS))
+    modulada = _soma_movel((variacao > 3.0).astype(np.int32), 2 * alcance + 1) > 0
+    fala = (energia > limiar) & (razao_voz > 0.6) & modulada
+
+    # Suaviza a decisão: a mediana tira quadros isolados e fecha falhas curtas,
+    # e o prolongamento estende cada trecho de fala pelos quadros seguintes
+    largura_mediana = max(1, int(round(0.15 / QUADRO_SEGUNDOS))) | 1
+    marcada = _soma_movel(fala.astype(np.int32), largura_mediana) > largura_mediana // 2
+    prolongamento = int(round(0.2 / QUADRO_SEGUNDOS))
+    fala = np.convolve(marcada.astype(np.int32), np.ones(prolongamento + 1, dtype=np.int32))[:total_quadros] > 0
+
+    # Converte os quadros marcados em regiões contínuas
+    bordas = np.diff(np.concatenate(([0], fala.astype(np.int8), [0])))
+    inicios = np.flatnonzero(bordas == 1)
+    fins = np.flatnonzero(bordas == -1)
+    duracao = len(audio) / taxa
+
+    # Une as regiões próximas antes de descartar as curtas; cada uma guarda
+    # também os quadros que cobre
+    unidas = []
+    for inicio, fim in zip(inicios, fins):
+        inicio_segundos = max(0.0, inicio * QUADRO_SEGUNDOS - margem)
+        fim_segundos = min(duracao, fim * QUADRO_SEGUNDOS + margem)
+        if unidas and inicio_segundos - unidas[-1][1] < silencio_minimo:
+            unidas[-1][1] = fim_segundos
+            unidas[-1][3] = fim
+        else:
+            unidas.append([inicio_segundos, fim_segundos, inicio, fim])
+
+    # A duração mínima conta só os quadros marcados, sem o prolongamento
+    regioes = [
+        (inicio, fim) for inicio, fim, primeiro, ultimo in unidas
+        if np.count_nonzero(marcada[primeiro:ultimo]) * QUADRO_SEGUNDOS >= fala_minima
+    ]
+    return [(round(float(inicio), 3), round(float(fim), 3)) for inicio, fim in regioes]
+
+def recortar_fala(audio, regioes, taxa=TAXA_AMOSTRAGEM):
+    """Junta as regiões de fala em um único áudio e retorna o áudio e o mapa de tempos.
+
+    O mapa tem uma entrada (início no áudio recortado, início no original)
+    por região, para converter de volta os tempos com remapear_tempo.
+    """
+    partes = []
+    mapa = []
+    posicao = 0
+    for inicio, fim in regioes:
+        parte = audio[int(inicio * taxa):int(fim * taxa)]
+        mapa.append((posicao / taxa, inicio))
+        partes.append(parte)
+        posicao += len(parte)
+    recortado = np.concatenate(partes) if partes else np.zeros(0, dtype=np.float32)
+    return recortado, mapa
+
+def remapear_tempo(segundos, mapa, fim=False):
+    """Converte um tempo do áudio recortado para o áudio original.
+
+    Um tempo exatamente na junção de duas regiões pertence à região anterior
+    se for o fim de um segmento (`fim=True`) e à seguinte se for um início.
+    """
+    if not mapa:
+        return segundos
+    inicios = [inicio_recortado for inicio_recortado, _ in mapa]
+    indice = (bisect.bisect_left if fim else bisect.bisect_right)(inicios, segundos) - 1
+    inicio_recortado, inicio_original = mapa[max(0, indice)]
+    return round(inicio_original + segundos - inicio_recortado, 3)
+
+def remapear_segmentos(segmentos, mapa):
+    """Retorna cópias dos segmentos (e das palavras, se houver) com os tempos do áudio original."""
+    remapeados = []
+    for segmento in segmentos:
+        novo = dict(segmento, start=remapear_tempo(segmento["start"], mapa), end=remapear_tempo(segmento["end"], mapa, fim=True))
+        if segmento.get("words"):
+            novo["words"] = [
+                dict(palavra, start=remapear_tempo(palavra["start"], mapa), end=remapear_tempo(palavra["end"], mapa, fim=True))
+                for palavra in segmento["words"]
+            ]
+        remapeados.append(novo)
+    return remapeados
+
+def remapear_resultado(resultado, mapa):
+    """Retorna o resultado do transcribe com os tempos dos segmentos no áudio original."""
+    return dict(resultado, segments=remapear_segmentos(resultado["segments"], mapa))
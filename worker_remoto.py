@@ -0,0 +1,323 @@
+"""
+Nó remoto de transcrição: arrenda tarefas da fila de um servidor coordenador por HTTP.
+
+O coordenador é o backend com WHISPER_NOS_CHAVE definida: ele continua dono da
+fila e das tarefas, e cada nó pede a próxima tarefa que pode executar
+(/nos/arrendar), baixa o áudio, transcreve e envia o resultado. Enquanto
+transcreve, o nó renova o arrendamento e informa o progresso; se parar de
+renovar (queda, rede), a tarefa volta para a fila do coordenador depois de
+WHISPER_ARRENDAMENTO_SEGUNDOS e vai para outro nó.
+
+O nó informa os modelos que tem em memória, e o coordenador dá preferência às
+tarefas desses modelos, para evitar recarregar pesos a cada tarefa. Nas tarefas
+com VAD, o nó transcreve só as regiões com fala, como os workers do coordenador.
+
+Exemplos:
+    python worker_remoto.py --coordenador http://servidor:5000 --chave segredo
+    python worker_remoto.py --coordenador http://servidor:5000 --nome gpu-1 --dispositivo cuda --precarregar large-v3
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import traceback
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+import torch
+import whisper
+import pesos
+import voz
+from progresso_whisper import ObservadorTranscricao, observar_transcricao
+
+class ArrendamentoPerdido(Exception):
+    """O coordenador não reconhece mais o arrendamento: ele venceu e a tarefa voltou para a fila."""
+
+class Coordenador:
+    """Cliente das rotas /nos do servidor coordenador."""
+
+    def __init__(self, url, chave, tempo_limite=60):
+        self.url = url.rstrip('/')
+        self.chave = chave
+        self.tempo_limite = tempo_limite
+
+    def _pedir(self, metodo, caminho, dados=None, tempo_limite=None):
+        pedido = urllib.request.Request(
+            self.url + caminho,
+            data=json.dumps(dados).encode('utf-8') if dados is not None else None,
+            method=metodo,
+            headers={"Authorization": f"Bearer {self.chave}", "Content-Type": "application/json"}
+        )
+        try:
+            return urllib.request.urlopen(pedido, timeout=tempo_limite or self.tempo_limite)
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                raise ArrendamentoPerdido(caminho) from e
+            raise
+
+    def _caminho(self, arrendamento, acao):
+        return f"/nos/arrendamentos/{urllib.parse.quote(arrendamento)}/{acao}"
+
+    def arrendar(self, no, dispositivo, modelos, espera):
+        """Pede a próxima tarefa, esperando até `espera` segundos. Retorna o arrendamento ou None."""
+        with self._pedir("POST", "/nos/arrendar", {"no": no, "dispositivo": dispositivo, "modelos": modelos, "espera": espera},
+                         tempo_limite=espera + self.tempo_limite) as resposta:
+            if resposta.status == 204:
+                return None
+            return json.load(resposta)
+
+    def baixar_audio(self, arrendamento, no, destino):
+        with self._pedir("GET", self._caminho(arrendamento, "audio") + "?no=" + urllib.parse.quote(no)) as resposta:
+            with open(destino, 'wb') as f:
+                while True:
+                    bloco = resposta.read(1024 * 1024)
+                    if not bloco:
+                        break
+                    f.write(bloco)
+
+    def renovar(self, arrendamento, no, **dados):
+        """Renova o arrendamento. Retorna False se ele foi perdido."""
+        try:
+            with self._pedir("POST", self._caminho(arrendamento, "renovar"), dict(dados, no=no)):
+                return True
+        except ArrendamentoPerdido:
+            return False
+
+    def concluir(self, arrendamento, no, **dados):
+        with self._pedir("POST", self._caminho(arrendamento, "concluir"), dict(dados, no=no)):
+            pass
+
+    def falhar(self, arrendamento, no, erro, etapas):
+        with self._pedir("POST", self._caminho(arrendamento, "falhar"), {"no": no, "erro": erro, "etapas": etapas}):
+            pass
+
+class ModelosCarregados:
+    """Modelos em memória no nó; acima de `maximo`, descarta o usado há mais tempo.
+
+    Os nomes seguem o coordenador: '+int8' no fim carrega o modelo quantizado.
+    """
+
+    def __init__(self, dispositivo, maximo, diretorio_pesos):
+        self.dispositivo = dispositivo
+        self.maximo = max(1, maximo)
+        self.diretorio_pesos = diretorio_pesos
+        self._modelos = OrderedDict()
+
+    def nomes(self):
+        return list(self._modelos)
+
+    def obter(self, nome_modelo):
+        if nome_modelo in self._modelos:
+            self._modelos.move_to_end(nome_modelo)
+            return self._modelos[nome_modelo]
+
+        while len(self._modelos) >= self.maximo:
+            descartado, _ = self._modelos.popitem(last=False)
+            print(f"Modelo {descartado} descartado")
+            if self.dispositivo.startswith("cuda"):
+                torch.cuda.empty_cache()
+
+        print(f"Carregando modelo {nome_modelo} em {self.dispositivo}...")
+        inicio = time.time()
+        nome_base, _, quantizacao = nome_modelo.partition('+')
+        modelo = pesos.carregar_convertido(nome_base, self.dispositivo, self.diretorio_pesos)
+        if modelo is None:
+            modelo = whisper.load_model(nome_base, device=self.dispositivo)
+        if quantizacao == "int8" and self.dispositivo == "cpu":
+            modelo = pesos.quantizar_int8(modelo)
+        print(f"Modelo {nome_modelo} carregado em {time.time() - inicio:.2f} segundos")
+        self._modelos[nome_modelo] = modelo
+        return modelo
+
+class Acompanhamento:
+    """Renova o arrendamento em segundo plano e envia o progresso da transcrição.
+
+    `avancar` é chamado a cada janela de 30 s do transcribe, por um
+    ObservadorTranscricao, com os segundos decodificados e os segmentos novos;
+    se o coordenador recusou a última renovação, ele interrompe a transcrição
+    com ArrendamentoPerdido.
+    """
+
+    def __init__(self, coordenador, arrendamento, no, intervalo, modelos):
+        self.coordenador = coordenador
+        self.arrendamento = arrendamento
+        self.no = no
+        self.intervalo = intervalo
+        self.modelos = modelos
+        self.perdido = threading.Event()
+        self.duracao_audio = None
+        self.mapa_fala = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._segundos_decodificados = None
+        self._segmentos_novos = []
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._renovar_periodicamente, name="renovacao", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *erro):
+        self.parar()
+
+    def parar(self):
+        """Para as renovações, antes de enviar o resultado ou o erro da tarefa."""
+        self._parar.set()
+        self._thread.join()
+
+    def avancar(self, segundos, novos):
+        if self.perdido.is_set():
+            raise ArrendamentoPerdido(self.arrendamento)
+        if self.mapa_fala is not None:
+            # O coordenador recebe o progresso e os segmentos nos tempos do áudio original
+            segundos = voz.remapear_tempo(segundos, self.mapa_fala, fim=True)
+            novos = voz.remapear_segmentos(novos, self.mapa_fala)
+        with self._lock:
+            self._segundos_decodificados = segundos
+            self._segmentos_novos.extend(novos)
+
+    def _renovar_periodicamente(self):
+        while not self._parar.wait(self.intervalo):
+            with self._lock:
+                segmentos, self._segmentos_novos = self._segmentos_novos, []
+                dados = {
+                    "modelos": self.modelos.nomes(),
+                    "duracao_audio": self.duracao_audio,
+                    "segundos_decodificados": self._segundos_decodificados,
+                    "segmentos": segmentos
+                }
+            try:
+                renovado = self.coordenador.renovar(self.arrendamento, self.no, **dados)
+            except OSError as e:
+                # Tenta de novo na próxima renovação, com os segmentos ainda não enviados
+                print(f"Falha ao renovar o arrendamento: {str(e)}")
+                with self._lock:
+                    self._segmentos_novos[:0] = segmentos
+                continue
+            if not renovado:
+                print(f"Arrendamento {self.arrendamento} perdido; abandonando a tarefa")
+                self.perdido.set()
+                return
+
+def processar(coordenador, no, modelos, arrendamento):
+    """Baixa o áudio de uma tarefa arrendada, transcreve e envia o resultado ao coordenador."""
+    arrendamento_id = arrendamento["arrendamento"]
+    etapas = dict(arrendamento.get("etapas") or {})
+    intervalo = max(1.0, arrendamento["arrendamento_segundos"] / 3)
+    print(f"Tarefa {arrendamento['tarefa_id']} ({arrendamento['nome_arquivo']}) recebida, modelo {arrendamento['modelo']}")
+
+    with tempfile.TemporaryDirectory(prefix="whisper-no-") as diretorio, \
+            Acompanhamento(coordenador, arrendamento_id, no, intervalo, modelos) as acompanhamento:
+        try:
+            inicio_etapa = time.time()
+            caminho = os.path.join(diretorio, "audio")
+            coordenador.baixar_audio(arrendamento_id, no, caminho)
+            etapas["download_audio"] = round(time.time() - inicio_etapa, 3)
+
+            inicio_etapa = time.time()
+            audio = whisper.load_audio(caminho)
+            acompanhamento.duracao_audio = len(audio) / whisper.audio.SAMPLE_RATE
+            etapas["decodificacao_audio"] = round(time.time() - inicio_etapa, 3)
+
+            if arrendamento.get("vad") is not None:
+                inicio_etapa = time.time()
+                audio, acompanhamento.mapa_fala = voz.recortar_fala(audio, voz.regioes_fala(audio, arrendamento["vad"]))
+                etapas["vad"] = round(time.time() - inicio_etapa, 3)
+
+            if len(audio) == 0:
+                # O VAD não encontrou fala: não há o que decodificar
+                resultado = {"text": "", "segments": [], "language": arrendamento["opcoes"].get("language")}
+                tempo_transcricao = 0.0
+            else:
+                inicio_etapa = time.time()
+                modelo_whisper = modelos.obter(arrendamento["modelo"])
+                etapas["carregamento_modelo"] = round(time.time() - inicio_etapa, 3)
+
+                inicio_transcricao = time.time()
+                with observar_transcricao(ObservadorTranscricao(acompanhamento.avancar)):
+                    resultado = modelo_whisper.transcribe(audio, **arrendamento["opcoes"])
+                tempo_transcricao = time.time() - inicio_transcricao
+                etapas["transcricao"] = round(tempo_transcricao, 3)
+                if acompanhamento.mapa_fala is not None:
+                    resultado = voz.remapear_resultado(resultado, acompanhamento.mapa_fala)
+
+            acompanhamento.parar()
+            if acompanhamento.perdido.is_set():
+                raise ArrendamentoPerdido(arrendamento_id)
+            coordenador.concluir(
+                arrendamento_id, no,
+                resultado=resultado,
+                tempo_transcricao=tempo_transcricao,
+                duracao_audio=acompanhamento.duracao_audio,
+                etapas=etapas
+            )
+            print(f"Tarefa {arrendamento['tarefa_id']} concluída em {tempo_transcricao:.2f} segundos")
+        except ArrendamentoPerdido:
+            print(f"Tarefa {arrendamento['tarefa_id']} abandonada: o arrendamento venceu")
+        except Exception as e:
+            print(f"Erro na tarefa {arrendamento['tarefa_id']}: {str(e)}")
+            print(traceback.format_exc())
+            acompanhamento.parar()
+            try:
+                coordenador.falhar(arrendamento_id, no, str(e), etapas)
+            except (OSError, ArrendamentoPerdido) as erro_envio:
+                print(f"Não foi possível informar o erro ao coordenador: {str(erro_envio)}")
+
+def executar(coordenador, no, dispositivo, modelos, espera):
+    """Pede tarefas ao coordenador e as processa, uma de cada vez, até o processo ser encerrado."""
+    print(f"Nó {no} ({dispositivo}) pedindo tarefas a {coordenador.url}")
+    while True:
+        try:
+            arrendamento = coordenador.arrendar(no, dispositivo, modelos.nomes(), espera)
+        except urllib.error.HTTPError as e:
+            if e.code in (401, 404):
+                # Chave errada ou nós remotos desativados: não adianta tentar de novo
+                raise SystemExit(f"Coordenador recusou o nó ({e.code}): {e.read().decode('utf-8', 'replace')}")
+            print(f"Coordenador respondeu {e.code}; tentando de novo em 5 segundos")
+            time.sleep(5)
+            continue
+        except OSError as e:
+            print(f"Coordenador indisponível ({str(e)}); tentando de novo em 5 segundos")
+            time.sleep(5)
+            continue
+        if arrendamento is not None:
+            processar(coordenador, no, modelos, arrendamento)
+
+def main():
+    parser = argparse.ArgumentParser(description="Nó remoto que arrenda e transcreve tarefas de um servidor coordenador.")
+    parser.add_argument('--coordenador', default=os.environ.get('WHISPER_COORDENADOR', 'http://localhost:5000'),
+                        help="URL do backend coordenador (padrão: WHISPER_COORDENADOR)")
+    parser.add_argument('--chave', default=os.environ.get('WHISPER_NOS_CHAVE', ''),
+                        help="Chave dos nós, a mesma WHISPER_NOS_CHAVE do coordenador")
+    parser.add_argument('--nome', default=f"{socket.gethostname()}-{os.getpid()}", help="Nome do nó em /nos")
+    parser.add_argument('--dispositivo', default="cuda" if torch.cuda.is_available() else "cpu",
+                        help="Dispositivo da inferência: cpu, cuda ou cuda:<n>")
+    parser.add_argument('--modelos-maximo', type=int, default=2, help="Modelos mantidos em memória ao mesmo tempo")
+    parser.add_argument('--precarregar', default='', help="Modelos carregados antes da primeira tarefa, separados por vírgula")
+    parser.add_argument('--espera', type=float, default=20, help="Segundos de espera em cada pedido de tarefa (até 30)")
+    parser.add_argument('--threads', type=int, default=0, help="Threads do PyTorch na CPU (padrão: todos os núcleos)")
+    parser.add_argument('--pesos-dir', default=os.environ.get('WHISPER_PESOS_DIR', pesos.DIRETORIO_PADRAO),
+                        help="Pesos convertidos por download_models.py --converter (padrão: WHISPER_PESOS_DIR)")
+    argumentos = parser.parse_args()
+
+    if not argumentos.chave:
+        parser.error("informe a chave dos nós (--chave ou WHISPER_NOS_CHAVE)")
+    if argumentos.threads > 0:
+        torch.set_num_threads(argumentos.threads)
+
+    modelos = ModelosCarregados(argumentos.dispositivo, argumentos.modelos_maximo, argumentos.pesos_dir)
+    for nome_modelo in filter(None, (item.strip() for item in argumentos.precarregar.split(','))):
+        modelos.obter(nome_modelo)
+    coordenador = Coordenador(argumentos.coordenador, argumentos.chave)
+    try:
+        executar(coordenador, argumentos.nome, argumentos.dispositivo, modelos, argumentos.espera)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()